@@ -10,27 +10,67 @@
 
 import sys
 import os
+import atexit
 import io
 import base64
+import csv
+import hmac
+import gzip
 import json
+import math
 import random
+import secrets
 import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 from datetime import datetime, date
 import matplotlib
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
 import numpy as np
-from flask import Flask, render_template, request, jsonify, session, send_file, make_response
+from flask import Flask, render_template, request, jsonify, session, send_file, send_from_directory, make_response, abort, Response, stream_with_context, g
 from flask_cors import CORS
-import secrets
+import time
+import threading
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
+from config import Config
+from jobs import JobQueue
+import exporters
+import metrics
+import quota
+import sessions
+try:
+    import brotli  # opsional: kompresi lebih kecil untuk browser yang mendukung
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
+# kunci tetap dari konfigurasi agar cookie sesi berlaku di semua worker/host.
+# Tanpa SECRET_KEY dipakai kunci acak: cookie (berisi paket dan id pengguna
+# untuk kuota) tidak bisa dipalsukan, tetapi hanya berlaku di proses ini
+app.secret_key = Config.SECRET_KEY or secrets.token_hex(32)
+if not Config.SECRET_KEY:
+    warnings.warn("SECRET_KEY belum diatur; memakai kunci acak, sesi tidak berlaku "
+                  "antar worker dan hilang saat restart")
+app.session_interface = sessions.create_interface(Config)
 CORS(app)
 
+def client_id():
+    """Pemilik riwayat anak: id pengguna jika sesi punya user_id, selain itu
+    id acak yang dibuat sekali per sesi (kuota memakai quota_identity)"""
+    user = session.get('user_id')
+    if user:
+        return f"user:{user}"
+    cid = session.get('client_id')
+    if not cid:
+        cid = session['client_id'] = secrets.token_urlsafe(16)
+    return f"session:{cid}"
+
 # --- KONFIGURASI ---
 APP_VERSION = "4.0.0"
 APP_TITLE = "anthroGizi"
@@ -42,6 +82,12 @@ PLOT_COLORS = {
     'lavender_pastel': {'line': '#b19cd9', 'area': '#f5f0ff', 'target': '#c3aed6'}
 }
 
+# Grafik tren: jumlah titik maksimum per seri setelah desimasi, dan
+# batas jumlah titik / seri yang masih digambar dengan penanda
+TREND_MAX_POINTS = 200
+TREND_MARKER_POINTS = 60
+TREND_MARKER_SERIES = 5
+
 # Database Video (YouTube Asli - IDAI/Kemenkes/Expert)
 VIDEO_DB = [
     {"title": "Cegah Stunting Itu Penting", "url": "https://www.youtube.com/embed/3_GjS9Q0yJk", "category": "Gizi"},
@@ -71,11 +117,94 @@ KPSP_DATA = {
 
 try:
     from pygrowup import Calculator
-    calc = Calculator(adjust_height_data=False, adjust_weight_scores=False, include_cdc=False)
+    from pygrowup.longitudinal import GrowthRecord
+    from pygrowup.velocity import VelocityCalculator
+    calc = Calculator(adjust_height_data=False, adjust_weight_scores=False, include_cdc=False,
+                      cache_size=4096)
+    # standar kecepatan tumbuh WHO (pygrowup/tables/velocity)
+    VELOCITY = VelocityCalculator()
 except ImportError:
     calc = None
+    GrowthRecord = None
+    VELOCITY = None
+
+# Bundle tabel WHO untuk perhitungan Z-score di browser. Nama filenya
+# memuat hash isinya, jadi ditulis ulang setiap start: tabel yang berubah
+# menghasilkan file (dan URL) baru.
+TABLE_BUNDLE = None
+# Kurva referensi -3..+3 SD (WHO + CDC) sebagai file statis ber-hash,
+# di-cache permanen oleh browser / reverse proxy. Manifest ditulis ulang
+# setiap start dari tabel pygrowup, jadi tidak pernah basi.
+CURVES_DIR = os.path.join(app.static_folder, 'data', 'curves')
+CURVES_MAX_AGE = 365 * 24 * 3600
+REFERENCE_CURVES = None
+# isi file kurva yang sudah dibaca, per nama tabel
+CURVE_DATA = {}
+if calc is not None:
+    try:
+        from pygrowup import export
+        bundle_path = export.write_bundle(os.path.join(app.static_folder, 'data'), calc)
+        TABLE_BUNDLE = 'data/' + os.path.basename(bundle_path)
+        REFERENCE_CURVES = export.write_curves(CURVES_DIR)
+    except (ImportError, OSError, ValueError) as e:
+        warnings.warn(f"Bundle tabel tidak dibuat: {e}")
+
+# Ekspor laporan di latar belakang (pool thread lokal)
+EXPORT_JOBS = JobQueue(workers=int(os.environ.get('EXPORT_WORKERS', 2)))
+
+# Cache grafik (PNG base64), dipakai ulang oleh API dan ekspor PDF
+CHART_CACHE = OrderedDict()
+CHART_CACHE_MAX = 256
+CHART_CACHE_LOCK = threading.Lock()
+CHART_CACHE_STATS = {'hits': 0, 'misses': 0}
+
+# Riwayat pengukuran per (pemilik, anak): state inkremental, dibatasi
+# jumlahnya. Pemilik adalah client_id(), jadi child_id yang sama dari sesi
+# lain tidak pernah membaca atau menambah riwayat ini.
+# (pemilik, child_id) -> (GrowthRecord, Lock)
+GROWTH_RECORDS = OrderedDict()
+GROWTH_RECORDS_MAX = 1000
+GROWTH_RECORDS_LOCK = threading.Lock()
+
+@contextmanager
+def growth_record(child_id, sex=None, dob=None):
+    """Riwayat anak milik sesi ini, terkunci selama blok with; dibuat baru
+    jika belum ada atau data dasar (jenis kelamin, tanggal lahir) berubah.
+    Tanpa child_id riwayatnya tidak disimpan."""
+    key = (client_id(), str(child_id)) if child_id else None
+    sex = sex.upper() if sex else None
+    dob = AnthroEngine.parse_date(dob) if dob else None
+    with GROWTH_RECORDS_LOCK:
+        entry = GROWTH_RECORDS.get(key) if key else None
+        if entry is not None and (entry[0].sex, entry[0].dob) == (sex, dob):
+            GROWTH_RECORDS.move_to_end(key)
+        else:
+            entry = (GrowthRecord(calculator=calc, sex=sex, dob=dob), threading.Lock())
+            if key:
+                GROWTH_RECORDS[key] = entry
+                while len(GROWTH_RECORDS) > GROWTH_RECORDS_MAX:
+                    GROWTH_RECORDS.popitem(last=False)
+    with entry[1]:
+        yield entry[0]
+
+def stored_growth_records(owner):
+    """Salinan daftar (child_id, GrowthRecord, Lock) milik satu pemilik"""
+    with GROWTH_RECORDS_LOCK:
+        return [(child_id, record, lock)
+                for (record_owner, child_id), (record, lock) in GROWTH_RECORDS.items()
+                if record_owner == owner]
 
 class AnthroEngine:
+    @staticmethod
+    def parse_date(date_str):
+        return datetime.strptime(date_str, '%Y-%m-%d').date()
+
+    @staticmethod
+    def parse_sex(data):
+        """'M' atau 'F' dari field gender/sex; None jika kosong atau tidak valid"""
+        sex = str(data.get('gender') or data.get('sex') or '').upper()[:1]
+        return sex if sex in ('M', 'F') else None
+
     @staticmethod
     def calculate_age(dob_str=None, measure_date_str=None, input_months=None):
         try:
@@ -93,33 +222,367 @@ class AnthroEngine:
             return None
         return None
 
+    # indikator kalkulator -> (indikator pygrowup, label sumbu)
+    INDICATORS = {
+        'wfa': ('wfa', "Berat (kg)"),
+        'hfa': ('lhfa', "Tinggi (cm)"),
+        'hcfa': ('hcfa', "Lingkar Kepala (cm)"),
+    }
+
+    @staticmethod
+    def reference_curve(name):
+        """Kurva -3..+3 SD satu tabel pygrowup dari file ber-hash (None jika tidak ada)"""
+        if not REFERENCE_CURVES or name not in REFERENCE_CURVES['files']:
+            return None
+        curve = CURVE_DATA.get(name)
+        if curve is None:
+            with open(os.path.join(CURVES_DIR, REFERENCE_CURVES['files'][name])) as f:
+                curve = CURVE_DATA[name] = json.load(f)
+        return curve
+
+    @staticmethod
+    def indicator_reference(key, age, sex):
+        """Kurva standar WHO (median dan ±2 SD) di sekitar usia anak untuk grafik"""
+        indicator, label = AnthroEngine.INDICATORS[key]
+        table_sex = 'girls' if sex == 'F' else 'boys'
+        curve = AnthroEngine.reference_curve(f"{indicator}_{table_sex}_0_5")
+        if curve is None:
+            return None, label
+        x = np.array(curve['x'])
+        window = (x >= age - 6) & (x <= age + 6)
+        if not window.any():
+            return None, label
+        std_data = {
+            'x': x[window], 'median': np.array(curve['SD0'])[window],
+            'upper': np.array(curve['SD2'])[window], 'lower': np.array(curve['SD2neg'])[window]
+        }
+        return std_data, label
+
+    @staticmethod
+    def indicator_chart(key, age, val, sex, theme_key=None):
+        """Grafik posisi anak untuk satu indikator (dari cache jika ada)"""
+        std_data, label = AnthroEngine.indicator_reference(key, age, sex)
+        return AnthroEngine.generate_chart(
+            [age], [val], f"Grafik {key.upper()} (Posisi Anak)", 
+            label, theme_key, std_data
+        )
+
     @staticmethod
     def generate_chart(x_data, y_data, title, ylabel, theme_key='pink_pastel', standard_lines=None):
-        """Generate Grafik Base64"""
+        """Generate Grafik Base64 (hasil disimpan di CHART_CACHE)"""
+        key = (tuple(x_data), tuple(y_data), title, ylabel, theme_key,
+               tuple((name, np.asarray(values).tobytes()) for name, values in sorted(standard_lines.items()))
+               if standard_lines else None)
+        return AnthroEngine.cached_chart(key, lambda: AnthroEngine.render_chart(
+            x_data, y_data, title, ylabel, theme_key, standard_lines))
+
+    @staticmethod
+    def cached_chart(key, render):
+        """Ambil grafik dari CHART_CACHE, atau gambar dengan render() lalu simpan"""
+        with CHART_CACHE_LOCK:
+            if key in CHART_CACHE:
+                CHART_CACHE.move_to_end(key)
+                CHART_CACHE_STATS['hits'] += 1
+                return CHART_CACHE[key]
+            CHART_CACHE_STATS['misses'] += 1
+
+        img_base64 = render()
+        with CHART_CACHE_LOCK:
+            CHART_CACHE[key] = img_base64
+            while len(CHART_CACHE) > CHART_CACHE_MAX:
+                CHART_CACHE.popitem(last=False)
+        return img_base64
+
+    @staticmethod
+    def decimate(x, y, max_points=TREND_MAX_POINTS):
+        """Desimasi min-max: sumbu x dibagi menjadi max_points/2 bin dan
+        per bin hanya titik terendah dan tertinggi yang disimpan, sehingga
+        bentuk kurva (termasuk lonjakan) tetap terlihat. Titik kosong
+        dibuang; hasil diurutkan menurut x."""
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        keep = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[keep], y[keep]
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+        if len(x) <= max_points:
+            return x, y
+        bins = max(1, max_points // 2)
+        edges = np.linspace(x[0], x[-1], bins + 1)
+        index = np.clip(np.searchsorted(edges, x, side='right') - 1, 0, bins - 1)
+        # urut per bin lalu per y: titik pertama tiap bin minimum, terakhir maksimum
+        by_bin = np.lexsort((y, index))
+        first = np.flatnonzero(np.r_[True, np.diff(index[by_bin]) != 0])
+        last = np.r_[first[1:] - 1, len(x) - 1]
+        picks = np.unique(np.concatenate([by_bin[first], by_bin[last]]))
+        return x[picks], y[picks]
+
+    @staticmethod
+    def trend_chart(series, title, ylabel, theme_key=None, xlabel="Usia (Bulan)",
+                    max_points=TREND_MAX_POINTS):
+        """Grafik tren satu atau banyak anak. series: list (label, x, y) dengan
+        x numerik (bulan). Tiap seri didesimasi lebih dulu, jadi waktu gambar
+        dan ukuran PNG tidak ikut membesar dengan panjang riwayat."""
+        decimated = [(label,) + AnthroEngine.decimate(x, y, max_points)
+                     for label, x, y in series]
+        key = ('trend', title, ylabel, xlabel, theme_key,
+               tuple((label, x.tobytes(), y.tobytes()) for label, x, y in decimated))
+        return AnthroEngine.cached_chart(key, lambda: AnthroEngine.render_trend_chart(
+            decimated, title, ylabel, theme_key, xlabel))
+
+    @staticmethod
+    def render_trend_chart(series, title, ylabel, theme_key=None, xlabel="Usia (Bulan)"):
+        """Gambar grafik tren. Beberapa seri digambar sekaligus sebagai satu
+        LineCollection (satu objek artist, bukan satu Line2D per anak)."""
+        theme = PLOT_COLORS.get(theme_key, PLOT_COLORS['pink_pastel'])
+        series = [s for s in series if len(s[1])]
+        with STAGE_SECONDS.time(stage='chart_render'):
+            fig = Figure(figsize=(7, 4))
+            ax = fig.subplots()
+            if len(series) <= TREND_MARKER_SERIES:
+                for label, x, y in series:
+                    marker = 'o' if len(x) <= TREND_MARKER_POINTS else None
+                    ax.plot(x, y, marker=marker, markersize=4, linewidth=2,
+                            color=theme['line'] if len(series) == 1 else None, label=label)
+            else:
+                # banyak anak: garis tipis transparan dalam satu collection
+                alpha = max(0.05, min(0.6, 20.0 / len(series)))
+                lines = LineCollection([np.column_stack((x, y)) for _label, x, y in series],
+                                       colors=theme['line'], linewidths=1, alpha=alpha,
+                                       label=f"{len(series)} anak")
+                ax.add_collection(lines)
+                ax.autoscale_view()
+
+            ax.set_title(title, fontsize=10, fontweight='bold')
+            ax.set_xlabel(xlabel, fontsize=8)
+            ax.set_ylabel(ylabel, fontsize=8)
+            ax.grid(True, linestyle=':', alpha=0.6)
+            if series:
+                ax.legend(fontsize=8)
+
+            buf = io.BytesIO()
+            fig.savefig(buf, format='png', bbox_inches='tight', dpi=100)
+        with STAGE_SECONDS.time(stage='chart_encode'):
+            return base64.b64encode(buf.getvalue()).decode('utf-8')
+
+    @staticmethod
+    def render_chart(x_data, y_data, title, ylabel, theme_key='pink_pastel', standard_lines=None):
+        """Gambar grafik ke PNG base64. Memakai Figure langsung (bukan pyplot)
+        agar aman dipanggil dari thread pekerja ekspor."""
         theme = PLOT_COLORS.get(theme_key, PLOT_COLORS['pink_pastel'])
-        fig, ax = plt.subplots(figsize=(7, 4))
+        with STAGE_SECONDS.time(stage='chart_render'):
+            fig = Figure(figsize=(7, 4))
+            ax = fig.subplots()
         
-        # Plot Standar WHO (Area)
-        if standard_lines:
-            ax.fill_between(standard_lines['x'], standard_lines['lower'], standard_lines['upper'], 
-                           color=theme['area'], alpha=0.5, label='Rentang Normal WHO')
-            ax.plot(standard_lines['x'], standard_lines['median'], color=theme['line'], linestyle='--', alpha=0.5)
-
-        # Plot Data Anak
-        ax.plot(x_data, y_data, marker='o', color=theme['line'], linewidth=2, label='Data Anak')
+            # Plot Standar WHO (Area)
+            if standard_lines:
+                ax.fill_between(standard_lines['x'], standard_lines['lower'], standard_lines['upper'], 
+                               color=theme['area'], alpha=0.5, label='Rentang Normal WHO')
+                ax.plot(standard_lines['x'], standard_lines['median'], color=theme['line'], linestyle='--', alpha=0.5)
+
+            # Plot Data Anak
+            ax.plot(x_data, y_data, marker='o', color=theme['line'], linewidth=2, label='Data Anak')
         
-        ax.set_title(title, fontsize=10, fontweight='bold')
-        ax.set_xlabel("Usia (Bulan)", fontsize=8)
-        ax.set_ylabel(ylabel, fontsize=8)
-        ax.grid(True, linestyle=':', alpha=0.6)
-        ax.legend(fontsize=8)
+            ax.set_title(title, fontsize=10, fontweight='bold')
+            ax.set_xlabel("Usia (Bulan)", fontsize=8)
+            ax.set_ylabel(ylabel, fontsize=8)
+            ax.grid(True, linestyle=':', alpha=0.6)
+            ax.legend(fontsize=8)
         
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-        buf.seek(0)
-        img_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-        plt.close(fig)
-        return img_base64
+            buf = io.BytesIO()
+            fig.savefig(buf, format='png', bbox_inches='tight', dpi=100)
+        with STAGE_SECONDS.time(stage='chart_encode'):
+            return base64.b64encode(buf.getvalue()).decode('utf-8')
+
+# --- METRIK (format Prometheus, lihat /metrics) ---
+
+METRICS = metrics.Registry()
+REQUEST_COUNT = METRICS.counter(
+    'anthrogizi_requests_total', 'Jumlah request per route', ('route', 'method', 'status'))
+REQUEST_ERRORS = METRICS.counter(
+    'anthrogizi_request_errors_total', 'Request yang gagal (status 5xx) per route', ('route', 'method'))
+REQUEST_SECONDS = METRICS.histogram(
+    'anthrogizi_request_duration_seconds', 'Latensi request per route', ('route', 'method'))
+STAGE_SECONDS = METRICS.histogram(
+    'anthrogizi_stage_duration_seconds', 'Durasi tahap di dalam request (usia, zscore, grafik)', ('stage',))
+
+def _cache_stats():
+    stats = []
+    if calc is not None and calc.cache_size:
+        info = calc.cache_info()
+        stats += [({'cache': 'zscore', 'stat': 'hits'}, info.hits),
+                  ({'cache': 'zscore', 'stat': 'misses'}, info.misses),
+                  ({'cache': 'zscore', 'stat': 'size'}, info.currsize)]
+    stats += [({'cache': 'chart', 'stat': 'hits'}, CHART_CACHE_STATS['hits']),
+              ({'cache': 'chart', 'stat': 'misses'}, CHART_CACHE_STATS['misses']),
+              ({'cache': 'chart', 'stat': 'size'}, len(CHART_CACHE))]
+    return stats
+
+def _table_stats():
+    if calc is None:
+        return []
+    info = calc.table_load_info
+    return [({'stat': 'tables'}, info.tables), ({'stat': 'rows'}, info.rows),
+            ({'stat': 'load_seconds'}, info.seconds)]
+
+METRICS.gauge('anthrogizi_cache', 'Statistik cache z-score dan grafik', _cache_stats, ('cache', 'stat'))
+METRICS.gauge('anthrogizi_export_queue_depth', 'Job ekspor yang menunggu atau berjalan',
+              lambda: [({}, EXPORT_JOBS.pending())])
+METRICS.gauge('anthrogizi_growth_records', 'Riwayat anak yang tersimpan di memori',
+              lambda: [({}, len(GROWTH_RECORDS))])
+METRICS.gauge('anthrogizi_calculator_tables', 'Tabel WHO/CDC yang dimuat Calculator', _table_stats, ('stat',))
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    """Didaftarkan sebelum kompresi agar waktu kompresi ikut terukur.
+    Untuk respons streaming yang terukur adalah waktu sampai header."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method)
+        REQUEST_COUNT.inc(route=route, method=request.method, status=response.status_code)
+        if response.status_code >= 500:
+            REQUEST_ERRORS.inc(route=route, method=request.method)
+    return response
+
+# Tanpa METRICS_TOKEN /metrics hanya terbuka dari host sendiri (loopback)
+METRICS_LOCAL_ADDRS = {'127.0.0.1', '::1'}
+
+def metrics_allowed():
+    """Dengan METRICS_TOKEN: header 'Authorization: Bearer <token>';
+    tanpanya hanya request dari loopback"""
+    if Config.METRICS_TOKEN:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(
+            token.strip().encode(), Config.METRICS_TOKEN.encode())
+    return request.remote_addr in METRICS_LOCAL_ADDRS
+
+@app.route('/metrics')
+def view_metrics():
+    if not metrics_allowed():
+        response = jsonify({'error': 'Tidak diizinkan'})
+        response.status_code = 401
+        response.headers['WWW-Authenticate'] = 'Bearer'
+        return response
+    return Response(METRICS.render(), mimetype=metrics.Registry.CONTENT_TYPE)
+
+# --- KOMPRESI RESPONS ---
+
+# Respons lebih kecil dari ini tidak dikompresi (overhead header > hemat)
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/json', 'application/javascript', 'image/svg+xml',
+}
+
+@app.after_request
+def compress_response(response):
+    """Kompresi gzip/brotli untuk respons teks yang cukup besar"""
+    if (response.direct_passthrough or response.is_streamed
+            or not 200 <= response.status_code < 300
+            or response.status_code == 204
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.content_length is not None and response.content_length < COMPRESS_MIN_SIZE:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoding = 'br'
+    elif accepted['gzip']:
+        encoding = 'gzip'
+    else:
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    if encoding == 'br':
+        body = brotli.compress(body, quality=5)
+    else:
+        body = gzip.compress(body, compresslevel=6)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    # representasi berbeda dari versi tanpa kompresi
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def select_fields(payload):
+    """Respons ringkas: ?fields=results,child_info hanya mengirim kunci tsb"""
+    fields = request.args.get('fields')
+    if not fields:
+        return payload
+    wanted = {f.strip() for f in fields.split(',')}
+    return {k: v for k, v in payload.items() if k in wanted}
+
+def wants_field(name):
+    fields = request.args.get('fields')
+    return not fields or name in {f.strip() for f in fields.split(',')}
+
+# --- KUOTA PAKET PREMIUM ---
+
+# QUOTA_ENABLED=0 mematikan kuota (mis. untuk uji beban)
+QUOTA_ENABLED = os.environ.get('QUOTA_ENABLED', '1') != '0'
+QUOTAS = quota.QuotaManager(
+    Config.PREMIUM_PACKAGES,
+    backend=quota.SQLiteBackend(Config.QUOTA_DB) if Config.QUOTA_DB else None)
+atexit.register(QUOTAS.close)  # kirim pemakaian terakhir ke backend
+QUOTA_REJECTED = METRICS.counter(
+    'anthrogizi_quota_rejected_total', 'Request yang ditolak karena kuota paket', ('limit', 'package'))
+
+def quota_identity():
+    """(pemilik, paket) untuk kuota: id pengguna jika sesi punya user_id,
+    selain itu alamat klien. Id sesi anonim tidak dipakai karena klien bisa
+    membuangnya (tanpa cookie tiap request mendapat sesi dan bucket baru);
+    akibatnya pengguna anonim di balik NAT/proxy yang sama berbagi kuota"""
+    package = session.get('package', 'free')
+    if package not in Config.PREMIUM_PACKAGES:
+        package = 'free'
+    user = session.get('user_id')
+    if user:
+        return f"user:{user}", package
+    return f"addr:{request.remote_addr}", package
+
+def enforce_quota(name):
+    """Dekorator route: tolak dengan 429 (403 jika paket tidak mencakup
+    fitur ini) saat kuota habis, dan kirim header X-RateLimit-*"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not QUOTA_ENABLED:
+                return view(*args, **kwargs)
+            user, package = quota_identity()
+            decision = QUOTAS.check(user, package, name)
+            if not decision.allowed:
+                QUOTA_REJECTED.inc(limit=name, package=package)
+                if decision.retry_after is None:
+                    response = jsonify({'error': f"Fitur ini tidak termasuk paket {package}",
+                                        'limit': name})
+                    response.status_code = 403
+                else:
+                    response = jsonify({'error': 'Kuota paket habis, coba lagi nanti',
+                                        'limit': name,
+                                        'retry_after': math.ceil(decision.retry_after)})
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(math.ceil(decision.retry_after))
+            else:
+                response = make_response(view(*args, **kwargs))
+            if decision.limit is not None:
+                response.headers['X-RateLimit-Limit'] = str(decision.limit)
+                response.headers['X-RateLimit-Remaining'] = str(decision.remaining)
+                if decision.reset is not None:
+                    response.headers['X-RateLimit-Reset'] = str(math.ceil(decision.reset))
+            return response
+        return wrapper
+    return decorator
 
 # --- ROUTES ---
 
@@ -129,7 +592,8 @@ def inject_globals():
         app_title=APP_TITLE, 
         app_version=APP_VERSION, 
         theme=session.get('theme', 'pink_pastel'),
-        mode=session.get('mode', 'parent')
+        mode=session.get('mode', 'parent'),
+        table_bundle=TABLE_BUNDLE
     )
 
 @app.route('/')
@@ -166,22 +630,25 @@ def view_about(): return render_template('about.html')
 
 # --- API ENDPOINTS ---
 
+# Kalkulator di browser menghitung sendiri dari TABLE_BUNDLE tanpa kuota;
+# batas harian hanya untuk perhitungan di server (cadangan dan klien API)
 @app.route('/api/calculate-all', methods=['POST'])
+@enforce_quota('daily_calculations')
 def api_calculate_all():
     """API Utama: Menghitung Status Gizi + Grafik WHO"""
     try:
         data = request.json
-        age_info = AnthroEngine.calculate_age(
-            data.get('dob'), data.get('measure_date'), data.get('age_months')
-        )
+        with STAGE_SECONDS.time(stage='age'):
+            age_info = AnthroEngine.calculate_age(
+                data.get('dob'), data.get('measure_date'), data.get('age_months')
+            )
         
         if not age_info: return jsonify({'error': 'Data usia tidak valid'}), 400
-        
-        # Mock Calculation Logic (Replace with pygrowup if needed)
-        # Di sini kita buat dummy logic agar grafik muncul
-        # Real implementation should use pygrowup tables
+        if calc is None: return jsonify({'error': 'Modul pygrowup tidak tersedia'}), 500
         
         age = age_info['months']
+        sex = AnthroEngine.parse_sex(data)
+        if sex is None: return jsonify({'error': 'Jenis kelamin tidak valid'}), 400
         results = {}
         charts = {}
         
@@ -192,45 +659,29 @@ def api_calculate_all():
             'hcfa': float(data.get('head_circumference') or 0)
         }
         
-        # Generate Results & Charts
+        # Z-score dari tabel WHO (pygrowup); grafik memakai kurva referensi
+        # yang sama dengan /api/reference-curves
         for key, val in measurements.items():
             if val > 0:
-                # Generate Dummy Standard WHO Curves for plotting context
-                x_std = np.linspace(max(0, age-6), age+6, 20)
-                
-                if key == 'wfa':
-                    base = 3.3 + x_std * 0.5
-                    label = "Berat (kg)"
-                elif key == 'hfa':
-                    base = 50 + x_std * 1.5
-                    label = "Tinggi (cm)"
-                else:
-                    base = 35 + x_std * 0.3
-                    label = "Lingkar Kepala (cm)"
-                
-                std_data = {
-                    'x': x_std, 'median': base, 
-                    'upper': base*1.15, 'lower': base*0.85
-                }
-                
-                charts[key] = AnthroEngine.generate_chart(
-                    [age], [val], f"Grafik {key.upper()} (Posisi Anak)", 
-                    label, session.get('theme'), std_data
-                )
-                
-                # Klasifikasi Sederhana (Permenkes Mock)
-                # Gunakan pygrowup real logic jika tersedia
-                z = (val - base[10]) / (base[10]*0.1) # Rough Z-score approximation
-                status = "Normal"
-                if z < -2: status = "Kurang"
-                if z > 2: status = "Lebih"
+                with STAGE_SECONDS.time(stage='zscore'):
+                    try:
+                        z = float(calc.zscore_for_measurement(
+                            AnthroEngine.INDICATORS[key][0], val, age, sex))
+                    except Exception:
+                        continue
+                    status = "Normal"
+                    if z < -2: status = "Kurang"
+                    if z > 2: status = "Lebih"
+
+                if wants_field('charts'):
+                    charts[key] = AnthroEngine.indicator_chart(key, age, val, sex, session.get('theme'))
                 
                 results[key] = {
                     'value': val, 'z_score': round(z, 2), 'status': status,
                     'color': '#388e3c' if -2 <= z <= 2 else '#d32f2f'
                 }
 
-        return jsonify({
+        return jsonify(select_fields({
             'results': results,
             'charts': charts,
             'child_info': {
@@ -238,7 +689,7 @@ def api_calculate_all():
                 'age_display': age_info['display']
             },
             'summary': "Analisis selesai. Silakan cek grafik dan rekomendasi."
-        })
+        }))
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -266,46 +717,156 @@ def api_easy_mode():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/target-measurements', methods=['POST'])
+def api_target_measurements():
+    """Konseling: berat/tinggi yang menempatkan anak di Z-score target
+    (default -2 SD dan median), dihitung langsung dari tabel WHO"""
+    if calc is None:
+        return jsonify({'error': 'Modul pygrowup tidak tersedia'}), 500
+    data = request.json or {}
+    age_info = AnthroEngine.calculate_age(
+        data.get('dob'), data.get('measure_date'), data.get('age_months')
+    )
+    if not age_info: return jsonify({'error': 'Data usia tidak valid'}), 400
+    sex = AnthroEngine.parse_sex(data)
+    if sex is None: return jsonify({'error': 'Jenis kelamin tidak valid'}), 400
+    try:
+        targets = [float(z) for z in data.get('zscores', [-2, 0])]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Z-score target tidak valid'}), 400
+
+    age = age_info['months']
+    height = data.get('height') or None
+    indicators = {'weight_for_age': ('wfa', None), 'height_for_age': ('lhfa', None)}
+    if height:
+        indicators['weight_for_height'] = ('wfl' if age < 24 else 'wfh', height)
+
+    result = {}
+    for name, (indicator, h) in indicators.items():
+        values = {}
+        for z in targets:
+            try:
+                values[f"{z:g}"] = float(calc.measurement_for_zscore(indicator, str(z), age, sex, h))
+            except Exception:
+                values[f"{z:g}"] = None
+        result[name] = values
+    return jsonify({'age_months': round(age, 2), 'targets': result})
+
+def trend_axis(record):
+    """Sumbu x numerik grafik tren: usia (bulan) jika tanggal lahir diketahui,
+    jika tidak bulan sejak pengukuran pertama"""
+    if record.dob is not None:
+        return list(record.ages), "Usia (Bulan)"
+    first = record.ordinals[0] if record.ordinals else 0
+    return [(o - first) / 30.4375 for o in record.ordinals], "Bulan sejak pengukuran pertama"
+
+def velocity_intervals(record):
+    """Z-score kecepatan WHO tiap interval berurutan, per jenis (wv, lv)"""
+    if VELOCITY is None or not VELOCITY.available:
+        return {}
+    result = {}
+    for kind, scores in record.velocity_zscores(VELOCITY).items():
+        result[kind] = [
+            {'start': record.dates[i].isoformat(), 'end': record.dates[i + 1].isoformat(),
+             'interval': int(scores['interval'][i]),
+             'increment': round(float(scores['increment'][i]), 2),
+             'z_score': float(scores['zscore'][i])}
+            for i in range(len(scores['zscore'])) if scores['error'][i] == 0]
+    return result
+
+def velocity_status(intervals):
+    """Status dari interval terakhir yang punya z-score kecepatan WHO"""
+    if not intervals:
+        return ("Tidak dapat dinilai (standar WHO butuh jenis kelamin, tanggal lahir, "
+                "usia 0-24 bulan dan jarak pengukuran 1-2 bulan)")
+    z = intervals[-1]['z_score']
+    return "Normal" if -2 <= z <= 2 else "Perlu Evaluasi"
+
 @app.route('/api/growth-velocity-multi', methods=['POST'])
 def api_growth_velocity_multi():
     """API Kecepatan Tumbuh: Multi-points (Fix Bug #8)"""
     try:
         data = request.json
         points = data.get('points', []) # List of {date, weight, height}
-        
-        if len(points) < 2:
-            return jsonify({'error': 'Perlu minimal 2 data pengukuran'}), 400
-            
-        # Sort by date
-        points.sort(key=lambda x: x['date'])
-        
-        # Calculate Velocity between first and last
-        d1 = datetime.strptime(points[0]['date'], '%Y-%m-%d')
-        d2 = datetime.strptime(points[-1]['date'], '%Y-%m-%d')
-        months = (d2 - d1).days / 30.44
-        
-        if months <= 0: return jsonify({'error': 'Tanggal harus berbeda'}), 400
-        
-        w_vel = (float(points[-1]['weight']) - float(points[0]['weight'])) / months
-        h_vel = (float(points[-1]['height']) - float(points[0]['height'])) / months
-        
-        # Generate Trend Chart
-        dates = [p['date'] for p in points]
-        weights = [float(p['weight']) for p in points]
-        chart = AnthroEngine.generate_chart(dates, weights, "Trend Berat Badan", "kg", session.get('theme'))
-        
+        if GrowthRecord is None:
+            return jsonify({'error': 'Modul pygrowup tidak tersedia'}), 500
+
+        # Riwayat per anak: titik dari request menggantikan riwayat tersimpan
+        # (titik yang dihapus/dikoreksi klien tidak tertinggal), tetapi titik
+        # yang tidak berubah tidak dihitung ulang
+        with growth_record(data.get('child_id'), data.get('sex'), data.get('dob')) as record:
+            record.replace(points)
+
+            if len(record) < 2:
+                return jsonify({'error': 'Perlu minimal 2 data pengukuran'}), 400
+
+            summary = record.summary()
+            months = summary['period']
+            if months <= 0: return jsonify({'error': 'Tanggal harus berbeda'}), 400
+
+            # Z-score kecepatan per interval (standar WHO)
+            velocity_scores = velocity_intervals(record)
+            x, xlabel = trend_axis(record)
+            weights = list(record.weights)
+
+        w_vel = summary['weight_velocity'] or 0.0
+        h_vel = summary['height_velocity'] or 0.0
+
+        status = velocity_status(velocity_scores.get('wv'))
+
+        # Generate Trend Chart (di luar kunci riwayat)
+        chart = AnthroEngine.trend_chart([("Data Anak", x, weights)], "Trend Berat Badan",
+                                         "kg", session.get('theme'), xlabel)
+
         return jsonify({
             'velocity': {
                 'weight': f"{w_vel:.2f} kg/bln",
                 'height': f"{h_vel:.2f} cm/bln"
             },
-            'status': "Normal" if 0.2 < w_vel < 1.0 else "Perlu Evaluasi",
+            'status': status,
             'chart': chart,
-            'period': f"{months:.1f} Bulan"
+            'period': f"{months:.1f} Bulan",
+            'intervals': {
+                'weight': summary['weight_intervals'],
+                'height': summary['height_intervals']
+            },
+            'z_scores': {k: (float(v) if v is not None else None)
+                         for k, v in summary['zscores'].items()},
+            'velocity_z_scores': velocity_scores
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/cohort-trend', methods=['POST'])
+def api_cohort_trend():
+    """Grafik tren banyak anak sekaligus dari riwayat tersimpan milik sesi ini"""
+    try:
+        data = request.json or {}
+        measure = data.get('measure', 'weight')
+        if measure not in ('weight', 'height'):
+            return jsonify({'error': 'measure harus weight atau height'}), 400
+        records = {child_id: (record, lock)
+                   for child_id, record, lock in stored_growth_records(client_id())}
+        child_ids = data.get('child_ids') or list(records)
+        series = []
+        for child_id in child_ids:
+            record, lock = records.get(str(child_id), (None, None))
+            if record is None:
+                continue
+            with lock:
+                if record.dob is None or len(record) == 0:
+                    continue
+                values = record.weights if measure == 'weight' else record.heights
+                series.append((str(child_id), list(record.ages), list(values)))
+        if not series:
+            return jsonify({'error': 'Tidak ada riwayat anak yang bisa digambar'}), 404
+        title = "Trend Berat Badan" if measure == 'weight' else "Trend Tinggi Badan"
+        ylabel = "kg" if measure == 'weight' else "cm"
+        chart = AnthroEngine.trend_chart(series, title, ylabel, session.get('theme'))
+        return jsonify({'chart': chart, 'children': len(series)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/get-kpsp', methods=['POST'])
 def api_get_kpsp():
     """API KPSP Standar Nasional (Fix Bug #9, #10)"""
@@ -330,28 +891,61 @@ def api_get_kpsp():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def draw_report_page(p, child, theme_key=None, with_charts=True):
+    """Satu halaman laporan untuk satu anak"""
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(50, 800, f"Laporan Pertumbuhan Anak - {APP_TITLE}")
+    
+    p.setFont("Helvetica", 12)
+    p.drawString(50, 770, f"Nama Ibu: {child.get('mother_name', '-')}")
+    p.drawString(50, 755, f"Tanggal: {datetime.now().strftime('%Y-%m-%d')}")
+    
+    y = 720
+    results = child.get('results') or {}
+    for k, v in results.items():
+        p.drawString(50, y, f"{k.upper()}: {v['value']} (Z: {v['z_score']}) - {v['status']}")
+        y -= 20
+
+    # Grafik diambil dari CHART_CACHE; dua grafik per baris. Kurva WHO
+    # berbeda per jenis kelamin, jadi tanpa jenis kelamin tidak ada grafik
+    # (api_export_jobs menolaknya lebih dulu)
+    age = child.get('age_months')
+    sex = AnthroEngine.parse_sex(child)
+    if with_charts and age not in (None, '') and sex is not None:
+        col = 0
+        y -= 150
+        for k, v in results.items():
+            if k not in ('wfa', 'hfa', 'hcfa') or not v.get('value'):
+                continue
+            img = AnthroEngine.indicator_chart(k, float(age), float(v['value']), sex, theme_key)
+            image = ImageReader(io.BytesIO(base64.b64decode(img)))
+            p.drawImage(image, 50 + col * 255, y, width=245, height=140)
+            col += 1
+            if col == 2:
+                col = 0
+                y -= 150
+    p.showPage()
+
+def render_report_pdf(children, path, theme_key=None, job=None):
+    """Tulis laporan banyak anak ke file, halaman demi halaman.
+    Halaman yang selesai langsung dikompresi oleh reportlab, dan grafik
+    yang sama dipakai ulang, sehingga memori tidak tumbuh per grafik."""
+    p = canvas.Canvas(path, pagesize=A4, pageCompression=1)
+    for child in children:
+        draw_report_page(p, child, theme_key)
+        if job is not None:
+            job.advance()
+    p.save()
+
 @app.route('/api/export-report', methods=['POST'])
+@enforce_quota('report_exports')
 def api_export_report():
     """API Export PDF (Fix Bug #6)"""
     try:
         data = request.json
         buffer = io.BytesIO()
         p = canvas.Canvas(buffer, pagesize=A4)
-        
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(50, 800, f"Laporan Pertumbuhan Anak - {APP_TITLE}")
-        
-        p.setFont("Helvetica", 12)
-        p.drawString(50, 770, f"Nama Ibu: {data.get('mother_name', '-')}")
-        p.drawString(50, 755, f"Tanggal: {datetime.now().strftime('%Y-%m-%d')}")
-        
-        y = 720
-        if 'results' in data:
-            for k, v in data['results'].items():
-                p.drawString(50, y, f"{k.upper()}: {v['value']} (Z: {v['z_score']}) - {v['status']}")
-                y -= 20
-                
-        p.showPage()
+        draw_report_page(p, data, session.get('theme'), with_charts=False)
         p.save()
         buffer.seek(0)
         
@@ -359,6 +953,165 @@ def api_export_report():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/export-jobs', methods=['POST'])
+@enforce_quota('report_exports')
+def api_export_jobs():
+    """Mulai ekspor PDF banyak anak di latar belakang.
+    Body: {"children": [{mother_name, age_months, gender, results}, ...]}"""
+    data = request.json or {}
+    children = data.get('children')
+    if not isinstance(children, list) or not children:
+        return jsonify({'error': 'Data anak kosong'}), 400
+    if len(children) > Config.EXPORT_MAX_RECORDS:
+        return jsonify({'error': f"Maksimal {Config.EXPORT_MAX_RECORDS} anak per ekspor"}), 400
+    for i, child in enumerate(children, 1):
+        if not isinstance(child, dict) or AnthroEngine.parse_sex(child) is None:
+            return jsonify({'error': f"Jenis kelamin anak ke-{i} tidak valid"}), 400
+
+    theme_key = session.get('theme')
+    job = EXPORT_JOBS.submit(
+        lambda job, path: render_report_pdf(children, path, theme_key, job),
+        total=len(children), suffix='.pdf')
+    if job is None:
+        return jsonify({'error': 'Antrean ekspor penuh, coba lagi nanti'}), 503
+
+    status_url = f"/api/export-jobs/{job.id}"
+    response = jsonify(dict(job.as_dict(), status_url=status_url))
+    response.headers['Location'] = status_url
+    return response, 202
+
+@app.route('/api/export-jobs/<job_id>')
+def api_export_job_status(job_id):
+    job = EXPORT_JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job tidak ditemukan'}), 404
+    status = job.as_dict()  # satu salinan yang konsisten
+    if status['status'] == 'done':
+        status['download_url'] = f"/api/export-jobs/{job.id}/download"
+    return jsonify(status)
+
+@app.route('/api/export-jobs/<job_id>/download')
+def api_export_job_download(job_id):
+    job = EXPORT_JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job tidak ditemukan'}), 404
+    status = job.as_dict()
+    if status['status'] != 'done':
+        return jsonify(dict(status, error=status['error'] or 'Laporan belum siap')), 409
+    return send_file(job.path, as_attachment=True,
+                     download_name=f"Laporan_Gizi_{job.total}_anak.pdf", mimetype='application/pdf')
+
+# Kolom ekspor riwayat pengukuran (CSV / Excel)
+EXPORT_COLUMNS = ['child_id', 'sex', 'dob', 'date', 'age_months', 'weight', 'height',
+                  'z_wfa', 'z_hfa', 'z_wfh']
+
+def score_measurement(sex, age, weight, height):
+    """Z-score BB/U, TB/U dan BB/TB satu pengukuran (None jika tidak valid)"""
+    def zscore(indicator, measurement, h=None):
+        if calc is None or measurement in (None, '') or age is None:
+            return None
+        try:
+            return calc.zscore_for_measurement(indicator, measurement, age, sex, h)
+        except Exception:
+            return None
+    wfx = 'wfl' if age is not None and age < 24 else 'wfh'
+    return [zscore('wfa', weight), zscore('lhfa', height),
+            zscore(wfx, weight, height) if height not in (None, '') else None]
+
+def history_rows(records):
+    """Baris ekspor dari riwayat GrowthRecord yang tersimpan, (child_id,
+    record, lock); baris satu anak disalin di bawah kuncinya"""
+    for child_id, record, lock in records:
+        with lock:
+            rows = []
+            for i in range(len(record)):
+                scores = record.zscores[i]
+                age = record.ages[i]
+                rows.append([child_id, record.sex, record.dob.isoformat() if record.dob else None,
+                             record.dates[i].isoformat(), round(age, 2) if age is not None else None,
+                             record.weights[i], record.heights[i],
+                             scores.get('wfa'), scores.get('lhfa'),
+                             scores.get('wfl', scores.get('wfh'))])
+        yield from rows
+
+def measurement_rows(items):
+    """Baris ekspor dari data yang dikirim klien; Z-score dihitung per baris"""
+    for item in items:
+        sex = str(item.get('sex') or item.get('gender') or '').upper()[:1]
+        age = item.get('age_months')
+        try:
+            if age in (None, '') and item.get('dob') and item.get('date'):
+                age = (AnthroEngine.parse_date(item['date']) - AnthroEngine.parse_date(item['dob'])).days / 30.4375
+            age = float(age) if age not in (None, '') else None
+        except (TypeError, ValueError):
+            age = None
+        weight, height = item.get('weight') or None, item.get('height') or None
+        yield ([item.get('child_id'), sex, item.get('dob'), item.get('date'),
+                round(age, 2) if age is not None else None, weight, height] +
+               score_measurement(sex, age, weight, height))
+
+@app.route('/api/export/<fmt>', methods=['GET', 'POST'])
+@enforce_quota('report_exports')
+def api_export_table(fmt):
+    """Ekspor riwayat pengukuran + Z-score sebagai CSV atau Excel, dialirkan
+    baris demi baris. GET: riwayat tersimpan milik sesi ini (opsional ?child_id=).
+    POST: JSON {"measurements": [...]} atau body text/csv."""
+    if fmt == 'pdf':
+        return jsonify({'error': 'Gunakan /api/export-jobs untuk ekspor PDF'}), 400
+    if fmt not in Config.EXPORT_FORMATS:
+        return jsonify({'error': f"Format tidak didukung: {fmt}"}), 400
+
+    if request.method == 'POST':
+        if request.mimetype == 'text/csv':
+            # dibaca langsung dari aliran request, tidak dimuat sekaligus
+            items = csv.DictReader(io.TextIOWrapper(request.stream, encoding='utf-8-sig'))
+        else:
+            items = (request.get_json(silent=True) or {}).get('measurements') or []
+        rows = measurement_rows(items)
+    else:
+        child_id = request.args.get('child_id')
+        # hanya riwayat milik sesi ini
+        records = stored_growth_records(client_id())
+        if child_id:
+            records = [r for r in records if r[0] == child_id]
+        rows = history_rows(records)
+
+    stamp = datetime.now().strftime('%Y%m%d')
+    if fmt == 'csv':
+        body, mimetype, filename = exporters.iter_csv(EXPORT_COLUMNS, rows), exporters.CSV_MIMETYPE, f"riwayat_gizi_{stamp}.csv"
+    else:
+        body, mimetype, filename = exporters.iter_xlsx(EXPORT_COLUMNS, rows, 'Riwayat'), exporters.XLSX_MIMETYPE, f"riwayat_gizi_{stamp}.xlsx"
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f"attachment; filename={filename}"
+    return response
+
+@app.route('/api/reference-curves')
+def api_reference_curves():
+    """Manifest kurva referensi: nama tabel -> URL file ber-hash"""
+    if not REFERENCE_CURVES:
+        return jsonify({'error': 'Kurva referensi tidak tersedia'}), 503
+    if request.if_none_match.contains_weak(REFERENCE_CURVES['hash']):
+        return '', 304
+    response = jsonify({
+        'version': REFERENCE_CURVES['version'],
+        'columns': REFERENCE_CURVES['columns'],
+        'curves': {name: f"/curves/{filename}"
+                   for name, filename in REFERENCE_CURVES['files'].items()}
+    })
+    # manifest selalu divalidasi ulang; file kurvanya yang di-cache permanen
+    response.set_etag(REFERENCE_CURVES['hash'])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/curves/<filename>')
+def reference_curve_file(filename):
+    """File kurva ber-hash: isinya tidak pernah berubah"""
+    if not REFERENCE_CURVES or filename not in REFERENCE_CURVES['files'].values():
+        abort(404)
+    response = send_from_directory(CURVES_DIR, filename, max_age=CURVES_MAX_AGE)
+    response.headers['Cache-Control'] = f"public, max-age={CURVES_MAX_AGE}, immutable"
+    return response
+
 @app.route('/api/set-mode', methods=['POST'])
 def api_set_mode():
     session['mode'] = request.json.get('mode', 'parent')
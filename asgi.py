@@ -0,0 +1,307 @@
+"""
+Mode ASGI untuk anthroGizi (alternatif run.py / gunicorn).
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+Koneksi (membaca body dan mengirim respons) ditangani event loop, jadi
+klien mobile yang lambat tidak menahan thread. Body request dialirkan ke
+view sambil diterima (lihat BodyStream), tidak ditampung utuh dulu. View
+Flask tetap sinkron dan dijalankan menurut jenisnya:
+
+- ringan (KPSP, set-mode, /metrics, ...) langsung di event loop;
+- berat (grafik, PDF, z-score massal, ekspor) di pool CPU;
+- sisanya (halaman, file statis, status job) di pool I/O.
+
+Ukuran pool diatur lewat ASGI_CPU_WORKERS (bawaan: jumlah CPU) dan
+ASGI_IO_WORKERS (bawaan: 16). Pool CPU memakai thread: numpy, matplotlib
+dan reportlab sebagian melepas GIL, dan yang terpenting pekerjaan berat
+tidak bisa menghabiskan thread milik route lain.
+"""
+import asyncio
+import contextvars
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import ClientDisconnected, HTTPException, RequestEntityTooLarge
+
+from app import app, METRICS
+from config import Config
+
+CPU_WORKERS = int(os.environ.get('ASGI_CPU_WORKERS', os.cpu_count() or 2))
+IO_WORKERS = int(os.environ.get('ASGI_IO_WORKERS', 16))
+
+# endpoint Flask yang dijalankan langsung di event loop (cepat, tanpa I/O)
+INLINE_ENDPOINTS = {
+    'view_metrics', 'api_get_kpsp', 'api_set_mode', 'api_easy_mode',
+    'api_export_job_status',
+}
+# endpoint yang menggambar grafik, membuat PDF atau menghitung banyak z-score
+CPU_ENDPOINTS = {
+    'api_calculate_all', 'api_growth_velocity_multi', 'api_cohort_trend',
+    'api_target_measurements', 'api_export_report', 'api_export_jobs',
+    'api_export_table',
+}
+
+# respons streaming dikirim per potongan; body request dibatasi seperti Flask
+MAX_BODY = Config.MAX_CONTENT_LENGTH
+# potongan body request yang boleh menunggu dibaca view (lihat BodyStream)
+BODY_QUEUE_CHUNKS = 8
+
+
+class Pool:
+    """ThreadPoolExecutor dengan hitungan pekerjaan yang sedang antre/jalan"""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix=f'asgi-{name}')
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    async def run(self, func, *args):
+        with self._lock:
+            self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+
+POOLS = {'cpu': Pool('cpu', CPU_WORKERS), 'io': Pool('io', IO_WORKERS)}
+
+METRICS.gauge('anthrogizi_asgi_pool_pending', 'Pekerjaan yang antre atau berjalan per pool ASGI',
+              lambda: [({'pool': p.name}, p.pending) for p in POOLS.values()], ('pool',))
+METRICS.gauge('anthrogizi_asgi_pool_workers', 'Ukuran pool ASGI',
+              lambda: [({'pool': p.name}, p.workers) for p in POOLS.values()], ('pool',))
+
+
+def route_kind(method, path):
+    """'inline', 'cpu' atau 'io' untuk sebuah request"""
+    try:
+        endpoint, _args = app.url_map.bind('localhost').match(path, method=method)
+    except HTTPException:
+        return 'inline'  # 404/405: Flask cukup membuat halaman error
+    if endpoint in INLINE_ENDPOINTS:
+        return 'inline'
+    if endpoint in CPU_ENDPOINTS:
+        return 'cpu'
+    return 'io'
+
+
+def build_environ(scope):
+    """environ WSGI tanpa wsgi.input (diisi oleh application)"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]) if server[1] is not None else '80',
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        if key in environ:
+            # beberapa header Cookie digabung dengan '; ' (RFC 6265),
+            # header lain dengan ',' (RFC 9110)
+            separator = '; ' if key == 'HTTP_COOKIE' else ','
+            value = f"{environ[key]}{separator}{value}"
+        environ[key] = value
+    return environ
+
+
+class BodyStream(io.RawIOBase):
+    """wsgi.input yang dibaca view sambil body request masih diterima.
+
+    pump() berjalan di event loop dan memasukkan potongan body ke antrean
+    terbatas; view di thread pool membacanya lewat readinto(). Body besar
+    (unggah CSV untuk ekspor) tidak pernah ditampung utuh di memori, dan
+    klien yang mengirim lebih cepat dari view ditahan oleh antrean.
+    """
+
+    def __init__(self, loop, max_chunks=BODY_QUEUE_CHUNKS):
+        self._loop = loop
+        self._queue = asyncio.Queue(max_chunks)
+        self._chunk = memoryview(b'')
+        self._done = False
+
+    async def pump(self, receive):
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                await self._queue.put(ClientDisconnected())
+                return
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if MAX_BODY and size > MAX_BODY:
+                await self._queue.put(RequestEntityTooLarge())
+                return
+            if chunk:
+                await self._queue.put(chunk)
+            if not message.get('more_body'):
+                await self._queue.put(b'')
+                return
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk and not self._done:
+            item = asyncio.run_coroutine_threadsafe(self._queue.get(), self._loop).result()
+            if isinstance(item, Exception):
+                self._done = True
+                raise item
+            self._done = not item
+            self._chunk = memoryview(item)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+def call_wsgi(environ):
+    """Jalankan view Flask; kembalikan (status, headers, iterator body)"""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                              for k, v in headers]
+        return lambda data: None  # write() lama tidak dipakai Flask
+
+    body = app.wsgi_app(environ, start_response)
+    iterator = iter(body)
+    # potongan pertama dibuat di sini agar start_response pasti sudah dipanggil
+    first = next(iterator, b'')
+    return started['status'], started['headers'], first, iterator, body
+
+
+def _next_chunk(iterator):
+    return next(iterator, None)
+
+
+def _close(body):
+    if hasattr(body, 'close'):
+        body.close()
+
+
+async def read_body(receive):
+    """Body utuh untuk view yang berjalan di event loop (bytes), None jika
+    klien memutus koneksi, False jika melebihi MAX_BODY"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if MAX_BODY and size > MAX_BODY:
+            return False
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            for pool in POOLS.values():
+                pool.executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        raise RuntimeError(f"jenis koneksi tidak didukung: {scope['type']}")
+
+    environ = build_environ(scope)
+    kind = route_kind(scope['method'], environ['PATH_INFO'])
+    pool = POOLS.get(kind)
+    pump = None
+    if pool is None:
+        # view ringan berjalan di event loop dan tidak boleh menunggu body
+        # yang diterima event loop itu sendiri: body (kecil) dibaca utuh dulu
+        body = await read_body(receive)
+        if body is None:
+            return  # klien sudah memutus koneksi
+        if body is False:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+            await send({'type': 'http.response.body', 'body': b'Request terlalu besar'})
+            return
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+    else:
+        # view di thread pool membaca body sambil diterima; tanpa
+        # Content-Length (chunked) body dibaca sampai habis
+        stream = BodyStream(asyncio.get_running_loop())
+        pump = asyncio.ensure_future(stream.pump(receive))
+        environ['wsgi.input'] = io.BufferedReader(stream)
+        environ['wsgi.input_terminated'] = True
+
+    # satu context per request: generator stream_with_context Flask bisa
+    # dilanjutkan di thread pool mana pun tanpa kehilangan request context
+    context = contextvars.copy_context()
+
+    async def run(func, *args):
+        if pool is None:
+            return context.run(func, *args)
+        return await pool.run(context.run, func, *args)
+
+    try:
+        await respond(run, environ, send)
+    finally:
+        if pump is not None:
+            pump.cancel()
+
+
+async def respond(run, environ, send):
+    """Jalankan view lewat run() dan kirim responsnya per potongan"""
+    status, headers, chunk, iterator, response = await run(call_wsgi, environ)
+    try:
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        # respons biasa (list satu elemen) selesai di sini; respons streaming
+        # (ekspor CSV/Excel) dibuat per potongan di pool yang sama
+        while True:
+            following = await run(_next_chunk, iterator)
+            if following is None:
+                await send({'type': 'http.response.body', 'body': chunk})
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            chunk = following
+    finally:
+        await run(_close, response)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(application, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,54 @@
+"""
+Throughput and peak memory of the streaming CSV / XLSX exporters.
+
+    python -m benchmarks.export [--rows 100000]
+
+Rows are generated on the fly and the output is only counted, so the
+traced peak is the memory the writer itself holds. It should not grow
+with --rows.
+"""
+import argparse
+import time
+import tracemalloc
+
+import exporters
+
+COLUMNS = ['child_id', 'sex', 'dob', 'date', 'age_months', 'weight', 'height',
+           'z_wfa', 'z_hfa', 'z_wfh']
+
+
+def rows(count):
+    for i in range(count):
+        yield [f"ANAK-{i:06d}", 'M' if i % 2 else 'F', '2022-01-01', '2024-03-01',
+               round(i % 60 + 0.37, 2), 5.0 + i % 15, 60.0 + i % 50,
+               -1.23, 0.45, None]
+
+
+def measure(writer, count):
+    """ Seconds, output bytes and traced peak bytes of one export """
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = 0
+    for chunk in writer(COLUMNS, rows(count)):
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'format':>6} {'rows':>8} {'rows/s':>9} {'MB out':>7} {'peak KB':>8}")
+    for name, writer in (('csv', exporters.iter_csv), ('xlsx', exporters.iter_xlsx)):
+        for count in (args.rows // 10, args.rows):
+            elapsed, size, peak = measure(writer, count)
+            print(f"{name:>6} {count:>8} {count / elapsed:>9.0f} "
+                  f"{size / 1e6:>7.1f} {peak / 1024:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
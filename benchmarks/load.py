@@ -0,0 +1,323 @@
+"""
+Load test of the Flask service with a realistic traffic mix.
+
+    python -m benchmarks.load [--concurrency 8] [--duration 30]
+    python -m benchmarks.load --mix calculator=1 --concurrency 16
+    python -m benchmarks.load --url http://127.0.0.1:8000 --pid 1234
+
+By default a local server is started with run.py on a free port and
+stopped afterwards. --url targets a server that is already running,
+e.g. gunicorn with several workers, and --pid gives the process whose
+RSS (plus the RSS of its children) is sampled. Payloads are sampled from
+pygrowup/testdata/survey_z_rc.csv. Only the standard library is used,
+and nothing leaves localhost.
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SURVEY = os.path.join(ROOT, 'pygrowup', 'testdata', 'survey_z_rc.csv')
+
+# operation -> weight in the default traffic mix
+DEFAULT_MIX = {
+    'calculator': 40,
+    'easy_mode': 15,
+    'growth_velocity': 15,
+    'kpsp': 15,
+    'pdf': 10,
+    'pdf_job': 5,
+}
+
+MEASURE_DATE = datetime.date(2024, 1, 1)
+
+
+def load_children(path=SURVEY):
+    """ Usable rows of the survey as (id, sex, age, weight, height, head) """
+    children = []
+    with open(path, encoding='utf-8', errors='ignore') as f:
+        for row in csv.DictReader(f):
+            try:
+                age = float(row['agemons'])
+                weight = float(row['WEIGHT'])
+                height = float(row['HEIGHT'])
+            except ValueError:
+                continue
+            if not 0 < age <= 60:
+                continue
+            head = float(row['HEAD']) if row['HEAD'] else None
+            sex = 'M' if row['GENDER'] == '1' else 'F'
+            children.append((row['id'], sex, age, weight, height, head))
+    return children
+
+
+class Client:
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, path, payload=None):
+        """ Returns (status, body bytes) """
+        data = None
+        headers = {'Accept-Encoding': 'gzip'}
+        if payload is not None:
+            data = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def _age_payload(child):
+    return {'age_months': round(child[2], 2)}
+
+
+def op_calculator(client, child):
+    _id, sex, age, weight, height, head = child
+    return client.request('/api/calculate-all', {
+        'gender': sex, 'age_months': round(age, 2), 'weight': weight,
+        'height': height, 'head_circumference': head or ''})
+
+
+def op_easy_mode(client, child):
+    return client.request('/api/easy-mode', _age_payload(child))
+
+
+def op_kpsp(client, child):
+    return client.request('/api/get-kpsp', _age_payload(child))
+
+
+def op_growth_velocity(client, child):
+    child_id, sex, age, weight, height, _head = child
+    dob = MEASURE_DATE - datetime.timedelta(days=int(age * 30.4375))
+    earlier = max(dob + datetime.timedelta(days=1),
+                  MEASURE_DATE - datetime.timedelta(days=91))
+    return client.request('/api/growth-velocity-multi', {
+        'child_id': child_id, 'sex': sex, 'dob': dob.isoformat(),
+        'points': [
+            {'date': earlier.isoformat(), 'weight': round(weight * 0.95, 1),
+             'height': round(height - 2, 1)},
+            {'date': MEASURE_DATE.isoformat(), 'weight': weight, 'height': height},
+        ]})
+
+
+def _report_child(child):
+    _id, sex, age, weight, height, head = child
+    results = {'wfa': {'value': weight, 'z_score': 0, 'status': 'Normal'},
+               'hfa': {'value': height, 'z_score': 0, 'status': 'Normal'}}
+    return {'mother_name': f"Ibu {child[0]}", 'age_months': round(age, 2),
+            'results': results}
+
+
+def op_pdf(client, child):
+    return client.request('/api/export-report', _report_child(child))
+
+
+def op_pdf_job(client, child, children=10, poll=0.2):
+    """ Submit a multi-child export and wait for it; counts as one operation """
+    batch = [_report_child(child) for _ in range(children)]
+    status, body = client.request('/api/export-jobs', {'children': batch})
+    if status != 202:
+        return status, body
+    job = json.loads(body)
+    while True:
+        status, body = client.request(job['status_url'])
+        state = json.loads(body)
+        if status != 200 or state['status'] == 'failed':
+            return 500, body
+        if state['status'] == 'done':
+            return client.request(state['download_url'])
+        time.sleep(poll)
+
+
+OPERATIONS = {
+    'calculator': op_calculator,
+    'easy_mode': op_easy_mode,
+    'growth_velocity': op_growth_velocity,
+    'kpsp': op_kpsp,
+    'pdf': op_pdf,
+    'pdf_job': op_pdf_job,
+}
+
+
+def rss_bytes(pid):
+    """ Resident set size of a process and its children, from /proc """
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(p) for p in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100.0 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port):
+    # kuota paket dimatikan: semua klien uji datang dari satu alamat;
+    # tanpa METRICS_TOKEN /metrics (cek siap) terbuka dari localhost
+    env = dict(os.environ, PORT=str(port), QUOTA_ENABLED='0', METRICS_TOKEN='')
+    server = subprocess.Popen([sys.executable, 'run.py'], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    client = Client(f'http://127.0.0.1:{port}', timeout=2)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('server exited during startup')
+        try:
+            client.request('/metrics')
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('server did not start within 60 s')
+
+
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise SystemExit(f"unknown operation {name!r}, choose from {sorted(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run(client, mix, children, concurrency, duration, pid=None, interval=1.0, seed=0):
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    results = {name: {'latency': [], 'errors': 0} for name in names}
+    lock = threading.Lock()
+    stop = time.time() + duration
+    rss = []
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        while time.time() < stop:
+            name = rng.choices(names, weights)[0]
+            child = rng.choice(children)
+            start = time.perf_counter()
+            try:
+                status, _body = OPERATIONS[name](client, child)
+                failed = status >= 400
+            except OSError:
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                results[name]['latency'].append(elapsed)
+                results[name]['errors'] += failed
+
+    def sampler():
+        started = time.time()
+        while time.time() < stop:
+            rss.append((time.time() - started, rss_bytes(pid)))
+            time.sleep(interval)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    if pid:
+        threads.append(threading.Thread(target=sampler))
+    began = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.time() - began, rss
+
+
+def report(results, elapsed, rss):
+    print(f"{'operation':>16} {'count':>7} {'req/s':>7} {'err %':>6} "
+          f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    every = []
+    errors = 0
+    for name, result in sorted(results.items()):
+        latency = result['latency']
+        every.extend(latency)
+        errors += result['errors']
+        _row(name, latency, result['errors'], elapsed)
+    _row('total', every, errors, elapsed)
+    if rss:
+        print('\nworker RSS (MB) over time:')
+        step = max(1, len(rss) // 20)
+        for second, size in rss[::step]:
+            print(f"{second:>7.1f}s {size / 2 ** 20:>8.1f}")
+        print(f"   peak  {max(size for _s, size in rss) / 2 ** 20:>8.1f}")
+
+
+def _row(name, latency, errors, elapsed):
+    count = len(latency)
+    rate = count / elapsed if elapsed else 0
+    error_rate = 100.0 * errors / count if count else 0
+    ms = [percentile(latency, q) * 1000 for q in (50, 90, 99, 100)]
+    print(f"{name:>16} {count:>7} {rate:>7.1f} {error_rate:>6.1f} "
+          f"{ms[0]:>8.1f} {ms[1]:>8.1f} {ms[2]:>8.1f} {ms[3]:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--mix', help='e.g. calculator=40,kpsp=10 (default: %s)' %
+                        ','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()))
+    parser.add_argument('--url', help='target a running server instead of starting run.py')
+    parser.add_argument('--pid', type=int, help='process to sample RSS from (with --url)')
+    parser.add_argument('--interval', type=float, default=1.0, help='RSS sample interval')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    children = load_children()
+    server = None
+    if args.url:
+        url, pid = args.url, args.pid
+    else:
+        port = free_port()
+        server = start_server(port)
+        url, pid = f'http://127.0.0.1:{port}', server.pid
+    try:
+        print(f"{url}: {args.concurrency} clients for {args.duration:g} s, "
+              f"{len(children)} survey children")
+        results, elapsed, rss = run(Client(url), mix, children, args.concurrency,
+                                    args.duration, pid, args.interval, args.seed)
+        report(results, elapsed, rss)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
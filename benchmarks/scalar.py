@@ -0,0 +1,99 @@
+"""
+Latency and memory of single-child (scalar) z-score calls.
+
+    python -m benchmarks.scalar [--calls 20000]
+
+Allocations are counted per call: the memory blocks a call allocates,
+including those it frees again before returning, less those of a call
+to a function that does nothing. Memory is measured with tracemalloc:
+the peak of memory traced during a call above what was allocated before
+it (the transient allocations of one call).
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from array import array
+
+from pygrowup import Calculator
+
+CASES = [
+    ('wfa', 9.3, 14, 'M', None),
+    ('lhfa', 71.2, 9, 'F', None),
+    ('wfl', 8.4, 10, 'F', 70.3),
+    ('wfh', 30.0, 40, 'M', 100.0),
+    ('bmifa', 15.1, 30, 'M', None),
+    ('hcfa', 44.0, 12, 'F', None),
+]
+
+
+def allocations(func, *args):
+    """ Blocks allocated while func(*args) runs, freed or not """
+    # sys.getallocatedblocks only tells how many blocks are allocated
+    # now, so it is read before every opcode and the increases are
+    # added up. counts is an array so keeping the running totals does
+    # not allocate; the - 1 is the int of the last reading, freed on
+    # the way out of trace.
+    counts = array('q', [0, 0])
+
+    def trace(frame, event, arg):
+        frame.f_trace_opcodes = True
+        blocks = sys.getallocatedblocks()
+        if blocks > counts[1]:
+            counts[0] += blocks - counts[1]
+        counts[1] = sys.getallocatedblocks() - 1
+        return trace
+
+    counts[1] = sys.getallocatedblocks() - 1
+    sys.settrace(trace)
+    try:
+        func(*args)
+    finally:
+        sys.settrace(None)
+    return counts[0]
+
+
+def _nothing(*args):
+    pass
+
+
+def traced(calc, case, repeat=50):
+    """ Allocations and peak transient bytes of one call """
+    overhead = min(allocations(_nothing, *case) for _ in range(repeat))
+    allocs = min(allocations(calc.zscore_for_measurement, *case)
+                 for _ in range(repeat)) - overhead
+
+    peaks = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        before, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        calc.zscore_for_measurement(*case)
+        _current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    tracemalloc.stop()
+    return allocs, min(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    calc = Calculator()
+    for case in CASES:
+        calc.zscore_for_measurement(*case)
+
+    print(f"{'indicator':>9} {'us/call':>9} {'allocs':>7} {'peak bytes':>11}")
+    for case in CASES:
+        start = time.perf_counter()
+        for _ in range(args.calls // len(CASES)):
+            calc.zscore_for_measurement(*case)
+        elapsed = time.perf_counter() - start
+        per_call = elapsed / (args.calls // len(CASES)) * 1e6
+        allocs, peak = traced(calc, case)
+        print(f"{case[0]:>9} {per_call:>9.1f} {allocs:>7} {peak:>11}")
+
+
+if __name__ == '__main__':
+    main()
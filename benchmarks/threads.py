@@ -0,0 +1,69 @@
+"""
+Throughput of one shared Calculator used from many threads at once.
+
+    python -m benchmarks.threads [--seconds 2] [--threads 1,2,4,8]
+
+Every thread checks its results against a single-threaded baseline, so
+the run doubles as a concurrency stress test. On a standard CPython
+build the GIL keeps total throughput roughly flat as threads are added;
+the point is that it does not fall off (no lock contention, no shared
+per-call state) and scales on free-threaded builds.
+"""
+import argparse
+import threading
+import time
+
+from pygrowup import Calculator
+
+CASES = [
+    ('wfa', 9.3, 14, 'M', None),
+    ('lhfa', 71.2, 9, 'F', None),
+    ('wfl', 8.4, 10, 'F', 70.3),
+    ('wfh', 30.0, 40, 'M', 100.0),
+    ('bmifa', 15.1, 30, 'M', None),
+    ('hcfa', 44.0, 12, 'F', None),
+]
+
+
+def run(calc, n_threads, seconds, expected):
+    stop = threading.Event()
+    counts = [0] * n_threads
+    errors = []
+
+    def work(i):
+        while not stop.is_set():
+            for case, want in zip(CASES, expected):
+                if calc.zscore_for_measurement(*case) != want:
+                    errors.append(case)
+            counts[i] += len(CASES)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(n_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--threads', default='1,2,4,8')
+    args = parser.parse_args()
+
+    calc = Calculator(adjust_weight_scores=True)
+    expected = [calc.zscore_for_measurement(*case) for case in CASES]
+    baseline = None
+    print(f"{'threads':>7} {'calls/s':>12} {'vs 1 thread':>12} {'mismatches':>11}")
+    for n in [int(x) for x in args.threads.split(',')]:
+        rate, errors = run(calc, n, args.seconds, expected)
+        baseline = baseline or rate
+        print(f"{n:>7} {rate:>12.0f} {rate / baseline:>11.2f}x {len(errors):>11}")
+
+
+if __name__ == '__main__':
+    main()
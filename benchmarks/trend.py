@@ -0,0 +1,53 @@
+"""
+Render time and PNG size of trend charts as histories grow.
+
+    python -m benchmarks.trend [--repeat 3]
+
+One child with a growing number of points, then a cohort of children
+overlaid in one chart. With decimation both columns should stay roughly
+flat; --raw renders every point for comparison.
+"""
+import argparse
+import base64
+import time
+
+import numpy as np
+
+from app import AnthroEngine
+
+
+def child(points, rng):
+    ages = np.sort(rng.uniform(0, 60, points))
+    weights = 3.3 + 0.25 * ages + rng.normal(0, 0.3, points)
+    return ages, weights
+
+
+def measure(series, repeat, max_points):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decimated = [(label,) + AnthroEngine.decimate(x, y, max_points)
+                     for label, x, y in series]
+        png = AnthroEngine.render_trend_chart(decimated, "Trend", "kg")
+        best = min(best, time.perf_counter() - start)
+    return best, len(base64.b64decode(png))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--raw', action='store_true', help='no decimation')
+    args = parser.parse_args()
+    max_points = float('inf') if args.raw else 200
+    rng = np.random.default_rng(0)
+
+    print(f"{'children':>8} {'points':>8} {'ms':>8} {'PNG KB':>8}")
+    for children, points in ((1, 60), (1, 1000), (1, 100000),
+                             (10, 60), (100, 60), (1000, 60), (1000, 1000)):
+        series = [(str(i),) + child(points, rng) for i in range(children)]
+        seconds, size = measure(series, args.repeat, max_points)
+        print(f"{children:>8} {points:>8} {seconds * 1000:>8.1f} {size / 1024:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
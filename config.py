@@ -2,15 +2,17 @@ import os
 from datetime import timedelta
 
 class Config:
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
+    # tanpa SECRET_KEY app.py memakai kunci acak per proses (lihat app.py)
+    SECRET_KEY = os.environ.get('SECRET_KEY')
     
     # Database configuration
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///anthrogizi.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
-    # Session configuration
-    SESSION_TYPE = 'filesystem'
-    SESSION_FILE_DIR = './flask_session'
+    # Session configuration (lihat sessions.py): 'cookie' menyimpan preferensi
+    # di cookie bertanda tangan, 'memory' di store LRU dengan id di cookie
+    SESSION_TYPE = os.environ.get('SESSION_TYPE') or 'cookie'
+    SESSION_MAX_ENTRIES = int(os.environ.get('SESSION_MAX_ENTRIES') or 10000)
     SESSION_PERMANENT = False
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
     
@@ -75,16 +77,26 @@ class Config:
             'name': 'Silver',
             'price': 49999,
             'features': ['unlimited_calculator', 'premium_articles', 'ad_free_videos', 'basic_reports', 'whatsapp_consultation'],
-            'limits': {'consultations': 2, 'report_exports': 10}
+            'limits': {'consultations': 2, 'report_exports': 10, 'daily_calculations': -1}
         },
         'gold': {
             'name': 'Gold',
             'price': 99999,
             'features': ['all_features', 'priority_support', 'advanced_analytics', 'unlimited_consultations', 'custom_notifications'],
-            'limits': {'consultations': -1, 'report_exports': -1}
+            'limits': {'consultations': -1, 'report_exports': -1, 'daily_calculations': -1}
         }
     }
     
+    # Batas yang tidak disebut paket ditolak; -1 berarti tanpa batas (kalkulasi
+    # Silver/Gold sesuai fitur 'unlimited_calculator' / 'all_features').
+    # QUOTA_DB: file SQLite tempat kuota disimpan (dibagi antar worker di satu
+    # host dan bertahan saat restart); kosong berarti hanya di memori proses
+    QUOTA_DB = os.environ.get('QUOTA_DB')
+    
+    # METRICS_TOKEN: token Bearer untuk scrape /metrics; kosong berarti
+    # /metrics hanya bisa diakses dari host sendiri (127.0.0.1 / ::1)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
     # Notification configuration
     NOTIFICATION_INTERVAL = 20  # seconds for motivational messages
     MOTIVATIONAL_MESSAGES = [
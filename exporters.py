@@ -0,0 +1,150 @@
+"""
+Penulis ekspor tabel (CSV dan XLSX) yang mengalir baris demi baris.
+
+Keduanya menerima iterator baris (list nilai) dan menghasilkan potongan
+bytes, sehingga bisa langsung dikirim sebagai respons Flask tanpa pernah
+menyimpan seluruh file di memori.
+"""
+import csv
+import io
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+# jumlah baris per potongan yang dikirim ke klien
+CHUNK_ROWS = 500
+
+CSV_MIMETYPE = 'text/csv'
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+# teks berawalan ini dibaca spreadsheet sebagai rumus (CSV/formula injection)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_cell(value):
+    """Nilai sel CSV: None jadi kosong, teks yang bisa dibaca sebagai rumus
+    diberi awalan ' (angka seperti '-1.5' dibiarkan)"""
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        try:
+            float(value)
+        except ValueError:
+            return "'" + value
+    return value
+
+
+def iter_csv(columns, rows, chunk_rows=CHUNK_ROWS):
+    """CSV UTF-8 (dengan BOM agar Excel membaca huruf non-ASCII dengan benar)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow([csv_cell(v) for v in columns])
+    for i, row in enumerate(rows, 1):
+        writer.writerow([csv_cell(v) for v in row])
+        if i % chunk_rows == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _Sink(io.RawIOBase):
+    """File tujuan zipfile yang tidak bisa di-seek; isinya diambil per potongan"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>')
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>')
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>')
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>')
+
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>')
+
+_SHEET_END = '</sheetData></worksheet>'
+
+
+def _cell(value):
+    if value is None or value == '' or value != value:  # kosong / NaN
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def _row(values):
+    return '<row>' + ''.join(_cell(v) for v in values) + '</row>'
+
+
+def iter_xlsx(columns, rows, sheet_name='Data', chunk_rows=CHUNK_ROWS):
+    """Workbook XLSX satu sheet. Arsip zip ditulis ke aliran yang tidak
+    bisa di-seek (zipfile memakai data descriptor), dan sheet ditulis
+    dengan inline string sehingga tidak perlu tabel sharedStrings."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name[:31])))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((_SHEET_START + _row(columns)).encode('utf-8'))
+            batch = []
+            for row in rows:
+                batch.append(_row(row))
+                if len(batch) == chunk_rows:
+                    sheet.write(''.join(batch).encode('utf-8'))
+                    batch = []
+                    data = sink.pop()
+                    if data:
+                        yield data
+            sheet.write((''.join(batch) + _SHEET_END).encode('utf-8'))
+    yield sink.pop()
@@ -0,0 +1,125 @@
+"""
+Antrean pekerjaan latar belakang anthroGizi (mis. ekspor laporan PDF).
+
+Pekerjaan dijalankan oleh pool thread lokal; hasilnya ditulis ke file
+sementara dan klien memantau status lewat job id sampai file siap diunduh.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """Status satu pekerjaan: queued -> running -> done / failed.
+
+    Ditulis oleh thread pekerja dan dibaca oleh thread request, jadi
+    semua perubahan dan as_dict() memakai lock antrean (lock)."""
+
+    def __init__(self, total, path, lock=None):
+        self._lock = lock or threading.Lock()
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.total = total
+        self.done = 0
+        self.error = None
+        self.path = path
+        self.created = time.time()
+        self.finished = None
+
+    def advance(self, count=1):
+        """Dipanggil oleh pekerjaan setiap satu unit (mis. satu anak) selesai"""
+        with self._lock:
+            self.done += count
+
+    def _set_status(self, status, error=None):
+        # status, error dan waktu selesai berubah bersama: pembaca tidak
+        # pernah melihat 'failed' tanpa error atau 'done' tanpa finished
+        with self._lock:
+            if status in ('done', 'failed'):
+                self.finished = time.time()
+            self.error = error
+            self.status = status
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'progress': {'done': self.done, 'total': self.total},
+                'error': self.error,
+            }
+
+
+class JobQueue:
+    """Pool pekerja + registri job yang dibatasi jumlah dan umurnya"""
+
+    def __init__(self, workers=2, max_pending=100, ttl=3600, directory=None):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.directory = directory or tempfile.mkdtemp(prefix='anthrogizi-jobs-')
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='export')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, func, total, suffix=''):
+        """Jadwalkan func(job, path). Mengembalikan Job, atau None jika
+        antrean sudah penuh."""
+        self.prune()
+        with self._lock:
+            if self._pending() >= self.max_pending:
+                return None
+            path = os.path.join(self.directory, uuid.uuid4().hex + suffix)
+            job = Job(total, path, self._lock)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self):
+        """Jumlah job yang belum selesai (menunggu atau berjalan)"""
+        with self._lock:
+            return self._pending()
+
+    def _pending(self):
+        # dipanggil dengan lock terpegang
+        return sum(1 for job in self._jobs.values()
+                   if job.status in ('queued', 'running'))
+
+    def prune(self):
+        """Hapus job selesai yang lebih tua dari ttl beserta filenya"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished is not None and job.finished < cutoff]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            if os.path.exists(job.path):
+                os.remove(job.path)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _run(self, job, func):
+        job._set_status('running')
+        try:
+            func(job, job.path)
+        except Exception as e:
+            # file setengah jadi dihapus sebelum job terlihat gagal
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+            job._set_status('failed', str(e))
+        else:
+            job._set_status('done')
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# vim: ai ts=4 sts=4 et sw=4
+"""
+pandas DataFrame accessor for bulk z-scores. Importing this module
+registers it (pandas is only needed if you use it):
+
+    import pygrowup.accessor
+    df.anthro.zscores(['wfa', 'lhfa', 'wfl'], weight='WEIGHT',
+                      height='HEIGHT', age='agemons', sex='GENDER')
+
+Columns are handed to the vectorized BatchCalculator as whole arrays,
+and z-score and flag columns are added to the frame in place.
+"""
+import numpy as np
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+from . import batch
+
+
+# measurement column used by each indicator (bmifa may also be
+# derived from weight and height, see AnthroAccessor.zscores)
+MEASUREMENTS = {
+    'wfa': 'weight',
+    'wfl': 'weight',
+    'wfh': 'weight',
+    'lhfa': 'height',
+    'bmifa': 'bmi',
+    'hcfa': 'head',
+}
+
+# one BatchCalculator per set of calculator options, so tables
+# are only loaded and packed once
+_engines = {}
+
+
+def _engine(calculator, options):
+    if calculator is not None:
+        return batch.BatchCalculator(calculator)
+    key = tuple(sorted(options.items()))
+    if key not in _engines:
+        _engines[key] = batch.BatchCalculator(**options)
+    return _engines[key]
+
+
+def _values(frame, column):
+    """ A column as a numpy array for the batch engine, with missing
+    values (NaN, None, pd.NA) as NaN or None """
+    series = frame[column]
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return series.astype(object).where(series.notna(), None).to_numpy()
+
+
+class AnthroAccessor(object):
+    """ df.anthro -- anthropometric z-scores for a whole frame """
+
+    def __init__(self, frame):
+        self._frame = frame
+
+    def zscores(self, indicators, age, sex, weight=None, height=None,
+                head=None, bmi=None, measurement=None, prefix='z_',
+                flag_prefix='flag_', centile_prefix=None, error_prefix=None,
+                decimals=2, calculator=None, **options):
+        """ Add z-score and flag columns (e.g. z_wfa and flag_wfa) for
+        one indicator or a list of them, and return the frame.
+
+        Arguments other than indicators and options are column names.
+        age is in months; sex may be M/F or WHO codes 1/2. weight is used
+        by wfa, wfl and wfh, height is the measurement for lhfa and the
+        length/height for wfl and wfh, head is used by hcfa. bmifa uses
+        bmi if given, otherwise BMI from weight (kg) and height (cm).
+        measurement overrides the measurement column of a single
+        indicator. Options (e.g. include_cdc=True) are those of
+        Calculator, or pass a calculator. Rows with missing or invalid
+        input (including cells that are not numbers, e.g. 'n/a') get NaN
+        z-scores rather than raising. With a centile_prefix (e.g. 'p_')
+        centile columns are added too, and with an error_prefix (e.g.
+        'error_') the batch error code of each row. """
+        if pd is None:
+            raise ImportError('pandas is required for the anthro accessor')
+        if isinstance(indicators, str):
+            indicators = [indicators]
+        frame = self._frame
+        engine = _engine(calculator, options)
+        columns = {'weight': weight, 'height': height, 'head': head,
+                   'bmi': bmi}
+        ages = _values(frame, age)
+        sexes = _values(frame, sex)
+        heights = _values(frame, height) if height is not None else None
+
+        for indicator in indicators:
+            indicator = indicator.lower()
+            if measurement is not None:
+                if len(indicators) > 1:
+                    raise ValueError('measurement can only be given for '
+                                     'a single indicator')
+                values = _values(frame, measurement)
+            elif indicator == 'bmifa' and bmi is None:
+                values = self._bmi(weight, height)
+            else:
+                column = columns[MEASUREMENTS[indicator]]
+                if column is None:
+                    raise ValueError('%s needs a %s column' %
+                                     (indicator, MEASUREMENTS[indicator]))
+                values = _values(frame, column)
+            if indicator in ('wfl', 'wfh') and heights is None:
+                raise ValueError('%s needs a height column' % indicator)
+
+            result = engine.zscores(indicator, values, ages, sexes,
+                                    heights if indicator in ('wfl', 'wfh')
+                                    else None, decimals=decimals,
+                                    centiles=centile_prefix is not None)
+            frame[prefix + indicator] = result['zscore']
+            if flag_prefix is not None:
+                frame[flag_prefix + indicator] = result['flag']
+            if centile_prefix is not None:
+                frame[centile_prefix + indicator] = result['centile']
+            if error_prefix is not None:
+                frame[error_prefix + indicator] = result['error']
+        return frame
+
+    def _bmi(self, weight, height):
+        if weight is None or height is None:
+            raise ValueError('bmifa needs a bmi column, or weight and '
+                             'height columns')
+        weights = batch._to_float(_values(self._frame, weight))
+        meters = batch._to_float(_values(self._frame, height)) / 100
+        return weights / (meters * meters)
+
+
+if pd is not None:
+    pd.api.extensions.register_dataframe_accessor('anthro')(AnthroAccessor)
@@ -0,0 +1,495 @@
+#!/usr/bin/env python
+# vim: ai ts=4 sts=4 et sw=4
+from decimal import Decimal as D
+
+import numpy as np
+import six
+
+try:
+    from scipy.special import ndtr as _ndtr
+except ImportError:
+    _ndtr = None
+
+from . import helpers
+from .pygrowup import Calculator
+
+
+INDICATORS = ("lhfa", "wfl", "wfh", "wfa", "bmifa", "hcfa")
+
+# WHO exclusion ranges for flagging biologically implausible values
+# (z-scores outside these limits), as used by igrowup for its
+# FLEN, FWEI, FWFL and FBMI columns
+FLAG_LIMITS = {
+    'lhfa': (-6, 6),
+    'wfa': (-6, 5),
+    'wfl': (-5, 5),
+    'wfh': (-5, 5),
+    'bmifa': (-5, 5),
+    'hcfa': (-5, 5),
+}
+
+# reasons a z-score could not be calculated for a row. these mirror
+# the assertions and exceptions raised by Calculator.zscore_for_measurement
+OK = 0
+MISSING_INPUT = 1           # AssertionError (blank measurement, age, sex),
+                            # or a value that is not a number, e.g. 'n/a'
+INVALID_MEASUREMENT = 2     # exceptions.InvalidMeasurement
+INVALID_AGE = 3             # exceptions.InvalidAge
+DATA_NOT_FOUND = 4          # exceptions.DataNotFound
+
+# table age ranges, in the order they are coded below
+TABLE_AGES = ('0_13', '0_5', '0_2', '2_5', '2_20')
+WEEKS, MONTHS_0_5, MONTHS_0_2, MONTHS_2_5, MONTHS_2_20 = range(5)
+
+
+class PackedTable(object):
+    """ A WHO/CDC table as dense numpy arrays of L, M and S,
+    indexed by age (weeks or months) or by length/height in
+    half centimeters. Missing rows are NaN. """
+
+    def __init__(self, table):
+        field_name = table['field_name']
+        rows = [v for k, v in table.items() if k != 'field_name']
+        # heights and lengths are tabulated every half centimeter
+        self.step = 0.5 if field_name in ('Length', 'Height') else 1
+        keys = np.array([float(r[field_name]) for r in rows])
+        index = np.rint(keys / self.step).astype(np.int64)
+        self.offset = int(index.min())
+        size = int(index.max()) - self.offset + 1
+        self.L = np.full(size, np.nan)
+        self.M = np.full(size, np.nan)
+        self.S = np.full(size, np.nan)
+        position = index - self.offset
+        self.L[position] = [float(r['L']) for r in rows]
+        self.M[position] = [float(r['M']) for r in rows]
+        self.S[position] = [float(r['S']) for r in rows]
+
+    def lookup(self, index):
+        """ Return (L, M, S) arrays for integer table indexes;
+        indexes not in the table give NaN """
+        position = np.asarray(index, dtype=np.int64) - self.offset
+        inside = (position >= 0) & (position < len(self.L))
+        position = np.where(inside, position, 0)
+        L = np.where(inside, self.L[position], np.nan)
+        M = np.where(inside, self.M[position], np.nan)
+        S = np.where(inside, self.S[position], np.nan)
+        return L, M, S
+
+
+class BatchPlan(object):
+    """ Groups the selected rows of a batch by a key of integer
+    columns (e.g. sex, table and table row), so that work depending
+    only on the key is done once per distinct key.
+
+    The distinct keys (plan.keys, one array per column) are in key
+    order, so rows of one table are contiguous and in table order.
+    Small key ranges are grouped by counting, without sorting.
+    Results for the distinct keys are copied back with scatter. """
+
+    def __init__(self, keys, selected):
+        self.rows = np.flatnonzero(selected)
+        columns = [np.asarray(key)[self.rows].astype(np.int64)
+                   for key in keys]
+        key = np.zeros(len(self.rows), dtype=np.int64)
+        span = 1
+        for column in columns:
+            low = column.min() if len(column) else 0
+            size = int(column.max() - low + 1) if len(column) else 1
+            key = key * size + (column - low)
+            span *= size
+        if span <= 4 * len(key) + 1024:
+            present = np.zeros(span, dtype=bool)
+            present[key] = True
+            self.inverse = (np.cumsum(present) - 1)[key]
+            unique = int(present.sum())
+        elif span < 2 ** 62:
+            unique, self.inverse = np.unique(key, return_inverse=True)
+            unique = len(unique)
+        else:
+            unique, self.inverse = np.unique(np.stack(columns, axis=1),
+                                             axis=0, return_inverse=True)
+            unique = len(unique)
+        self.inverse = self.inverse.ravel()
+        # one row of each distinct key
+        first = np.empty(unique, dtype=np.int64)
+        first[self.inverse] = np.arange(len(key))
+        self.keys = [column[first] for column in columns]
+
+    @property
+    def size(self):
+        return len(self.rows)
+
+    @property
+    def unique(self):
+        return len(self.keys[0]) if self.keys else 0
+
+    @property
+    def ratio(self):
+        """ Rows per distinct key (1.0 if there are no rows) """
+        return float(self.size) / self.unique if self.unique else 1.0
+
+    def scatter(self, values, n, fill):
+        """ Array of n rows with values of the distinct keys copied
+        to their rows, and fill in rows that were not selected """
+        result = np.full(n, fill, dtype=np.asarray(values).dtype)
+        result[self.rows] = np.asarray(values)[self.inverse]
+        return result
+
+
+def normal_cdf(z):
+    """ Standard normal cumulative distribution of an array of z-scores.
+    Uses scipy when it is installed, otherwise the erfc approximation of
+    Numerical Recipes (fractional error below 1.2e-7). """
+    z = np.asarray(z, dtype=np.float64)
+    if _ndtr is not None:
+        return _ndtr(z)
+    x = np.abs(z) / np.sqrt(2)
+    t = 1 / (1 + 0.5 * x)
+    poly = -1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (
+        0.09678418 + t * (-0.18628806 + t * (0.27886807 + t * (
+            -1.13520398 + t * (1.48851587 + t * (
+                -0.82215223 + t * 0.17087277))))))))
+    half_erfc = 0.5 * t * np.exp(-x * x + poly)
+    return np.where(z >= 0, 1 - half_erfc, half_erfc)
+
+
+def centiles(zscores, decimals=1):
+    """ Centiles (0-100) of an array of z-scores; NaN stays NaN """
+    result = 100 * normal_cdf(zscores)
+    if decimals is not None:
+        result = np.round(result, decimals)
+    return result
+
+
+def _to_decimal(values, decimals):
+    """ Object array of Decimals (None where NaN), quantized as the
+    scalar calculator does """
+    template = '%%.%df' % decimals if decimals is not None else '%r'
+    return np.array([None if np.isnan(v) else D(template % v)
+                     for v in values.ravel()],
+                    dtype=object).reshape(values.shape)
+
+
+def _mark(error, mask, code):
+    """ Record code for rows in mask, keeping earlier errors """
+    error[mask & (error == OK)] = code
+
+
+class BatchCalculator(object):
+    """ Vectorized counterpart of Calculator.zscore_for_measurement.
+
+    Works on whole columns at once with numpy, using the tables (and
+    options) of a Calculator. Instead of raising for a bad row, every
+    row gets an error code, and WHO implausible value flags are
+    calculated in the same pass as the z-scores. """
+
+    def __init__(self, calculator=None, **kwargs):
+        if calculator is None:
+            calculator = Calculator(**kwargs)
+        self.calculator = calculator
+        self._packed = {}
+
+    def table(self, table_name):
+        """ Packed version of a calculator table, or None if
+        the calculator has not loaded it (e.g., CDC tables) """
+        if table_name not in self._packed:
+            table = getattr(self.calculator, table_name, None)
+            self._packed[table_name] = (PackedTable(table)
+                                        if table is not None else None)
+        return self._packed[table_name]
+
+    def zscores(self, indicator, measurement, age_in_months, sex,
+                height=None, decimals=2, centiles=False, output='float',
+                dedup=True):
+        """ Calculate z-scores for arrays of observations.
+
+        sex may be given as M/F (or anything get_good_sexes accepts,
+        including WHO codes 1 and 2). Blank values may be given as NaN
+        or None. Returns a dict of arrays:
+
+            zscore  -- z-scores (rounded to decimals), NaN if not calculated
+            flag    -- 1 if the z-score is outside the WHO exclusion range
+            valid   -- True where a z-score was calculated
+            error   -- reason a z-score was not calculated (see OK etc.)
+            centile -- only with centiles=True: centiles (0-100, one
+                       decimal) of the unrounded z-scores
+
+        With output='decimal', zscore is an object array of Decimals
+        (None if not calculated), like Calculator.zscore_for_measurement
+        returns. The default float arrays avoid any per-value work, and
+        decimals=None skips rounding too.
+
+        With dedup=True (see BatchPlan), L, M and S are looked up once
+        per distinct sex and table row, and the result also has
+        dedup_ratio: rows per distinct table row.
+        """
+        assert output in ('float', 'decimal')
+        indicator = indicator.lower()
+        assert indicator in INDICATORS
+        y = _to_float(measurement)
+        n = len(y)
+        age = np.broadcast_to(_to_float(age_in_months), (n,))
+        sexes, sex_ok = helpers.get_good_sexes(sex)
+        sexes = np.broadcast_to(sexes, (n,))
+        sex_ok = np.broadcast_to(sex_ok, (n,))
+        if height is None:
+            h = np.full(n, np.nan)
+        else:
+            h = np.broadcast_to(_to_float(height), (n,))
+
+        error = np.zeros(n, dtype=np.int8)
+        _mark(error, np.isnan(y) | np.isnan(age) | ~sex_ok, MISSING_INPUT)
+        with np.errstate(invalid='ignore'):
+            _mark(error, y <= 0, INVALID_MEASUREMENT)
+        y = self._adjust_measurement(indicator, y)
+
+        result = {}
+        if dedup:
+            L, M, S, plan = self._planned_lookup(indicator, age, sexes, h,
+                                                 error)
+            result['dedup_ratio'] = plan.ratio
+        else:
+            L, M, S = self._lookup(indicator, age, sexes, h, error)
+        z = self._lms(indicator, y, L, M, S)
+        valid = error == OK
+        z = np.where(valid, z, np.nan)
+        result.update({'valid': valid, 'error': error})
+        if centiles:
+            result['centile'] = globals()['centiles'](z)
+        if decimals is not None:
+            z = np.round(z, decimals)
+
+        low, high = FLAG_LIMITS[indicator]
+        with np.errstate(invalid='ignore'):
+            result['flag'] = ((z < low) | (z > high)).astype(np.int8)
+        result['zscore'] = z if output == 'float' else _to_decimal(z, decimals)
+        return result
+
+    def measurements(self, indicator, zscore, age_in_months, sex,
+                     height=None, decimals=2):
+        """ Vectorized Calculator.measurement_for_zscore: the measurements
+        that have the given z-scores, e.g. target weights for counselling.
+
+        Arguments are as for zscores, with zscore in place of measurement.
+        A 1-D zscore gives one target per child; a 2-D zscore is broadcast
+        against the children as rows, so e.g. [[-2, 0]] gives the -2 SD
+        and median measurement of every child, as an (n, 2) array.
+        Returns a dict of arrays of that shape:
+
+            measurement -- target measurement, NaN if there is none
+            valid       -- True where a measurement was calculated
+            error       -- reason a measurement was not calculated
+        """
+        indicator = indicator.lower()
+        assert indicator in INDICATORS
+        z = np.asarray(zscore, dtype=np.float64)
+        age = _to_float(age_in_months)
+        sexes, sex_ok = helpers.get_good_sexes(sex)
+        h = _to_float(height) if height is not None else np.array([np.nan])
+        n = max(len(age), len(np.atleast_1d(sexes)), len(h),
+                z.size if z.ndim <= 1 else 0)
+        age = np.broadcast_to(age, (n,))
+        sexes = np.broadcast_to(sexes, (n,))
+        sex_ok = np.broadcast_to(sex_ok, (n,))
+        h = np.broadcast_to(h, (n,))
+
+        row_error = np.zeros(n, dtype=np.int8)
+        _mark(row_error, np.isnan(age) | ~sex_ok, MISSING_INPUT)
+        L, M, S = self._lookup(indicator, age, sexes, h, row_error)
+
+        if z.ndim <= 1:
+            z = np.broadcast_to(z, (n,))
+        else:
+            # one column per z-score target
+            L, M, S, row_error = (L[:, None], M[:, None], S[:, None],
+                                  row_error[:, None])
+            z = np.broadcast_to(z, np.broadcast(z, L).shape)
+        error = np.broadcast_to(row_error, z.shape).copy()
+        _mark(error, np.isnan(z), MISSING_INPUT)
+
+        y = self._unadjust_measurement(indicator,
+                                       self._inverse_lms(indicator, z, L, M, S))
+        with np.errstate(invalid='ignore'):
+            _mark(error, ~(y > 0), INVALID_MEASUREMENT)
+        valid = error == OK
+        y = np.where(valid, y, np.nan)
+        if decimals is not None:
+            y = np.round(y, decimals)
+        return {'measurement': y, 'valid': valid, 'error': error}
+
+    def _lookup(self, indicator, age, sexes, h, error):
+        """ L, M and S arrays for every row, recording rows whose
+        table cannot be resolved or has no entry in error """
+        tables, table_code, index = self._resolve(indicator, age, h, error)
+        return self._gather(tables, sexes, table_code, index, error)
+
+    def _planned_lookup(self, indicator, age, sexes, h, error):
+        """ _lookup that gathers L, M and S once per distinct table
+        row, in table order, and copies them back to the rows.
+        Also returns the BatchPlan. """
+        tables, table_code, index = self._resolve(indicator, age, h, error)
+        plan = BatchPlan([sexes == 'F', table_code, index], error == OK)
+        girls, table_code, index = plan.keys
+        unique_error = np.zeros(plan.unique, dtype=np.int8)
+        L, M, S = self._gather(tables, np.where(girls, 'F', 'M'),
+                               table_code, index, unique_error)
+        n = len(error)
+        error[plan.rows] = unique_error[plan.inverse]
+        return (plan.scatter(L, n, np.nan), plan.scatter(M, n, np.nan),
+                plan.scatter(S, n, np.nan), plan)
+
+    def _resolve(self, indicator, age, h, error):
+        """ Candidate tables, the table used by each row and its
+        table index (see _resolve_by_height and _resolve_by_age) """
+        with np.errstate(invalid='ignore'):
+            if indicator in ('wfl', 'wfh'):
+                return self._resolve_by_height(indicator, h, error)
+            return self._resolve_by_age(indicator, age, error)
+
+    def _gather(self, tables, sexes, table_code, index, error):
+        """ L, M and S of rows without errors from their resolved
+        tables; rows with no table entry get DATA_NOT_FOUND """
+        n = len(error)
+        L = np.full(n, np.nan)
+        M = np.full(n, np.nan)
+        S = np.full(n, np.nan)
+        pending = error == OK
+        for table_sex, of_sex in (('boys', sexes == 'M'),
+                                  ('girls', sexes == 'F')):
+            for code, (table_indicator, table_age) in enumerate(tables):
+                rows = pending & of_sex & (table_code == code)
+                if not rows.any():
+                    continue
+                table = self.table("%s_%s_%s" % (table_indicator, table_sex,
+                                                 table_age))
+                if table is None:
+                    _mark(error, rows, DATA_NOT_FOUND)
+                    continue
+                L[rows], M[rows], S[rows] = table.lookup(index[rows])
+
+        _mark(error, np.isnan(M), DATA_NOT_FOUND)
+        return L, M, S
+
+    def _adjust_measurement(self, indicator, y):
+        """ Indicator-specific adjustments to the measurement,
+        as in Calculator.zscore_for_measurement """
+        with np.errstate(invalid='ignore'):
+            if indicator == "wfl":
+                # subtract 0.7cm from length measurements in this range
+                # to adjust for child's reclined position
+                return np.where((y > 65.7) & (y < 120.7), y - 0.7, y)
+        if indicator == "wfh" and self.calculator.adjust_height_data:
+            return y + 0.7
+        return y
+
+    def _unadjust_measurement(self, indicator, y):
+        """ Undo _adjust_measurement, for inverse calculations """
+        with np.errstate(invalid='ignore'):
+            if indicator == "wfl":
+                unadjusted = y + 0.7
+                return np.where((unadjusted > 65.7) & (unadjusted < 120.7),
+                                unadjusted, y)
+        if indicator == "wfh" and self.calculator.adjust_height_data:
+            return y - 0.7
+        return y
+
+    def _resolve_by_height(self, indicator, h, error):
+        """ Vectorized Observation.resolve_table and get_zscores for
+        weight-for-length/height. Returns the candidate tables as
+        (indicator, age) pairs, the candidate used by each row, and
+        the table index (in half centimeters) of each row. """
+        _mark(error, np.isnan(h), INVALID_MEASUREMENT)
+        _mark(error, h < 45, INVALID_MEASUREMENT)
+        _mark(error, h > 120, INVALID_MEASUREMENT)
+        # recumbent tables for short children, standing for tall ones
+        if indicator == 'wfl':
+            standing = h > 86
+        else:
+            standing = ~(h < 65)
+        # round height to closest half centimeter
+        index = np.floor(np.where(np.isnan(h), 0, h) * 2 + 0.5)
+        return ([('wfl', '0_2'), ('wfh', '2_5')], standing.astype(np.int64),
+                index.astype(np.int64))
+
+    def _resolve_by_age(self, indicator, age, error):
+        """ Vectorized Observation.resolve_table and get_zscores for
+        age-based indicators. Returns the same as _resolve_by_height,
+        with table indexes in weeks or months. """
+        american = self.calculator.include_cdc
+        age = np.where(np.isnan(age), 0, age)
+        weeks = (age * 30.4374) / 7
+        by_week = weeks <= 13
+        if indicator in ("wfa", "lhfa", "hcfa"):
+            table_age = np.where((age <= 3) & by_week, WEEKS, MONTHS_0_5)
+            if american:
+                older = age >= 24
+                if indicator == "hcfa":
+                    _mark(error, older, INVALID_AGE)
+                table_age = np.where(older, MONTHS_2_20, table_age)
+        else:
+            _mark(error, age > 240, INVALID_AGE)
+            table_age = np.select(
+                [(age <= 3) & by_week, age < 24, age <= 60],
+                [WEEKS, MONTHS_0_2, MONTHS_2_5], MONTHS_2_20)
+        index = np.floor(np.where(by_week, weeks, age))
+        tables = [(indicator, table_age_name) for table_age_name in TABLE_AGES]
+        return tables, table_age, index.astype(np.int64)
+
+    def _lms(self, indicator, y, L, M, S):
+        """ Box-Cox z-score, with the restricted application of the
+        LMS method for weight-based indicators if the calculator
+        adjusts weight scores (see Calculator.zscore_for_measurement) """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = (np.power(y / M, L) - 1) / (S * L)
+            if (not self.calculator.adjust_weight_scores or
+                    indicator not in ("wfl", "wfh", "wfa")):
+                return z
+
+            def stdev(sd):
+                return M * np.power(1 + L * S * sd, 1 / L)
+
+            sd3pos = stdev(3)
+            sd3neg = stdev(-3)
+            above = 3 + (y - sd3pos) / (sd3pos - stdev(2))
+            below = -3 + (y - sd3neg) / (stdev(-2) - sd3neg)
+            return np.where(z > 3, above, np.where(z < -3, below, z))
+
+    def _inverse_lms(self, indicator, z, L, M, S):
+        """ Measurements at z-scores z: the closed-form inverse of _lms """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            def stdev(sd):
+                return M * np.power(1 + L * S * sd, 1 / L)
+
+            y = stdev(z)
+            if (not self.calculator.adjust_weight_scores or
+                    indicator not in ("wfl", "wfh", "wfa")):
+                return y
+            sd3pos = stdev(3)
+            sd3neg = stdev(-3)
+            above = sd3pos + (z - 3) * (sd3pos - stdev(2))
+            below = sd3neg + (z + 3) * (stdev(-2) - sd3neg)
+            return np.where(z > 3, above, np.where(z < -3, below, y))
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _to_float(values):
+    """ Convert a column to a float array, with blanks and values that are
+    not numbers (e.g. 'n/a') as NaN """
+    array = np.asarray(values)
+    if array.dtype.kind in 'fiub':
+        return array.astype(np.float64).ravel()
+    array = array.ravel().astype(object)
+    blank = np.array([v is None or (isinstance(v, six.string_types) and not v.strip())
+                      for v in array], dtype=bool)
+    array[blank] = 'nan'
+    try:
+        return array.astype(np.float64)
+    except (TypeError, ValueError):
+        # one dirty cell should not fail the whole column
+        return np.array([_parse_float(v) for v in array], dtype=np.float64)
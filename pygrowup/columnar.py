@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# vim: ai ts=4 sts=4 et sw=4
+"""
+Columnar binary output for bulk results (z-scores, flags, centiles),
+so large result sets can be reloaded without parsing:
+
+- a directory of .npy files, one per column, which np.load can memory
+  map (read_columns), written in chunks by ColumnWriter;
+- a single .npz archive (write_npz / read_npz);
+- Arrow IPC (Feather) and Parquet files, if pyarrow is installed.
+
+    python -m pygrowup.columnar survey.csv results/ --indicators wfa,lhfa \\
+        --age agemons --sex GENDER --weight WEIGHT --height HEIGHT
+"""
+import os
+import sys
+import csv
+import json
+import codecs
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from . import batch
+
+
+MANIFEST_NAME = 'columns.json'
+
+# every .npy header is padded to this size, so it can be rewritten with
+# the final number of rows once the data has been streamed
+NPY_HEADER_SIZE = 128
+
+# rows per chunk when converting a CSV file
+CHUNK_ROWS = 50000
+
+
+def _npy_header(dtype, rows):
+    """ .npy (version 1.0) header of a 1-D array, NPY_HEADER_SIZE bytes """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(dtype), rows)
+    prefix = np.lib.format.MAGIC_PREFIX + b'\x01\x00'
+    padding = NPY_HEADER_SIZE - len(prefix) - 2 - len(header) - 1
+    if padding < 0:
+        raise ValueError('column header too long: %s' % header)
+    header = (header + ' ' * padding + '\n').encode('latin-1')
+    return prefix + np.array(len(header), '<u2').tobytes() + header
+
+
+class ColumnWriter(object):
+    """ Streams chunks of columns to one .npy file per column.
+
+        with ColumnWriter('results') as writer:
+            for chunk in chunks:
+                writer.write({'z_wfa': ..., 'flag_wfa': ...})
+
+    The first chunk fixes the column names and types. close() writes
+    columns.json, listing columns, types and the number of rows. """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.rows = 0
+        self._files = None
+        self._dtypes = None
+
+    def write(self, columns):
+        columns = dict((name, np.ascontiguousarray(values).ravel())
+                       for name, values in columns.items())
+        lengths = set(len(values) for values in columns.values())
+        if len(lengths) > 1:
+            raise ValueError('columns of a chunk differ in length')
+        if self._files is None:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            self._dtypes = dict((name, values.dtype)
+                                for name, values in columns.items())
+            self._files = {}
+            for name, dtype in self._dtypes.items():
+                f = open(os.path.join(self.directory, name + '.npy'), 'wb')
+                f.write(_npy_header(dtype, 0))
+                self._files[name] = f
+        if set(columns) != set(self._files):
+            raise ValueError('chunk columns differ from the first chunk')
+        for name, values in columns.items():
+            if values.dtype.kind == 'O':
+                raise ValueError('%s: object columns cannot be written' % name)
+            self._files[name].write(
+                values.astype(self._dtypes[name], copy=False).tobytes())
+        self.rows += lengths.pop() if lengths else 0
+
+    def close(self):
+        manifest = {'rows': self.rows, 'columns': {}}
+        for name, f in (self._files or {}).items():
+            f.seek(0)
+            f.write(_npy_header(self._dtypes[name], self.rows))
+            f.close()
+            manifest['columns'][name] = self._dtypes[name].str
+        self._files = {}
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with open(os.path.join(self.directory, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_columns(directory, columns):
+    """ Write a dict of 1-D arrays as a directory of .npy columns """
+    with ColumnWriter(directory) as writer:
+        writer.write(columns)
+    return writer.rows
+
+
+def read_columns(directory, mmap=True):
+    """ Columns written by ColumnWriter, memory mapped by default """
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    mode = 'r' if mmap else None
+    return dict((name, np.load(os.path.join(directory, name + '.npy'),
+                               mmap_mode=mode))
+                for name in sorted(manifest['columns']))
+
+
+def write_npz(path, columns, compress=False):
+    """ Write a dict of arrays as one .npz archive """
+    save = np.savez_compressed if compress else np.savez
+    with open(path, 'wb') as f:
+        save(f, **columns)
+
+
+def read_npz(path):
+    with np.load(path) as archive:
+        return dict((name, archive[name]) for name in archive.files)
+
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise ImportError('pyarrow is required for Arrow and Parquet output')
+
+
+def _table(columns):
+    return pyarrow.table(dict((name, np.asarray(values))
+                              for name, values in columns.items()))
+
+
+def write_arrow(path, columns):
+    """ Arrow IPC (Feather v2) file, uncompressed so it can be memory
+    mapped by read_arrow """
+    _require_pyarrow()
+    pyarrow.feather.write_feather(_table(columns), path,
+                                  compression='uncompressed')
+
+
+def read_arrow(path):
+    """ Columns of an Arrow IPC file as numpy arrays, without copying
+    when a column has no nulls """
+    _require_pyarrow()
+    table = pyarrow.feather.read_table(path, memory_map=True)
+    return dict((name, table.column(name).to_numpy())
+                for name in table.column_names)
+
+
+def write_parquet(path, columns, compression='snappy'):
+    _require_pyarrow()
+    pyarrow.parquet.write_table(_table(columns), path,
+                                compression=compression)
+
+
+def read_parquet(path):
+    _require_pyarrow()
+    table = pyarrow.parquet.read_table(path, memory_map=True)
+    return dict((name, table.column(name).to_numpy())
+                for name in table.column_names)
+
+
+def result_columns(results, centiles=True):
+    """ Flatten {indicator: BatchCalculator.zscores result} into
+    columns z_<indicator>, flag_<indicator>, error_<indicator> and,
+    if present, centile_<indicator> """
+    columns = {}
+    for indicator, result in results.items():
+        columns['z_' + indicator] = np.asarray(result['zscore'],
+                                               dtype=np.float64)
+        columns['flag_' + indicator] = result['flag']
+        columns['error_' + indicator] = result['error']
+        if centiles and 'centile' in result:
+            columns['centile_' + indicator] = result['centile']
+    return columns
+
+
+# input column used as the measurement of each indicator
+MEASUREMENTS = {
+    'wfa': 'weight', 'wfl': 'weight', 'wfh': 'weight',
+    'lhfa': 'height', 'bmifa': 'bmi', 'hcfa': 'head',
+}
+
+
+def _chunks(path, size):
+    with codecs.open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        reader = csv.DictReader(f)
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows) == size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+
+def convert_csv(source, directory, indicators, names, engine=None,
+                chunk_rows=CHUNK_ROWS, decimals=None):
+    """ Score a CSV file chunk by chunk and stream z-scores, flags,
+    errors and centiles to a directory of .npy columns. names maps
+    age, sex, weight, height, head and bmi to CSV columns. """
+    engine = engine or batch.BatchCalculator()
+    with ColumnWriter(directory) as writer:
+        for rows in _chunks(source, chunk_rows):
+            def column(key):
+                name = names.get(key)
+                return [row[name] for row in rows] if name else None
+            results = {}
+            for indicator in indicators:
+                measurement = column(MEASUREMENTS[indicator])
+                if measurement is None:
+                    raise ValueError('%s needs a %s column' %
+                                     (indicator, MEASUREMENTS[indicator]))
+                height = (column('height') if indicator in ('wfl', 'wfh')
+                          else None)
+                results[indicator] = engine.zscores(
+                    indicator, measurement, column('age'), column('sex'),
+                    height, decimals=decimals, centiles=True)
+            writer.write(result_columns(results))
+    return writer.rows
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Score a CSV file into .npy result columns')
+    parser.add_argument('source')
+    parser.add_argument('directory')
+    parser.add_argument('--indicators', default='wfa,lhfa,wfl')
+    for key in ('age', 'sex', 'weight', 'height', 'head', 'bmi'):
+        parser.add_argument('--' + key)
+    parser.add_argument('--include-cdc', action='store_true')
+    args = parser.parse_args()
+    names = dict((key, getattr(args, key)) for key in
+                 ('age', 'sex', 'weight', 'height', 'head', 'bmi'))
+    if not names['age'] or not names['sex']:
+        sys.exit('--age and --sex are required')
+    engine = batch.BatchCalculator(include_cdc=args.include_cdc)
+    rows = convert_csv(args.source, args.directory,
+                       args.indicators.split(','), names, engine)
+    print('%d rows written to %s' % (rows, args.directory))
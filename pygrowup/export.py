@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# vim: ai ts=4 sts=4 et sw=4
+"""
+Export pygrowup reference tables for use outside Python, e.g. by the
+JavaScript implementation in static/js/anthro.js, and the reference
+curves (-3 to +3 SD) as static assets for charts.
+
+    python -m pygrowup.export static/data
+"""
+import os
+import sys
+import json
+import hashlib
+
+import numpy as np
+
+from . import __version__
+from .batch import PackedTable
+from .pygrowup import Calculator
+
+
+# bump when the layout of the bundle changes
+BUNDLE_FORMAT = 1
+# the bundle is written as pygrowup-tables.<hash>.json
+BUNDLE_PREFIX = 'pygrowup-tables'
+MANIFEST_NAME = 'manifest.json'
+
+# columns of every reference curve, lowest first
+CURVE_COLUMNS = ('SD3neg', 'SD2neg', 'SD1neg', 'SD0', 'SD1', 'SD2', 'SD3')
+
+
+def _table_names(calculator):
+    return sorted(name for name, value in vars(calculator).items()
+                  if isinstance(value, dict) and 'field_name' in value)
+
+
+def _column(values):
+    """ Dense column as a list, with missing rows as None """
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+def _dumps(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _write(path, text):
+    """ Write text to path through a temporary file, so other processes
+    never read a partly written file """
+    temporary = '%s.%d.tmp' % (path, os.getpid())
+    with open(temporary, 'w') as f:
+        f.write(text)
+    getattr(os, 'replace', os.rename)(temporary, path)
+
+
+def build_bundle(calculator=None):
+    """ Compact, versioned bundle of every table loaded by a calculator
+    (WHO and CDC by default), as dense L, M and S arrays. Row i of a
+    table is for key (offset + i) * step, where keys are weeks, months
+    or centimeters depending on field. """
+    if calculator is None:
+        calculator = Calculator(include_cdc=True)
+    tables = {}
+    for name in _table_names(calculator):
+        table = getattr(calculator, name)
+        packed = PackedTable(table)
+        tables[name] = {
+            'field': table['field_name'],
+            'offset': packed.offset,
+            'step': packed.step,
+            'L': _column(packed.L),
+            'M': _column(packed.M),
+            'S': _column(packed.S),
+        }
+    return {
+        'format': BUNDLE_FORMAT,
+        'version': __version__,
+        'hash': _digest(_dumps(tables)),
+        'tables': tables,
+    }
+
+
+def build_curves(calculator=None):
+    """ Reference curves of every table loaded by a calculator, as a dict
+    of table name to {'field': ..., 'x': [...], 'SD3neg': [...], ...}.
+    Values are the SD columns published with the tables, sorted by x
+    (weeks, months or centimeters, depending on field). """
+    if calculator is None:
+        calculator = Calculator(include_cdc=True)
+    curves = {}
+    for name in _table_names(calculator):
+        table = getattr(calculator, name)
+        field_name = table['field_name']
+        rows = sorted((v for k, v in table.items() if k != 'field_name'),
+                      key=lambda row: float(row[field_name]))
+        curve = {'field': field_name,
+                 'x': [float(row[field_name]) for row in rows]}
+        for column in CURVE_COLUMNS:
+            curve[column] = [float(row[column]) for row in rows]
+        curves[name] = curve
+    return curves
+
+
+def write_curves(directory, calculator=None):
+    """ Write one JSON file per reference curve into directory, named
+    with a hash of its contents so it can be cached forever, plus a
+    manifest of table name to file name, which is always rewritten.
+    Returns the manifest. """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    files = {}
+    for name, curve in sorted(build_curves(calculator).items()):
+        body = _dumps(curve)
+        filename = '%s.%s.json' % (name, _digest(body))
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            _write(path, body)
+        files[name] = filename
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'version': __version__,
+        'hash': _digest(_dumps(files)),
+        'columns': list(CURVE_COLUMNS),
+        'files': files,
+    }
+    _write(os.path.join(directory, MANIFEST_NAME), _dumps(manifest))
+    return manifest
+
+
+def write_bundle(directory, calculator=None):
+    """ Write the bundle into directory, named with a hash of its
+    contents so it can be cached forever, returning its path. Tables that
+    change give a new name; a file of the same name is left as it is. """
+    body = _dumps(build_bundle(calculator))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, '%s.%s.json' % (BUNDLE_PREFIX,
+                                                   _digest(body)))
+    if not os.path.exists(path):
+        _write(path, body)
+    return path
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else '.'
+    print(write_bundle(target))
+    manifest = write_curves(os.path.join(target, 'curves'))
+    print('%d curves, manifest %s' % (len(manifest['files']),
+                                      manifest['hash']))
@@ -2,16 +2,25 @@ import re
 import datetime
 import logging
 
+import numpy as np
+
+
+DATE_DELIMITERS = re.compile(r"[./\\-]+")
+MALE_PATTERN = re.compile("(m[a-z]*)", re.I)
+FEMALE_PATTERN = re.compile("(f[a-z]*)", re.I)
+
+# average number of days in a month
+DAYS_PER_MONTH = 30.4375
+
 
 def get_good_date(date, delimiter=False):
     # TODO parameter to choose formating
     # e.g., DDMMYY vs YYMMDD etc
     logging.debug('getting good date...')
     logging.debug(date)
-    delimiters = r"[./\\-]+"
     if delimiter:
         # expecting DDMMYY
-        Allsect = re.split(delimiters, date)
+        Allsect = DATE_DELIMITERS.split(date)
     else:
         logging.debug('no delimiter')
         if len(date) == 6:
@@ -82,10 +91,8 @@ def get_good_date(date, delimiter=False):
 
 def get_good_sex(gender):
     # TODO improve patterns so 'monkey' isnt a match for 'male'
-    male_pattern = "(m[a-z]*)"
-    female_pattern = "(f[a-z]*)"
-    its_a_boy = re.match(male_pattern, gender, re.I)
-    its_a_girl = re.match(female_pattern, gender, re.I)
+    its_a_boy = MALE_PATTERN.match(gender)
+    its_a_girl = FEMALE_PATTERN.match(gender)
     if its_a_boy is not None:
         return 'M'
     elif its_a_girl is not None:
@@ -95,8 +102,12 @@ def get_good_sex(gender):
         return None
 
 
-def date_to_age_in_months(date):
-    delta = datetime.date.today() - date
+def date_to_age_in_months(date, reference=None):
+    # measure against reference (e.g., date of measurement)
+    # when given, otherwise against today
+    if reference is None:
+        reference = datetime.date.today()
+    delta = reference - date
     #years = delta.days / 365.25
     return str(int(delta.days / 30.4375))
 
@@ -116,3 +127,102 @@ def age_to_estimated_bday(age_in_months):
             return None
     except Exception as e:
         logging.info(e)
+
+
+# Batch versions of the above, for whole survey columns at once.
+# Each distinct raw value is parsed only once, results are returned
+# as numpy arrays, and values that could not be understood are
+# reported in a boolean mask instead of as None or (None, None).
+
+def _split_date(value, delimiter):
+    """ Split a raw date string into (day, month, year) strings,
+    following the same layout rules as get_good_date """
+    if delimiter:
+        parts = DATE_DELIMITERS.split(value)
+        if len(parts) < 3:
+            return None
+        return parts[0], parts[1], parts[2]
+    if len(value) in (6, 8):
+        # assume DDMMYY or DDMMYYYY
+        return value[:2], value[2:4], value[4:]
+    if len(value) == 4:
+        # assume DMYY
+        return value[0], value[1], value[2:]
+    # reject ambiguous dates
+    return None
+
+
+def get_good_dates(dates, delimiter=False):
+    """ Batch version of get_good_date. Returns a tuple of
+    (datetime64[D] array, valid mask); invalid dates are NaT. """
+    raw = np.asarray(dates).ravel().astype(str)
+    uniques, inverse = np.unique(raw, return_inverse=True)
+
+    n = len(uniques)
+    day = np.zeros(n, dtype=np.int64)
+    month = np.zeros(n, dtype=np.int64)
+    year = np.zeros(n, dtype=np.int64)
+    parsed = np.zeros(n, dtype=bool)
+    for i, value in enumerate(uniques):
+        sections = _split_date(value, delimiter)
+        if sections is None:
+            continue
+        d, m, y = sections
+        if not (d.isdigit() and m.isdigit() and y.isdigit()):
+            # if there are letters in the date, give up
+            continue
+        day[i] = int(d)
+        month[i] = int(m)
+        # add leading digits if they are missing
+        year[i] = int(y) if len(y) >= 4 else int("20%s" % y)
+        parsed[i] = True
+
+    # make sure we have a REAL day
+    day = np.where((month == 2) & (day > 28), 28, day)
+    day = np.where(np.isin(month, (4, 6, 9, 11)) & (day > 30), 30, day)
+    valid = (parsed & (month >= 1) & (month <= 12) & (day >= 1) &
+             (day <= 31) & (year >= 1) & (year <= 9999))
+
+    months_since_epoch = np.where(valid, (year - 1970) * 12 + month - 1, 0)
+    good = (months_since_epoch.astype('datetime64[M]').astype('datetime64[D]') +
+            np.where(valid, day - 1, 0).astype('timedelta64[D]'))
+    good[~valid] = np.datetime64('NaT')
+    return good[inverse], valid[inverse]
+
+
+def get_good_sexes(genders, numeric_codes=True):
+    """ Batch version of get_good_sex. Returns a tuple of ('M', 'F' or
+    '') array and valid mask. With numeric_codes, the WHO coding of
+    1 for boys and 2 for girls is also understood. """
+    raw = np.asarray(genders).ravel()
+    if raw.dtype.kind in 'iuf':
+        # numeric codes only, no string handling needed
+        if not numeric_codes:
+            return np.full(len(raw), ''), np.zeros(len(raw), dtype=bool)
+        boys = raw == 1
+        girls = raw == 2
+        return np.where(boys, 'M', np.where(girls, 'F', '')), boys | girls
+    values = np.char.lower(np.char.strip(raw.astype(str)))
+    first = values.astype('<U1')
+    boys = first == 'm'
+    girls = first == 'f'
+    if numeric_codes:
+        boys |= np.isin(values, ('1', '1.0'))
+        girls |= np.isin(values, ('2', '2.0'))
+    sexes = np.where(boys, 'M', np.where(girls, 'F', ''))
+    return sexes, boys | girls
+
+
+def dates_to_ages_in_months(dates, reference, whole_months=False):
+    """ Batch version of date_to_age_in_months. Ages are measured
+    against reference, which is either a single date or an array of
+    measurement dates, so results are reproducible. Returns a tuple of
+    (float array of ages, valid mask); invalid ages are NaN. """
+    born = np.asarray(dates, dtype='datetime64[D]').ravel()
+    measured = np.asarray(reference, dtype='datetime64[D]')
+    days = (measured - born).astype(np.float64)
+    valid = ~np.isnat(born) & ~np.isnat(measured) & (days >= 0)
+    ages = np.where(valid, days, np.nan) / DAYS_PER_MONTH
+    if whole_months:
+        ages = np.floor(ages)
+    return ages, valid
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# vim: ai ts=4 sts=4 et sw=4
+import bisect
+import datetime
+import math
+
+from . import exceptions
+
+
+# average number of days in a month, as used for ages elsewhere
+DAYS_PER_MONTH = 30.4375
+
+# weight-for-length tables are used before 24 months,
+# weight-for-height tables afterwards
+WFL_MAX_AGE = 24
+
+
+def to_date(value):
+    """ Accept a datetime.date, datetime.datetime or ISO
+    (YYYY-MM-DD) string and return a datetime.date """
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    year, month, day = value.strip()[:10].split('-')
+    return datetime.date(int(year), int(month), int(day))
+
+
+class RunningStats(object):
+    """ Welford's online mean/variance, plus min and max. """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def push(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    @property
+    def stdev(self):
+        if self.count < 2:
+            return None
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def as_dict(self):
+        if not self.count:
+            return None
+        return {'count': self.count, 'mean': self.mean, 'sd': self.stdev,
+                'min': self.minimum, 'max': self.maximum}
+
+
+class GrowthRecord(object):
+    """ Running state for one child's measurement history.
+
+    Points appended in date order are folded into the state in constant
+    time: z-scores are calculated for the new point only, and velocity
+    statistics are updated from the previous point. Inserting a point
+    before the latest one or replacing a point rebuilds the velocity
+    statistics from the stored points; changing the calculator (or its
+    options) also recalculates every stored z-score. """
+
+    def __init__(self, calculator=None, sex=None, dob=None):
+        self.calculator = calculator
+        self.sex = sex.upper() if sex else None
+        self.dob = to_date(dob) if dob else None
+        self._signature = self._current_signature()
+
+        # chart data series, kept in date order
+        self.dates = []
+        self.ordinals = []
+        self.ages = []
+        self.weights = []
+        self.heights = []
+        self.zscores = []
+
+        self._reset_stats()
+        # number of times state was rebuilt rather than updated in place
+        self.rebuilds = 0
+
+    def _current_signature(self):
+        if self.calculator is None:
+            return None
+        return (id(self.calculator), self.calculator.options)
+
+    def _reset_stats(self):
+        # velocities between consecutive points, per month
+        self.weight_velocity = RunningStats()
+        self.height_velocity = RunningStats()
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _age_in_months(self, when):
+        if self.dob is None:
+            return None
+        return (when - self.dob).days / DAYS_PER_MONTH
+
+    def _score(self, age, weight, height):
+        """ Calculate z-scores for a single point, skipping any
+        indicator that is missing input or out of table range. """
+        scores = {}
+        if self.calculator is None or self.sex is None or age is None:
+            return scores
+        wfx = 'wfl' if age < WFL_MAX_AGE else 'wfh'
+        wanted = (('wfa', weight, None), ('lhfa', height, None),
+                  (wfx, weight, height))
+        for indicator, measurement, height_arg in wanted:
+            if measurement is None:
+                continue
+            if indicator == wfx and height_arg is None:
+                continue
+            try:
+                scores[indicator] = self.calculator.zscore_for_measurement(
+                    indicator, measurement, age, self.sex, height_arg)
+            except (exceptions.InvalidMeasurement, exceptions.InvalidAge,
+                    exceptions.DataNotFound, exceptions.DataError):
+                scores[indicator] = None
+        return scores
+
+    def _push_interval(self, i):
+        """ Fold the interval ending at point i into velocity stats """
+        months = (self.ordinals[i] - self.ordinals[i - 1]) / DAYS_PER_MONTH
+        for values, stats in ((self.weights, self.weight_velocity),
+                              (self.heights, self.height_velocity)):
+            if values[i] is not None and values[i - 1] is not None:
+                stats.push((values[i] - values[i - 1]) / months)
+
+    def _rebuild(self, rescore=False):
+        self._reset_stats()
+        for i in range(1, len(self.dates)):
+            self._push_interval(i)
+        if rescore:
+            self.zscores = [self._score(age, w, h) for age, w, h in
+                            zip(self.ages, self.weights, self.heights)]
+        self.rebuilds += 1
+
+    def set_calculator(self, calculator):
+        self.calculator = calculator
+        self.refresh()
+
+    def refresh(self):
+        """ Recalculate z-scores if the calculator or its options
+        have changed since they were last calculated. """
+        signature = self._current_signature()
+        if signature != self._signature:
+            self._signature = signature
+            self._rebuild(rescore=True)
+
+    def add(self, date, weight=None, height=None):
+        """ Add a measurement. Returns False if an identical
+        measurement for this date was already recorded. """
+        self.refresh()
+        when = to_date(date)
+        ordinal = when.toordinal()
+        weight = float(weight) if weight not in ['', ' ', None] else None
+        height = float(height) if height not in ['', ' ', None] else None
+        age = self._age_in_months(when)
+
+        i = bisect.bisect_left(self.ordinals, ordinal)
+        if i < len(self.ordinals) and self.ordinals[i] == ordinal:
+            if (self.weights[i], self.heights[i]) == (weight, height):
+                return False
+            # replace existing measurement for this date
+            self.weights[i] = weight
+            self.heights[i] = height
+            self.zscores[i] = self._score(age, weight, height)
+            self._rebuild()
+            return True
+
+        self.dates.insert(i, when)
+        self.ordinals.insert(i, ordinal)
+        self.ages.insert(i, age)
+        self.weights.insert(i, weight)
+        self.heights.insert(i, height)
+        self.zscores.insert(i, self._score(age, weight, height))
+        if i == len(self.dates) - 1:
+            # appended in order -- constant time update
+            if i > 0:
+                self._push_interval(i)
+        else:
+            self._rebuild()
+        return True
+
+    def extend(self, points):
+        """ Add many points, each a dict with date, weight and height """
+        added = 0
+        for point in sorted(points, key=lambda p: str(p['date'])):
+            if self.add(point['date'], point.get('weight'),
+                        point.get('height')):
+                added += 1
+        return added
+
+    def remove(self, date):
+        """ Remove the measurement for a date. Returns False if
+        there is none. """
+        ordinal = to_date(date).toordinal()
+        i = bisect.bisect_left(self.ordinals, ordinal)
+        if i == len(self.ordinals) or self.ordinals[i] != ordinal:
+            return False
+        for values in (self.dates, self.ordinals, self.ages, self.weights,
+                       self.heights, self.zscores):
+            del values[i]
+        self._rebuild()
+        return True
+
+    def replace(self, points):
+        """ Make the history exactly points (dicts as for extend).
+        Stored points not in points are removed; points already stored
+        with the same values are kept as they are, so resending a
+        history with one new point at the end is a constant time
+        update. Returns the number of points added, changed or removed. """
+        wanted = set(to_date(p['date']).toordinal() for p in points)
+        keep = [i for i, ordinal in enumerate(self.ordinals)
+                if ordinal in wanted]
+        removed = len(self.ordinals) - len(keep)
+        if removed:
+            for name in ('dates', 'ordinals', 'ages', 'weights', 'heights',
+                         'zscores'):
+                values = getattr(self, name)
+                setattr(self, name, [values[i] for i in keep])
+            self._rebuild()
+        return removed + self.extend(points)
+
+    @property
+    def period_in_months(self):
+        if len(self.ordinals) < 2:
+            return 0.0
+        return (self.ordinals[-1] - self.ordinals[0]) / DAYS_PER_MONTH
+
+    def overall_velocity(self, values):
+        """ Velocity per month between the first and latest point """
+        months = self.period_in_months
+        if months <= 0 or values[0] is None or values[-1] is None:
+            return None
+        return (values[-1] - values[0]) / months
+
+    @property
+    def latest_zscores(self):
+        if not self.zscores:
+            return {}
+        return self.zscores[-1]
+
+    def velocity_zscores(self, engine):
+        """ z-scores of the weight (wv) and length (lv) increments of
+        every consecutive interval, from a velocity.VelocityCalculator.
+        Kinds without tables are left out, and nothing is scored
+        without a sex and date of birth. """
+        if self.sex is None or self.dob is None or len(self.dates) < 2:
+            return {}
+        scores = {}
+        for kind, values in (('wv', self.weights), ('lv', self.heights)):
+            if engine.intervals(kind, self.sex):
+                scores[kind] = engine.zscores(kind, self.sex, self.ages,
+                                              values)
+        return scores
+
+    def series(self):
+        """ Chart data series for the whole history """
+        return {
+            'dates': [d.isoformat() for d in self.dates],
+            'ages': list(self.ages),
+            'weights': list(self.weights),
+            'heights': list(self.heights),
+        }
+
+    def summary(self):
+        return {
+            'points': len(self.dates),
+            'period': self.period_in_months,
+            'weight_velocity': self.overall_velocity(self.weights),
+            'height_velocity': self.overall_velocity(self.heights),
+            'weight_intervals': self.weight_velocity.as_dict(),
+            'height_intervals': self.height_velocity.as_dict(),
+            'zscores': self.latest_zscores,
+        }
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# vim: ai ts=4 sts=4 et sw=4
+"""
+Parity of pygrowup with the WHO igrowup software on the survey corpus
+in testdata/survey_z_rc.csv, which includes the z-scores igrowup
+calculated for every child.
+
+    python -m pygrowup.parity [--tolerance 1] [--scalar] [corpus.csv]
+
+The corpus is read once and each indicator is scored for every row in
+one pass, by the batch engine or (with --scalar) by a single shared
+Calculator, so the whole corpus takes well under a second. It exits
+with status 1 if a row differs by more than the tolerance, other than
+the KNOWN_DEVIATIONS of the bundled corpus, or is not calculated.
+"""
+import os
+import sys
+import csv
+import codecs
+from collections import namedtuple
+
+import numpy as np
+
+from . import batch
+from .pygrowup import Calculator, module_dir
+
+
+CORPUS = os.path.join(module_dir, 'testdata', 'survey_z_rc.csv')
+
+# indicator -> (measurement column, igrowup z-score column, and whether
+# the height column is passed as the length/height)
+COLUMNS = {
+    'lhfa': ('HEIGHT', 'ZLEN', False),
+    'wfl': ('WEIGHT', 'ZWFL', True),
+    'wfh': ('WEIGHT', 'ZWFL', True),
+    'wfa': ('WEIGHT', 'ZWEI', False),
+    'bmifa': ('CBMI', 'ZBMI', False),
+}
+
+# rows left out of every comparison
+EXCLUDED_IDS = ('287', '381')
+
+# z-scores may differ by this much, as igrowup uses floating point
+# and exact ages in days
+TOLERANCE = 1
+
+# rows of the corpus that differ from igrowup by more than TOLERANCE:
+# lhfa in the first months (igrowup uses exact ages in days), and a wfa
+# below -3 SD, which igrowup scores with the restricted LMS method
+KNOWN_DEVIATIONS = {
+    'lhfa': ['136', '210', '397'],
+    'wfa': ['371'],
+}
+
+# compared -- rows with both an igrowup and a pygrowup z-score
+# max_deviation, mean_deviation -- absolute differences over those rows
+# mismatches -- ids of rows that differ by more than the tolerance
+# not_calculated -- ids of rows igrowup scored but pygrowup did not
+ParityResult = namedtuple('ParityResult', ['indicator', 'compared',
+                                           'max_deviation', 'mean_deviation',
+                                           'mismatches', 'not_calculated'])
+
+
+def load_corpus(path=CORPUS):
+    """ Columns of the corpus as lists, keyed by header (without the
+    leading underscore igrowup puts on calculated columns) """
+    with codecs.open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        rows = list(csv.DictReader(f))
+    names = list(rows[0]) if rows else []
+    return dict((name.lstrip('_'), [row[name] for row in rows])
+                for name in names)
+
+
+def _scalar_zscores(calculator, indicator, measurements, ages, sexes, heights):
+    """ z-scores from a shared Calculator, NaN where it raises """
+    zscores = np.full(len(measurements), np.nan)
+    for i, (measurement, age, sex) in enumerate(zip(measurements, ages, sexes)):
+        height = heights[i] if heights is not None else None
+        sex = {'1': 'M', '2': 'F'}.get(sex.strip(), sex)
+        try:
+            zscores[i] = float(calculator.zscore_for_measurement(
+                indicator, measurement, age, sex, height))
+        except Exception:
+            continue
+    return zscores
+
+
+def run(corpus=None, indicators=tuple(COLUMNS), tolerance=TOLERANCE,
+        calculator=None, scalar=False):
+    """ Compare pygrowup with igrowup for each indicator and return a
+    list of ParityResult. By default uses a calculator with the CDC
+    tables loaded, as the corpus includes older children, that only
+    logs errors. """
+    if corpus is None:
+        corpus = load_corpus()
+    if calculator is None:
+        calculator = Calculator(include_cdc=True, log_level='ERROR')
+    engine = batch.BatchCalculator(calculator)
+    ids = np.array(corpus['id'])
+    included = ~np.isin(ids, EXCLUDED_IDS)
+    results = []
+    for indicator in indicators:
+        measurement, result, uses_height = COLUMNS[indicator]
+        heights = corpus['HEIGHT'] if uses_height else None
+        if scalar:
+            ours = _scalar_zscores(calculator, indicator, corpus[measurement],
+                                   corpus['agemons'], corpus['GENDER'], heights)
+        else:
+            ours = engine.zscores(indicator, corpus[measurement],
+                                  corpus['agemons'], corpus['GENDER'],
+                                  heights)['zscore']
+        theirs = batch._to_float(corpus[result])
+        rows = included & ~np.isnan(theirs)
+        if uses_height:
+            # igrowup leaves out rows without a length/height
+            rows &= ~np.isnan(batch._to_float(heights))
+        compared = rows & ~np.isnan(ours)
+        deviation = np.abs(ours - theirs)[compared]
+        results.append(ParityResult(
+            indicator, int(compared.sum()),
+            float(deviation.max()) if len(deviation) else 0.0,
+            float(deviation.mean()) if len(deviation) else 0.0,
+            list(ids[compared][np.round(deviation, 6) > tolerance]),
+            list(ids[rows & np.isnan(ours)])))
+    return results
+
+
+def unexpected(result, known=KNOWN_DEVIATIONS):
+    """ Mismatched ids of a ParityResult that are not known deviations """
+    return [i for i in result.mismatches
+            if i not in known.get(result.indicator, [])]
+
+
+def report(results, out=sys.stdout, known=KNOWN_DEVIATIONS):
+    """ Known deviations are marked with a * """
+    out.write('%-6s %8s %8s %8s  %s\n' % ('', 'compared', 'max', 'mean',
+                                          'mismatched ids'))
+    for r in results:
+        ids = [i if i in unexpected(r, known) else i + '*'
+               for i in r.mismatches]
+        out.write('%-6s %8d %8.2f %8.3f  %s\n' % (
+            r.indicator, r.compared, r.max_deviation, r.mean_deviation,
+            ' '.join(ids) or '-'))
+        if r.not_calculated:
+            out.write('%-6s not calculated: %s\n' % (
+                '', ' '.join(r.not_calculated)))
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description='pygrowup / igrowup parity')
+    parser.add_argument('corpus', nargs='?', default=CORPUS)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--scalar', action='store_true',
+                        help='use Calculator instead of the batch engine')
+    args = parser.parse_args()
+    started = time.time()
+    results = run(load_corpus(args.corpus), tolerance=args.tolerance,
+                  scalar=args.scalar)
+    # the known deviations are rows of the bundled corpus
+    known = KNOWN_DEVIATIONS
+    if os.path.abspath(args.corpus) != os.path.abspath(CORPUS):
+        known = {}
+    report(results, known=known)
+    sys.stdout.write('%.2f s\n' % (time.time() - started))
+    sys.exit(1 if any(unexpected(r, known) or r.not_calculated
+                      for r in results) else 0)
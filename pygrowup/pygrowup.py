@@ -5,6 +5,9 @@ import math
 import decimal
 import logging
 import json
+import threading
+import time
+from collections import namedtuple, OrderedDict
 from decimal import Decimal as D
 
 import six
@@ -15,30 +18,63 @@ from . import exceptions
 # TODO is this the best way to get this file's directory?
 module_dir = os.path.split(os.path.abspath(__file__))[0]
 
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+# number of tables and rows loaded by a calculator, and how long it took
+TableLoadInfo = namedtuple('TableLoadInfo', ['tables', 'rows', 'seconds'])
+
+
+# Decimal constants used on every calculation, built once
+# rather than on each call
+ZERO = D(0)
+ONE = D(1)
+THREE = D(3)
+MINUS_THREE = D(-3)
+SEVEN = D(7)
+THIRTEEN = D(13)
+HALF = D('0.5')
+MINUS_HALF = D('-0.5')
+HUNDREDTH = D('.01')
+TENTH = D('.1')
+DAYS_PER_MONTH = D('30.4374')
+SHORTEST = D(45)
+TALLEST = D(120)
+RECLINED_ADJUSTMENT = D('0.7')
+RECLINED_MIN = D('65.7')
+RECLINED_MAX = D('120.7')
+
 
 class Observation(object):
+    # observations are created for every calculation,
+    # so avoid a per-instance __dict__
+    __slots__ = ('logger', 'context', 'indicator', 'measurement', 'position',
+                 'age', 'age_in_weeks', 'sex', 'height', 'height_value',
+                 'american')
+
     def __init__(self, indicator, measurement, age_in_months, sex,
-                 height, american, logger_name):
-        self.logger = logging.getLogger(logger_name)
+                 height, american, logger, context):
+        self.logger = logger
+        # decimal context of the calculator, so results do not depend
+        # on the context of whichever thread is doing the calculation
+        self.context = context
 
         self.indicator = indicator
         self.measurement = measurement
         self.position = None
         self.age = D(age_in_months)
+        self.age_in_weeks = context.divide(
+            context.multiply(self.age, DAYS_PER_MONTH), SEVEN)
         self.sex = sex.upper()
         self.height = height
         self.american = american
 
-        self.table_indicator = None
-        self.table_age = None
-        self.table_sex = None
+        # only weight-for-length/height use the height; other indicators
+        # ignore it, whatever it holds
+        self.height_value = None
         if self.indicator in ['wfl', 'wfh']:
             if self.height in ['', ' ', None]:
                 raise exceptions.InvalidMeasurement('no length or height')
-
-    @property
-    def age_in_weeks(self):
-        return ((self.age * D('30.4374')) / D(7))
+            self.height_value = D(self.height)
 
     @property
     def rounded_height(self):
@@ -48,12 +84,15 @@ class Observation(object):
             rounding is necessary (e.g., 89 not 89.0).
         """
         # round height to closest half centimeter
-        correction = D('0.5') if D(self.height) >= D(0) else D('-0.5')
-        rounded = int(D(self.height) / D('0.5') + correction) * D('0.5')
+        height = self.height_value
+        correction = HALF if height >= ZERO else MINUS_HALF
+        halves = self.context.add(self.context.divide(height, HALF),
+                                  correction)
+        rounded = self.context.multiply(D(int(halves)), HALF)
         # if closest half centimeter is an integer,
         # return as integer without decimal
         if rounded.as_tuple().digits[-1] == 0:
-            return D(int(rounded)).to_eng_string()
+            return str(int(rounded))
         # otherwise return with decimal places
         return rounded.to_eng_string()
 
@@ -62,9 +101,9 @@ class Observation(object):
         table = getattr(growth, table_name)
         if self.indicator in ["wfh", "wfl"]:
             assert self.height is not None
-            if D(self.height) < D(45):
+            if self.height_value < SHORTEST:
                 raise exceptions.InvalidMeasurement("too short")
-            if D(self.height) > D(120):
+            if self.height_value > TALLEST:
                 raise exceptions.InvalidMeasurement("too tall")
             # find closest height from WHO table (which has data at a resolution
             # of half a centimeter).
@@ -72,7 +111,7 @@ class Observation(object):
             # NOTE heights in tables are EITHER ints or floats!
             # (e.g., 60, 60.5)
             closest_height = self.rounded_height
-            self.logger.debug("looking up scores with: %s" % closest_height)
+            self.logger.debug("looking up scores with: %s", closest_height)
             scores = table.get(closest_height)
             if scores is not None:
                 return scores
@@ -80,7 +119,7 @@ class Observation(object):
                                           "%s" % (self.height, closest_height))
 
         elif self.indicator in ["lhfa", "wfa", "bmifa", "hcfa"]:
-            if self.age_in_weeks <= D(13):
+            if self.age_in_weeks <= THIRTEEN:
                 closest_week = str(int(math.floor(self.age_in_weeks)))
                 scores = table.get(closest_week)
                 if scores is not None:
@@ -102,76 +141,79 @@ class Observation(object):
         indicator is set to wfl while the child is too long for
         the recumbent tables, this method will make the lookup
         in the wfh table. """
-        if self.indicator == 'wfl' and D(self.height) > D(86):
+        table_indicator = None
+        table_age = None
+        table_sex = None
+        if self.indicator == 'wfl' and self.height_value > D(86):
             self.logger.warning('too long for recumbent')
-            self.table_indicator = 'wfh'
-            self.table_age = '2_5'
-        elif self.indicator == 'wfh' and D(self.height) < D(65):
+            table_indicator = 'wfh'
+            table_age = '2_5'
+        elif self.indicator == 'wfh' and self.height_value < D(65):
             self.logger.warning('too short for standing')
-            self.table_indicator = 'wfl'
-            self.table_age = '0_2'
+            table_indicator = 'wfl'
+            table_age = '0_2'
         else:
-            self.table_indicator = self.indicator
-            if self.table_indicator == 'wfl':
-                self.table_age = '0_2'
-            if self.table_indicator == 'wfh':
-                self.table_age = '2_5'
+            table_indicator = self.indicator
+            if table_indicator == 'wfl':
+                table_age = '0_2'
+            if table_indicator == 'wfh':
+                table_age = '2_5'
 
         if self.sex == 'M':
-            self.table_sex = 'boys'
+            table_sex = 'boys'
         if self.sex == 'F':
-            self.table_sex = 'girls'
+            table_sex = 'girls'
 
         # weight for age has only one table per sex,
         # as does head circumference for age
         # and CDC goes unused before 24mos
         if self.indicator in ["wfa", "lhfa", "hcfa"]:
-            self.table_age = "0_5"
-            if self.age <= D(3):
-                if self.age_in_weeks <= D(13):
-                    self.table_age = "0_13"
+            table_age = "0_5"
+            if self.age <= THREE:
+                if self.age_in_weeks <= THIRTEEN:
+                    table_age = "0_13"
             if self.american and self.age >= D(24):
                 if self.indicator == "hcfa":
                     raise exceptions.InvalidAge('TOO OLD: %d' % self.age)
-                self.table_age = "2_20"
+                table_age = "2_20"
         elif self.indicator in ["bmifa"]:
             if self.age > D(240):
                 raise exceptions.InvalidAge('TOO OLD: %d' % self.age)
-            elif self.age <= D(3) and self.age_in_weeks <= D(13):
-                self.table_age = "0_13"
+            elif self.age <= THREE and self.age_in_weeks <= THIRTEEN:
+                table_age = "0_13"
             elif self.age < D(24):
-                self.table_age = '0_2'
+                table_age = '0_2'
             elif self.age >= D(24) and self.age <= D(60):
-                self.table_age = '2_5'
+                table_age = '2_5'
             elif self.age >= D(24) and self.age > D(60):
-                self.table_age = '2_20'
+                table_age = '2_20'
             else:
                 raise exceptions.DataNotFound()
         else:
-            if self.table_age is None:
-                if self.table_indicator == 'wfl':
-                    self.table_age = '0_2'
-                if self.table_indicator == 'wfh':
-                    self.table_age = '2_5'
+            if table_age is None:
+                if table_indicator == 'wfl':
+                    table_age = '0_2'
+                if table_indicator == 'wfh':
+                    table_age = '2_5'
                 if self.age < D(24):
-                    if self.table_indicator == 'wfh':
+                    if table_indicator == 'wfh':
                         self.logger.warning('too young for standing')
-                        self.table_indicator == 'wfl'
-                    self.table_age = '0_2'
+                        table_indicator == 'wfl'
+                    table_age = '0_2'
                 elif self.age >= D(24):
-                    if self.table_indicator == 'wfl':
+                    if table_indicator == 'wfl':
                         self.logger.warning('too old for recumbent')
-                        self.table_indicator == 'wfh'
-                    self.table_age = '2_5'
+                        table_indicator == 'wfh'
+                    table_age = '2_5'
                 else:
                     raise exceptions.DataNotFound()
         table = "%(table_indicator)s_%(table_sex)s_%(table_age)s" %\
-                {"table_indicator": self.table_indicator,
-                 "table_sex": self.table_sex,
-                 "table_age": self.table_age}
+                {"table_indicator": table_indicator,
+                 "table_sex": table_sex,
+                 "table_age": table_age}
         self.logger.debug(table)
         # raise if any table name parts have not been resolved
-        if not all([self.table_indicator, self.table_sex, self.table_age]):
+        if not all([table_indicator, table_sex, table_age]):
             raise exceptions.DataError()
         return table
 
@@ -195,17 +237,29 @@ class Calculator(object):
         new_dict = {'field_name': field_name}
         for d in list_of_dicts:
             new_dict.update({d[field_name]: d})
+            # L, M and S are cast to decimals once, here, and kept
+            # by the calculator so the table rows are never written to
+            self._lms_rows[id(d)] = (D(d.get("L")), D(d.get("M")),
+                                     D(d.get("S")))
         setattr(self, table_name, new_dict)
 
     def __init__(self, adjust_height_data=False, adjust_weight_scores=False,
-                 include_cdc=False, logger_name='pygrowup', log_level="INFO"):
+                 include_cdc=False, logger_name='pygrowup', log_level="INFO",
+                 cache_size=0):
         self.logger = logging.getLogger(logger_name)
         self.logger.setLevel(getattr(logging, log_level))
 
         # use decimal.Decimal instead of float to avoid unwanted rounding
         # http://docs.sun.com/source/806-3568/ncg_goldberg.html
         # TODO set a custom precision
-        self.context = decimal.getcontext()
+        # the calculator owns its context (rather than capturing the
+        # current thread's) and does all arithmetic through it, so
+        # results do not depend on the calling thread's decimal context.
+        # each thread works on its own copy (see context property), as
+        # decimal contexts record flags and are not safe to share.
+        self._context = decimal.Context(prec=28,
+                                        rounding=decimal.ROUND_HALF_EVEN)
+        self._local = threading.local()
 
         # Height adjustments are part of the WHO specification
         # (to correct for recumbent vs standing measurements),
@@ -229,6 +283,16 @@ class Calculator(object):
 
         self.include_cdc = include_cdc
 
+        # field data is heavily quantized (whole months, tenths of
+        # kilograms and centimeters), so the same observation recurs
+        # often. when cache_size is set, the most recently used
+        # z-scores are remembered (see zscore_for_measurement)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+
         # load WHO Growth Standards
         # http://www.who.int/childgrowth/standards/en/
         # WHO tab-separated txt files have been converted to json,
@@ -265,6 +329,9 @@ class Calculator(object):
         tables_to_load = WHO_tables
         if self.include_cdc:
             tables_to_load = tables_to_load + CDC_tables
+        started = time.time()
+        rows = 0
+        self._lms_rows = {}
         for table in tables_to_load:
             table_file = os.path.join(table_dir, table)
             with open(table_file, 'r') as f:
@@ -274,7 +341,26 @@ class Calculator(object):
                 table_name, underscore, zscore_part =\
                     table.split('.')[0].rpartition('_')
                 setattr(self, table_name, json.load(f))
+                rows += len(getattr(self, table_name))
                 self.__reformat_table(table_name)
+        self.table_load_info = TableLoadInfo(len(tables_to_load), rows,
+                                             time.time() - started)
+
+    @property
+    def context(self):
+        """ This thread's copy of the calculator's decimal context """
+        try:
+            return self._local.context
+        except AttributeError:
+            self._local.context = self._context.copy()
+            return self._local.context
+
+    @property
+    def options(self):
+        """ Options that change the result of a calculation. Anything
+        that caches z-scores should be invalidated when these change. """
+        return (self.adjust_height_data, self.adjust_weight_scores,
+                self.include_cdc)
 
     # convenience methods
     def lhfa(self, measurement=None, age_in_months=None, sex=None, height=None):
@@ -313,7 +399,144 @@ class Calculator(object):
                                            age_in_months=age_in_months,
                                            sex=sex, height=height)
 
+    def cache_info(self):
+        """ Hit/miss statistics of the z-score cache """
+        with self._cache_lock:
+            return CacheInfo(self._cache_hits, self._cache_misses,
+                             self.cache_size, len(self._cache))
+
+    def cache_clear(self):
+        """ Empty the z-score cache and reset its statistics """
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_hits = 0
+            self._cache_misses = 0
+
+    def _cache_key(self, indicator, measurement, age_in_months, sex, height):
+        """ Normalize inputs so that, e.g., 14, '14' and '14.0' share a
+        cache entry. Decimals that compare equal hash equal, and give the
+        same z-score. Raises if the inputs cannot be normalized. """
+        if height in ['', ' ', None]:
+            height = None
+        else:
+            height = D(height)
+        return (indicator, D(measurement), D(age_in_months), sex.upper(),
+                height, self.options)
+
     def zscore_for_measurement(self, indicator, measurement, age_in_months, sex, height=None):
+        if not self.cache_size:
+            return self._zscore_for_measurement(indicator, measurement,
+                                                age_in_months, sex, height)
+        try:
+            key = self._cache_key(indicator, measurement, age_in_months,
+                                  sex, height)
+        except Exception:
+            # let the calculation raise the appropriate error
+            return self._zscore_for_measurement(indicator, measurement,
+                                                age_in_months, sex, height)
+        with self._cache_lock:
+            if key in self._cache:
+                zscore = self._cache.pop(key)
+                self._cache[key] = zscore
+                self._cache_hits += 1
+                return zscore
+            self._cache_misses += 1
+        # errors are raised every time rather than cached
+        zscore = self._zscore_for_measurement(indicator, measurement,
+                                              age_in_months, sex, height)
+        with self._cache_lock:
+            self._cache[key] = zscore
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return zscore
+
+    def centile_for_measurement(self, indicator, measurement, age_in_months, sex, height=None):
+        """ Centile (0-100, rounded to a tenth) of a measurement, i.e.
+        the standard normal distribution of its z-score. Takes the same
+        arguments and raises the same errors as zscore_for_measurement.
+        For arrays of observations see batch.centiles. """
+        zscore = self.zscore_for_measurement(indicator, measurement,
+                                             age_in_months, sex, height)
+        centile = 50 * math.erfc(-float(zscore) / math.sqrt(2))
+        return D(repr(centile)).quantize(TENTH, context=self.context)
+
+    def _lms(self, zscores):
+        """ L, M and S of a table row as decimals """
+        # rows of the loaded tables were cast in __reformat_table
+        lms = self._lms_rows.get(id(zscores))
+        if lms is None:
+            lms = (D(zscores.get("L")), D(zscores.get("M")),
+                   D(zscores.get("S")))
+        return lms
+
+    def _stdev(self, lms, sd):
+        """ Measurement at sd standard deviations, M(t)[1 + L(t)S(t)sd]^(1/L(t)) """
+        context = self.context
+        box_cox_power, median_for_age, coefficient_of_variance_for_age = lms
+        base = context.add(ONE, context.multiply(context.multiply(
+            box_cox_power, coefficient_of_variance_for_age), sd))
+        if base <= ZERO:
+            raise exceptions.InvalidMeasurement('no measurement has a z-score'
+                                                ' of %s' % sd)
+        exponent = context.divide(ONE, box_cox_power)
+        return context.multiply(median_for_age, context.power(base, exponent))
+
+    def measurement_for_zscore(self, indicator, zscore, age_in_months, sex, height=None):
+        """ Inverse of zscore_for_measurement: the measurement (rounded
+        to a hundredth) that has the given z-score, e.g. the weight that
+        would put a child at -2 SD. For wfl and wfh, height is the
+        child's length or height.
+
+        Uses the closed form of the LMS method, and of its restricted
+        application beyond +/- 3 SD for weight-based indicators when
+        adjust_weight_scores is set, so no search is needed. """
+        assert sex is not None
+        assert isinstance(sex, six.string_types)
+        assert sex.upper() in ["M", "F"]
+        assert age_in_months is not None
+        assert indicator is not None
+        assert indicator.lower() in ["lhfa", "wfl", "wfh", "wfa", "bmifa", "hcfa"]
+        assert zscore not in ['', ' ', None]
+
+        z = D(zscore)
+        context = self.context
+        obs = Observation(indicator, None, age_in_months, sex, height,
+                          self.include_cdc, self.logger, context)
+        zscores = obs.get_zscores(self)
+        if zscores is None:
+            raise exceptions.DataNotFound()
+        lms = self._lms(zscores)
+
+        restricted = (self.adjust_weight_scores and
+                      indicator in ["wfl", "wfh", "wfa"])
+        if restricted and z > THREE:
+            # Zind* = 3 + (y - SD3pos) / SD23pos, solved for y
+            SD3pos = self._stdev(lms, THREE)
+            SD23pos = context.subtract(SD3pos, self._stdev(lms, D(2)))
+            y = context.add(SD3pos, context.multiply(
+                context.subtract(z, THREE), SD23pos))
+        elif restricted and z < MINUS_THREE:
+            # Zind* = -3 + (y - SD3neg) / SD23neg, solved for y
+            SD3neg = self._stdev(lms, MINUS_THREE)
+            SD23neg = context.subtract(self._stdev(lms, D(-2)), SD3neg)
+            y = context.add(SD3neg, context.multiply(
+                context.subtract(z, MINUS_THREE), SD23neg))
+        else:
+            y = self._stdev(lms, z)
+
+        # undo the indicator-specific adjustments made to measurements
+        if indicator == "wfh" and self.adjust_height_data:
+            y = context.subtract(y, RECLINED_ADJUSTMENT)
+        if indicator == "wfl":
+            unadjusted = context.add(y, RECLINED_ADJUSTMENT)
+            if (RECLINED_MIN < unadjusted < RECLINED_MAX):
+                y = unadjusted
+        if y <= ZERO:
+            raise exceptions.InvalidMeasurement('no measurement has a z-score'
+                                                ' of %s' % z)
+        return y.quantize(HUNDREDTH, context=context)
+
+    def _zscore_for_measurement(self, indicator, measurement, age_in_months, sex, height=None):
         assert sex is not None
         assert isinstance(sex, six.string_types)
         assert sex.upper() in ["M", "F"]
@@ -326,15 +549,16 @@ class Calculator(object):
         # this is our length or height or weight or bmi measurement.
         # allow exception if measurement cannot be cast as Decimal
         y = D(measurement)
-        if y <= D(0):
+        if y <= ZERO:
             # reject measurements 0 or less because the math won't work.
             # and that would be an impossibly shaped human.
             raise exceptions.InvalidMeasurement('measurement must be greater'
                                                 ' than zero')
-        self.logger.debug("MEASUREMENT: %d" % y)
+        self.logger.debug("MEASUREMENT: %d", y)
 
+        context = self.context
         obs = Observation(indicator, measurement, age_in_months, sex, height,
-                          self.include_cdc, self.logger.name)
+                          self.include_cdc, self.logger, context)
 
         # indicator-specific methodology
         # (see section 5.1 of http://www.who.int/entity/childgrowth/standards/\
@@ -346,13 +570,13 @@ class Calculator(object):
         if indicator == "wfl":
             # subtract 0.7cm from length measurements in this range
             # to adjust for child's reclined position
-            if (D('65.7') < y < D('120.7')):
-                y = y - D('0.7')
+            if (RECLINED_MIN < y < RECLINED_MAX):
+                y = context.subtract(y, RECLINED_ADJUSTMENT)
 
         if indicator == "wfh" and self.adjust_height_data:
             # add 0.7cm to all height measurements
             # (basically to convert all height measurments to lengths)
-            y = y + D('0.7')
+            y = context.add(y, RECLINED_ADJUSTMENT)
 
         # get zscore from appropriate table
         zscores = obs.get_zscores(self)
@@ -360,16 +584,12 @@ class Calculator(object):
         if zscores is None:
             raise exceptions.DataNotFound()
 
-        # fetch necessary scores from zscores dict and cast as decimals
-        # L(t)
-        box_cox_power = D(zscores.get("L"))
-        self.logger.debug("BOX-COX: %d" % box_cox_power)
-        # M(t)
-        median_for_age = D(zscores.get("M"))
-        self.logger.debug("MEDIAN: %d" % median_for_age)
-        # S(t)
-        coefficient_of_variance_for_age = D(zscores.get("S"))
-        self.logger.debug("COEF VAR: %d" % coefficient_of_variance_for_age)
+        # L(t), M(t), S(t)
+        box_cox_power, median_for_age, coefficient_of_variance_for_age = \
+            self._lms(zscores)
+        self.logger.debug("BOX-COX: %d", box_cox_power)
+        self.logger.debug("MEDIAN: %d", median_for_age)
+        self.logger.debug("COEF VAR: %d", coefficient_of_variance_for_age)
 
         ###
         # calculate z-score
@@ -381,17 +601,17 @@ class Calculator(object):
         #   Zind =  -----------------
         #               S(t)L(t)
         ###
-        base = self.context.divide(y, median_for_age)
-        self.logger.debug("BASE: %d" % base)
-        power = base ** box_cox_power
-        self.logger.debug("POWER: %d" % power)
-        numerator = D(str(power)) - D(1)
-        self.logger.debug("NUMERATOR: %d" % numerator)
-        denomenator = self.context.multiply(coefficient_of_variance_for_age,
+        base = context.divide(y, median_for_age)
+        self.logger.debug("BASE: %d", base)
+        power = context.power(base, box_cox_power)
+        self.logger.debug("POWER: %d", power)
+        numerator = context.subtract(power, ONE)
+        self.logger.debug("NUMERATOR: %d", numerator)
+        denomenator = context.multiply(coefficient_of_variance_for_age,
                                             box_cox_power)
-        self.logger.debug("DENOMENATOR: %d" % denomenator)
-        zscore = self.context.divide(numerator, denomenator)
-        self.logger.debug("ZSCORE: %d" % zscore)
+        self.logger.debug("DENOMENATOR: %d", denomenator)
+        zscore = context.divide(numerator, denomenator)
+        self.logger.debug("ZSCORE: %d", zscore)
 
         # TODO this is probably unneccesary, as it should work out to be the
         # same as the above z-score calculation
@@ -406,17 +626,17 @@ class Calculator(object):
         # further processing is desired (see comment in __init__())
         if not self.adjust_weight_scores:
             # round to hundreth and return
-            return zscore.quantize(D('.01'))
+            return zscore.quantize(HUNDREDTH, context=context)
         else:
             if indicator not in ["wfl", "wfh", "wfa"]:
                 # return length/height-for-age (lhfa) without further processing
                 # L(t) is always 1 for this indicator, so differences between
                 # adjacent SDs (e.g., 2 SD and 3 SD) are constant for a specific
                 # age but varied at different ages
-                return zscore.quantize(D('.01'))
-            elif (abs(zscore) <= D(3)):
+                return zscore.quantize(HUNDREDTH, context=context)
+            elif (abs(zscore) <= THREE):
                 # (see below comment)
-                return zscore.quantize(D('.01'))
+                return zscore.quantize(HUNDREDTH, context=context)
             else:
                 # weight-based indicators present right-skewed distributions
                 # so use restricted application of LMS method (limiting Box-Cox
@@ -449,15 +669,15 @@ class Calculator(object):
                     #   SD2pos = M(t)[1 + L(t) * S(t) * (2)]^ 1/L(t)
                     #
                     ###
-                    base = self.context.add(D(1), self.context.multiply(
-                        self.context.multiply(box_cox_power,
+                    base = context.add(ONE, context.multiply(
+                        context.multiply(box_cox_power,
                                               coefficient_of_variance_for_age), D(sd)))
-                    exponent = self.context.divide(D(1), box_cox_power)
+                    exponent = context.divide(ONE, box_cox_power)
                     power = math.pow(base, exponent)
-                    stdev = self.context.multiply(median_for_age, D(str(power)))
+                    stdev = context.multiply(median_for_age, D(str(power)))
                     return D(stdev)
 
-                if (zscore > D(3)):
+                if (zscore > THREE):
                     logging.info("Z greater than 3")
                     # TODO measure performance of lookup vs calculation
                     # calculate for now so we have greater precision
@@ -471,16 +691,16 @@ class Calculator(object):
                     SD3pos_c = calc_stdev(3)
 
                     # compute distance
-                    SD23pos_c = SD3pos_c - SD2pos_c
+                    SD23pos_c = context.subtract(SD3pos_c, SD2pos_c)
 
                     # compute final z-score
                     # zscore = D(3) + ((y - SD3pos_c)/SD23pos_c)
-                    sub = self.context.subtract(D(y), SD3pos_c)
-                    div = self.context.divide(sub, SD23pos_c)
-                    zscore = self.context.add(D(3), div)
-                    return zscore.quantize(D('.01'))
+                    sub = context.subtract(y, SD3pos_c)
+                    div = context.divide(sub, SD23pos_c)
+                    zscore = context.add(THREE, div)
+                    return zscore.quantize(HUNDREDTH, context=context)
 
-                if (zscore < D(-3)):
+                if (zscore < MINUS_THREE):
                     # get cutoffs from z-scores dict
                     # SD2neg = D(zscores.get("SD2neg"))
                     # SD3neg = D(zscores.get("SD3neg"))
@@ -490,11 +710,11 @@ class Calculator(object):
                     SD3neg_c = calc_stdev(-3)
 
                     # compute distance
-                    SD23neg_c = SD2neg_c - SD3neg_c
+                    SD23neg_c = context.subtract(SD2neg_c, SD3neg_c)
 
                     # compute final z-score
                     # zscore = D(-3) + ((y - SD3neg_c)/SD23neg_c)
-                    sub = self.context.subtract(D(y), SD3neg_c)
-                    div = self.context.divide(sub, SD23neg_c)
-                    zscore = self.context.add(D(-3), div)
-                    return zscore.quantize(D('.01'))
+                    sub = context.subtract(y, SD3neg_c)
+                    div = context.divide(sub, SD23neg_c)
+                    zscore = context.add(MINUS_THREE, div)
+                    return zscore.quantize(HUNDREDTH, context=context)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# vim: ai ts=4 sts=4 et sw=4
+import math
+
+import numpy as np
+
+
+# age groups (in completed months) used by the WHO igrowup
+# survey prevalence tables
+AGE_GROUP_BOUNDS = (0, 6, 12, 24, 36, 48, 61)
+AGE_GROUP_LABELS = ('0-5', '6-11', '12-23', '24-35', '36-47', '48-60')
+
+# prevalence cutoffs reported for every indicator, e.g., for
+# length/height-for-age, z < -3 is severe stunting and z < -2 stunting
+CUTOFFS = (
+    ('below_3', np.less, -3),
+    ('below_2', np.less, -2),
+    ('above_2', np.greater, 2),
+)
+
+# values treated as missing in grouping columns
+MISSING = ('', 'nan', 'None', 'NaN')
+
+
+def age_groups(ages_in_months):
+    """ Label each age with its igrowup age group.
+    Ages outside 0-60 months are labelled '' (missing). """
+    ages = np.asarray(ages_in_months, dtype=np.float64)
+    index = np.searchsorted(AGE_GROUP_BOUNDS, ages, side='right') - 1
+    index = np.where(np.isnan(ages) | (ages < 0) |
+                     (ages >= AGE_GROUP_BOUNDS[-1]), -1, index)
+    labels = np.array(AGE_GROUP_LABELS + ('',))
+    return labels[index]
+
+
+def _encode(values):
+    """ Encode a grouping column as integer codes. Returns
+    (codes, labels) where missing values are coded -1. """
+    as_text = np.asarray(values).ravel().astype(str)
+    labels, codes = np.unique(as_text, return_inverse=True)
+    missing = np.isin(labels, MISSING)
+    codes = np.where(missing[codes], -1, codes)
+    return codes, labels
+
+
+def _confidence_interval(prevalence, n, z):
+    """ Normal approximation with continuity correction, as used for
+    the igrowup prevalence tables. All values are proportions. """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        margin = (z * np.sqrt(prevalence * (1 - prevalence) / n) +
+                  1.0 / (2 * n))
+    low = np.clip(prevalence - margin, 0, 1)
+    high = np.clip(prevalence + margin, 0, 1)
+    return low, high
+
+
+def _normal_quantile(confidence):
+    """ Two-sided critical value of the standard normal distribution
+    for a confidence level, by bisection on math.erf """
+    target = confidence
+    low, high = 0.0, 10.0
+    for _ in range(100):
+        mid = (low + high) / 2
+        if math.erf(mid / math.sqrt(2)) < target:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+def default_groupings(names):
+    """ Overall totals, each grouping on its own, then all of
+    them crossed -- the layout of the igrowup prevalence tables. """
+    groupings = [()]
+    groupings.extend((name,) for name in names)
+    if len(names) > 1:
+        groupings.append(tuple(names))
+    return groupings
+
+
+def prevalence(zscores, groups=None, flags=None, groupings=None,
+               confidence=0.95):
+    """ Prevalence of z-scores beyond the usual cutoffs, with confidence
+    intervals, plus mean and SD of z-scores, for every group.
+
+    zscores is a dict of indicator name to an array of z-scores
+    (NaN where missing), e.g. the output of a batch calculation.
+    groups is a dict of grouping name to an array of group values of the
+    same length, e.g. {'region': ..., 'sex': ..., 'age_group': ...}.
+    flags is an optional dict of indicator name to an array of
+    implausible value flags; flagged rows are left out, as are rows with
+    a missing group value. groupings is a list of tuples of grouping
+    names to report (see default_groupings).
+
+    Returns a list of dicts, one per indicator and group, with
+    prevalences and confidence limits given as percentages. """
+    groups = groups or {}
+    flags = flags or {}
+    names = list(groups.keys())
+    if groupings is None:
+        groupings = default_groupings(names)
+    z_crit = _normal_quantile(confidence)
+
+    encoded = dict((name, _encode(groups[name])) for name in names)
+
+    # combine group codes of every grouping into a single code per row,
+    # shared by all indicators
+    combined = []
+    for grouping in groupings:
+        size = 1
+        code = None
+        for name in grouping:
+            codes, labels = encoded[name]
+            if code is None:
+                code = codes.copy()
+            else:
+                code = np.where((code < 0) | (codes < 0), -1,
+                                code * len(labels) + codes)
+            size *= len(labels)
+        combined.append((grouping, code, size))
+
+    rows = []
+    for indicator, values in zscores.items():
+        z = np.asarray(values, dtype=np.float64).ravel()
+        usable = ~np.isnan(z)
+        if indicator in flags:
+            flag = np.asarray(flags[indicator], dtype=np.float64).ravel()
+            usable &= ~(flag > 0)
+        z_clean = np.where(usable, z, 0.0)
+        beyond = [(label, (op(z_clean, cutoff) & usable).astype(np.float64))
+                  for label, op, cutoff in CUTOFFS]
+
+        for grouping, code, size in combined:
+            if code is None:
+                keep = usable
+                bins = np.zeros(len(z), dtype=np.int64)
+                size = 1
+            else:
+                keep = usable & (code >= 0)
+                bins = np.where(keep, code, 0)
+            weights = keep.astype(np.float64)
+            n = np.bincount(bins, weights=weights, minlength=size)
+            total = np.bincount(bins, weights=z_clean * weights,
+                                minlength=size)
+            squares = np.bincount(bins, weights=z_clean ** 2 * weights,
+                                  minlength=size)
+            counts = [(label, np.bincount(bins, weights=hits * weights,
+                                          minlength=size))
+                      for label, hits in beyond]
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = total / n
+                variance = (squares - n * mean ** 2) / (n - 1)
+            sd = np.sqrt(np.clip(variance, 0, None))
+
+            for b in np.nonzero(n)[0]:
+                row = {
+                    'indicator': indicator,
+                    'group': _group_labels(grouping, b, encoded),
+                    'n': int(n[b]),
+                    'mean': float(mean[b]),
+                    'sd': float(sd[b]) if n[b] > 1 else None,
+                }
+                for label, count in counts:
+                    p = count[b] / n[b]
+                    low, high = _confidence_interval(p, n[b], z_crit)
+                    row[label] = {
+                        'count': int(count[b]),
+                        'prevalence': 100 * float(p),
+                        'ci_low': 100 * float(low),
+                        'ci_high': 100 * float(high),
+                    }
+                rows.append(row)
+    return rows
+
+
+def _group_labels(grouping, code, encoded):
+    """ Decode a combined group code back to {name: value} """
+    labels = {}
+    for name in reversed(grouping):
+        names = encoded[name][1]
+        code, index = divmod(code, len(names))
+        labels[name] = str(names[index])
+    return labels
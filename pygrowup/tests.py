@@ -1,106 +1,61 @@
-import logging
 import os
-import csv
-import codecs
+import datetime
+import decimal
+import json
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+from contextlib import contextmanager
 from decimal import Decimal as D
 
 import nose
+import numpy as np
 
 from . import pygrowup
+from . import accessor
+from . import batch
+from . import columnar
+from . import exceptions
+from . import export
+from . import helpers
+from . import longitudinal
+from . import parity
+from . import survey
+from . import velocity
 from six.moves import zip
 
 
-class WHOResult(object):
-    def __init__(self, indicator, values):
-        self.indicator = indicator
-        columns = 'id,region,GENDER,agemons,WEIGHT,_HEIGHT,measure,oedema,HEAD,MUAC,TRI,SUB,SW,agedays,CLENHEI,CBMI,ZWEI,ZLEN,ZWFL,ZBMI,FWEI,FLEN,FWFL,FBMI'
-        data = list(zip(columns.split(','), values))
-        for k, v in data:
-            setattr(self, k.lower(), v)
-        self.age = self.agemons
-        if int(self.gender) == 1:
-            self.gender = "M"
-        elif int(self.gender) == 2:
-            self.gender = "F"
-        else:
-            self.gender = None
-
-    def __repr__(self):
-        rep = self.indicator + " " + str(self.id) + " " + self.agemons
-        if all([self.gender, self.height]):
-            rep = rep + " (" + ", ".join([self.gender, self.height]) + ")"
-        return rep
-
-    @property
-    def result(self):
-        if self.indicator == "lhfa":
-            return self.zlen
-        if self.indicator in ["wfl", "wfh"]:
-            return self.zwfl
-        if self.indicator == "wfa":
-            return self.zwei
-        if self.indicator == "bmifa":
-            return self.zbmi
-
-    @property
-    def measurement(self):
-        if self.indicator == "lhfa":
-            return self._height
-        if self.indicator in ["wfl", "wfh"]:
-            return self.weight
-        if self.indicator == "wfa":
-            return self.weight
-        if self.indicator == "bmifa":
-            return self.cbmi
-
-    @property
-    def height(self):
-        if self.indicator in ["lhfa", "wfl", "wfh", "wfa"]:
-            return self._height
-        return None
-
-
-def compare_result(who):
-    our_result = None
-    logging.debug(who.indicator.upper() + " (" + str(who.measurement) + ") " + who.gender + " " + who.age + " " + str(who.height))
-    calc = pygrowup.Calculator(include_cdc=True, log_level='DEBUG')
-    if who.measurement:
-        our_result = calc.zscore_for_measurement(who.indicator, who.measurement,
-                                                 who.age, who.gender, who.height)
-        logging.info("THEM: " + str(who.result))
-        if who.result not in ['', ' ', None]:
-            if our_result is not None:
-                logging.info("US  : " + str(our_result))
-                diff = calc.context.subtract(D(who.result), D(our_result))
-                logging.info("DIFF: " + str(abs(diff)))
-                assert abs(diff) <= D('1')
-
-
-def test_generator():
+# measurement column of the corpus (parity.load_corpus) per indicator
+CORPUS_MEASUREMENTS = {'lhfa': 'HEIGHT', 'wfl': 'WEIGHT', 'wfh': 'WEIGHT',
+                       'wfa': 'WEIGHT', 'bmifa': 'CBMI', 'hcfa': 'HEAD'}
+
+
+@contextmanager
+def temp_dir():
+    """ A temporary directory, removed with its contents afterwards """
+    directory = tempfile.mkdtemp()
+    try:
+        yield directory
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_who_parity():
     # software uses error-prone floating-point calculations
-    module_dir = os.path.split(os.path.abspath(__file__))[0]
-    test_file = os.path.join(module_dir, 'testdata', 'survey_z_rc.csv')
-    csvee = codecs.open(test_file, "rU", encoding='utf-8', errors='ignore')
-
-    reader = csv.reader(csvee, dialect="excel")
-    # skip column labels
-    next(reader)
-    for row in reader:
-        for indicator in ["lhfa", "wfl", "wfh"]:
-            who = WHOResult(indicator, row)
-            # ignore these two cases
-            if who.id in ["287", "381"]:
-                continue
-            # also ignore other cases that are missing
-            # height or length data required for these calculations
-            if who.height not in ['', ' ', None]:
-                yield compare_result, who
-        for indicator in ["wfa", "bmifa"]:
-            who = WHOResult(indicator, row)
-            # ignore these two cases
-            if who.id in ["287", "381"]:
-                continue
-            yield compare_result, who
+    corpus = parity.load_corpus()
+    calc = pygrowup.Calculator(include_cdc=True, log_level='ERROR')
+    results = parity.run(corpus, calculator=calc)
+    scalar = parity.run(corpus, calculator=calc, scalar=True)
+    for result, expected in zip(results, scalar):
+        assert result.compared > 450
+        assert result.mismatches == \
+            parity.KNOWN_DEVIATIONS.get(result.indicator, [])
+        assert parity.unexpected(result) == []
+        assert result.not_calculated == []
+        # the batch engine and the calculator agree on every row
+        assert result == expected
 
 
 def test_bmifa_bug():
@@ -120,5 +75,554 @@ def test_bmifa_bug():
                                                              3.1, 'F', 50)
     assert should_use_bmifa_girls_0_2 == D('7.41')
 
+
+def test_height_only_read_for_wfl_wfh():
+    calc = pygrowup.Calculator()
+    # a non-numeric height is ignored by indicators that do not use it
+    assert calc.zscore_for_measurement('wfa', 9.3, 14, 'M', 'n/a') == \
+        calc.zscore_for_measurement('wfa', 9.3, 14, 'M')
+    assert calc.lhfa(75, 14, 'M', 'abc') == calc.lhfa(75, 14, 'M')
+    try:
+        calc.wfl(9.3, 14, 'M', 'n/a')
+        assert False
+    except decimal.InvalidOperation:
+        pass
+
+
+def test_growth_record_incremental():
+    calc = pygrowup.Calculator()
+    record = longitudinal.GrowthRecord(calc, sex='F', dob='2020-01-01')
+    record.add('2020-07-01', 7.2, 65.0)
+    record.add('2020-09-01', 7.9, 68.0)
+    assert record.add('2020-09-01', 7.9, 68.0) is False
+    record.add('2020-11-01', 8.4, 71.0)
+    assert record.rebuilds == 0
+    assert record.weight_velocity.count == 2
+    assert record.latest_zscores['wfa'] == calc.wfa(
+        8.4, record.ages[-1], 'F')
+
+    # out of order point rebuilds velocity stats from stored points
+    record.add('2020-08-01', 7.5, 66.5)
+    assert record.rebuilds == 1
+    assert record.weight_velocity.count == 3
+    assert record.series()['dates'][1] == '2020-08-01'
+
+    # changing calculator options recalculates stored z-scores
+    calc.adjust_weight_scores = True
+    record.add('2021-01-01', 8.8, 73.0)
+    assert record.rebuilds == 2
+    assert len(record.zscores) == 5
+
+    # a resent history replaces the stored one: one new point at the end
+    # is an update in place, a dropped or corrected point is not kept
+    points = [{'date': d, 'weight': w, 'height': h}
+              for d, w, h in zip(record.series()['dates'], record.weights,
+                                 record.heights)]
+    points.append({'date': '2021-03-01', 'weight': 9.1, 'height': 74.5})
+    assert record.replace(points) == 1
+    assert record.rebuilds == 2
+    del points[1]
+    points[-1]['weight'] = 9.2
+    assert record.replace(points) == 2
+    assert record.series()['dates'] == [p['date'] for p in points]
+    assert record.weights[-1] == 9.2
+    assert record.weight_velocity.count == 4
+    assert record.remove('2020-07-01') and not record.remove('2020-07-01')
+
+
+def test_batch_helpers():
+    dates, valid = helpers.get_good_dates(['15.06.2019', '31/4/19', 'x',
+                                           '15.06.2019'], delimiter=True)
+    assert list(valid) == [True, True, False, True]
+    assert str(dates[1]) == '2019-04-30'
+    assert str(dates[0]) == helpers.get_good_date('15.06.2019', True)[0]
+
+    sexes, valid = helpers.get_good_sexes(['Male', ' f', 1, 2, 'x'])
+    assert list(sexes) == ['M', 'F', 'M', 'F', '']
+    assert list(valid) == [True, True, True, True, False]
+
+    ages, valid = helpers.dates_to_ages_in_months(
+        dates, datetime.date(2020, 6, 15), whole_months=True)
+    assert list(valid) == [True, True, False, True]
+    assert ages[0] == int(helpers.date_to_age_in_months(
+        datetime.date(2019, 6, 15), datetime.date(2020, 6, 15)))
+
+
+def test_survey_prevalence():
+    z = [-3.5, -2.5, -1.0, 0.0, 2.5, float('nan'), -2.1]
+    region = ['North', 'North', 'South', 'South', 'South', 'North', '']
+    flags = [0, 0, 0, 0, 0, 0, 1]
+    ages = [3, 8, 15, 30, 40, 50, 70]
+    rows = survey.prevalence({'lhfa': z},
+                             {'region': region,
+                              'age_group': survey.age_groups(ages)},
+                             flags={'lhfa': flags})
+    overall = rows[0]
+    assert overall['group'] == {}
+    assert overall['n'] == 5
+    assert overall['below_2']['count'] == 2
+    assert overall['below_2']['prevalence'] == 40.0
+    assert 0 <= overall['below_2']['ci_low'] <= 40.0 <= overall['below_2']['ci_high']
+    north = [r for r in rows if r['group'] == {'region': 'North'}][0]
+    assert north['n'] == 2
+    assert north['below_3']['count'] == 1
+    assert north['mean'] == -3.0
+
+
+def test_batch_matches_scalar():
+    calc = pygrowup.Calculator(include_cdc=True)
+    engine = batch.BatchCalculator(calc)
+    corpus = parity.load_corpus()
+    for indicator, column in CORPUS_MEASUREMENTS.items():
+        result = engine.zscores(indicator, corpus[column], corpus['agemons'],
+                                corpus['GENDER'], corpus['HEIGHT'])
+        for i, (measurement, age, gender, height) in enumerate(zip(
+                corpus[column], corpus['agemons'], corpus['GENDER'],
+                corpus['HEIGHT'])):
+            sex = 'M' if gender == '1' else 'F'
+            try:
+                ours = calc.zscore_for_measurement(indicator, measurement,
+                                                   age, sex, height or None)
+            except (AssertionError, exceptions.InvalidMeasurement):
+                assert not result['valid'][i]
+                continue
+            assert result['valid'][i]
+            assert D(str(result['zscore'][i])) == ours
+
+
+def test_batch_flags():
+    engine = batch.BatchCalculator()
+    result = engine.zscores('wfa', [3.0, 12.0, 40.0, '', -1],
+                            [0, 12, 12, 12, 12], ['M', 'M', 'M', 'M', 'M'])
+    assert list(result['flag']) == [0, 0, 1, 0, 0]
+    assert list(result['valid']) == [True, True, True, False, False]
+    assert list(result['error']) == [batch.OK, batch.OK, batch.OK,
+                                     batch.MISSING_INPUT,
+                                     batch.INVALID_MEASUREMENT]
+
+    result = engine.zscores('wfh', [12.0, 12.0], [30, 30], [1, 2],
+                            [40.0, 90.0])
+    assert list(result['error']) == [batch.INVALID_MEASUREMENT, batch.OK]
+
+    # values that are not numbers are marked, not raised
+    result = engine.zscores('wfa', ['9.3', 'n/a', ' ', '9.3'],
+                            [12, 12, 12, 'abc'], ['M', 'M', 'M', 'M'])
+    assert list(result['valid']) == [True, False, False, False]
+    assert list(result['error']) == [batch.OK] + [batch.MISSING_INPUT] * 3
+
+
+def test_batch_dedup():
+    # repeated submissions: every row of the corpus three times
+    corpus = dict((name, values * 3)
+                  for name, values in parity.load_corpus().items())
+    engine = batch.BatchCalculator(include_cdc=True)
+    for indicator, (measurement, _, uses_height) in parity.COLUMNS.items():
+        heights = corpus['HEIGHT'] if uses_height else None
+        planned = engine.zscores(indicator, corpus[measurement],
+                                 corpus['agemons'], corpus['GENDER'],
+                                 heights, decimals=None, centiles=True)
+        unplanned = engine.zscores(indicator, corpus[measurement],
+                                   corpus['agemons'], corpus['GENDER'],
+                                   heights, decimals=None, centiles=True,
+                                   dedup=False)
+        assert 'dedup_ratio' not in unplanned
+        assert planned['dedup_ratio'] >= 3
+        for key in unplanned:
+            assert np.array_equal(planned[key], unplanned[key],
+                                  equal_nan=True), (indicator, key)
+
+    plan = batch.BatchPlan([[1, 0, 1, 1, 0], [5, 7, 5, 2, 9]],
+                           [True, True, True, True, False])
+    assert [list(keys) for keys in plan.keys] == [[0, 1, 1], [7, 2, 5]]
+    assert plan.ratio == 4 / 3.
+    assert list(plan.scatter(np.array([10., 20., 30.]), 5, np.nan)[:4]) == \
+        [30., 10., 30., 20.]
+
+
+def test_calculator_thread_safety():
+    calc = pygrowup.Calculator(adjust_weight_scores=True)
+    cases = [('wfa', 9.3, 14, 'M', None), ('lhfa', 71.2, 9, 'F', None),
+             ('wfl', 8.4, 10, 'F', 70.3), ('wfh', 30.0, 40, 'M', 100.0),
+             ('bmifa', 15.1, 30, 'M', None), ('hcfa', 44.0, 12, 'F', None)]
+    expected = [calc.zscore_for_measurement(*case) for case in cases]
+    failures = []
+
+    def work():
+        # a hostile thread-local context must not leak into results
+        decimal.getcontext().prec = 3
+        decimal.getcontext().rounding = decimal.ROUND_DOWN
+        for _ in range(50):
+            got = [calc.zscore_for_measurement(*case) for case in cases]
+            if got != expected:
+                failures.append(got)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not failures
+    # the table rows threads read from are never written to
+    for table in ('wfa_boys_0_5', 'lhfa_girls_0_5', 'wfl_girls_0_2'):
+        rows = [row for key, row in getattr(calc, table).items()
+                if key != 'field_name']
+        assert all(sorted(row) == sorted(rows[0]) for row in rows)
+        assert '_lms' not in rows[0]
+
+
+def test_zscore_cache():
+    calc = pygrowup.Calculator(cache_size=2)
+    first = calc.wfa('9.3', 14, 'M')
+    assert calc.wfa('9.30', '14.0', 'm') == first
+    assert calc.cache_info() == pygrowup.CacheInfo(1, 1, 2, 1)
+
+    calc.lhfa(71.2, 9, 'F')
+    calc.lhfa(72.2, 9, 'F')
+    # least recently used entry was evicted
+    calc.wfa('9.3', 14, 'M')
+    assert calc.cache_info().misses == 4
+
+    # options are part of the key
+    calc.adjust_weight_scores = True
+    calc.wfa('9.3', 14, 'M')
+    assert calc.cache_info().misses == 5
+
+    calc.cache_clear()
+    assert calc.cache_info() == pygrowup.CacheInfo(0, 0, 2, 0)
+
+
+def test_table_bundle_names():
+    calc = pygrowup.Calculator(include_cdc=True)
+    with temp_dir() as directory:
+        bundle = export.write_bundle(directory, calc)
+        # the file is named after its contents
+        assert os.path.basename(bundle).startswith('pygrowup-tables.')
+        assert export.write_bundle(directory, calc) == bundle
+        assert export.write_bundle(directory, pygrowup.Calculator()) != bundle
+
+
+def test_js_parity():
+    node = shutil.which('node') if hasattr(shutil, 'which') else None
+    if node is None:
+        raise unittest.SkipTest('node is not installed')
+    calc = pygrowup.Calculator(include_cdc=True, adjust_weight_scores=True)
+    script = os.path.join(pygrowup.module_dir, os.pardir, 'static', 'js',
+                          'anthro.js')
+    corpus = parity.load_corpus()
+    cases = [case for indicator, column in CORPUS_MEASUREMENTS.items()
+             for case in zip([indicator] * len(corpus[column]), corpus[column],
+                             corpus['agemons'], corpus['GENDER'],
+                             corpus['HEIGHT'])]
+
+    with temp_dir() as directory:
+        bundle = export.write_bundle(directory, calc)
+        with open(os.path.join(directory, 'cases.json'), 'w') as f:
+            json.dump(cases, f)
+        runner = (
+            "var A = require(process.argv[1]);"
+            "var fs = require('fs');"
+            "var b = JSON.parse(fs.readFileSync(process.argv[2]));"
+            "var c = JSON.parse(fs.readFileSync(process.argv[3]));"
+            "var o = {includeCdc: true, adjustWeightScores: true};"
+            "console.log(JSON.stringify(c.map(function (x) {"
+            "return A.zscore(b, x[0], x[1], x[2], x[3], x[4], o); })));")
+        output = subprocess.check_output(
+            [node, '-e', runner, os.path.abspath(script), bundle,
+             os.path.join(directory, 'cases.json')])
+
+    theirs = json.loads(output.decode('utf-8'))
+    for (indicator, measurement, age, gender, height), z in zip(cases, theirs):
+        sex = 'M' if gender == '1' else 'F'
+        try:
+            ours = calc.zscore_for_measurement(indicator, measurement, age,
+                                               sex, height or None)
+        except (AssertionError, exceptions.InvalidMeasurement,
+                exceptions.InvalidAge, exceptions.DataNotFound):
+            assert z is None
+            continue
+        assert abs(D(str(z)) - ours) <= D('0.01')
+
+
+def test_reference_curves():
+    calc = pygrowup.Calculator()
+    with temp_dir() as directory:
+        manifest = export.write_curves(directory, calc)
+        filename = manifest['files']['wfa_girls_0_5']
+        assert filename.startswith('wfa_girls_0_5.')
+        with open(os.path.join(directory, filename)) as f:
+            curve = json.load(f)
+        # rewriting unchanged curves gives the same names
+        assert export.write_curves(directory, calc) == manifest
+        # the manifest follows the tables it is written from
+        cdc = export.write_curves(directory,
+                                  pygrowup.Calculator(include_cdc=True))
+        with open(os.path.join(directory, export.MANIFEST_NAME)) as f:
+            assert json.load(f) == cdc
+    assert 'bmifa_boys_2_20' not in manifest['files']
+    assert 'bmifa_boys_2_20' in cdc['files']
+    assert cdc['files']['wfa_girls_0_5'] == filename
+    assert curve['x'][:3] == [0.0, 1.0, 2.0]
+    row = calc.wfa_girls_0_5['12']
+    for column in export.CURVE_COLUMNS:
+        assert curve[column][12] == float(row[column])
+    assert curve['SD3neg'][12] < curve['SD0'][12] < curve['SD3'][12]
+
+
+def test_table_load_info():
+    who = pygrowup.Calculator().table_load_info
+    both = pygrowup.Calculator(include_cdc=True).table_load_info
+    assert who.tables == 22 and both.tables == 28
+    assert 0 < who.rows < both.rows
+    assert who.seconds >= 0
+
+
+def test_measurement_for_zscore():
+    calc = pygrowup.Calculator(adjust_weight_scores=True)
+    assert calc.measurement_for_zscore('wfa', -2, 14, 'M') == D('8.10')
+    cases = [('wfa', 14, 'M', None), ('lhfa', 9, 'F', None),
+             ('wfl', 10, 'F', '70.3'), ('wfh', 40, 'M', '100'),
+             ('hcfa', 12, 'F', None)]
+    engine = batch.BatchCalculator(calc)
+    targets = ['-4.5', '-2', '0', '3.4']
+    for indicator, age, sex, height in cases:
+        columns = engine.measurements(indicator, [[float(z) for z in targets]],
+                                      [age], [sex], height and [height])
+        for z, column in zip(targets, columns['measurement'][0]):
+            measurement = calc.measurement_for_zscore(indicator, z, age, sex,
+                                                      height)
+            assert D(str(column)) == measurement
+            # beyond +/- 3 SD this inverts the restricted LMS method
+            back = calc.zscore_for_measurement(indicator, measurement, age,
+                                               sex, height)
+            assert abs(back - D(z)) <= D('0.02')
+
+    # the CDC bmi-for-age curve has an upper limit at this age
+    calc = pygrowup.Calculator(include_cdc=True)
+    try:
+        calc.measurement_for_zscore('bmifa', 4.8, 150, 'F')
+        assert False
+    except exceptions.InvalidMeasurement:
+        pass
+    result = batch.BatchCalculator(calc).measurements('bmifa', [0, 4.8],
+                                                      150, 'F')
+    assert list(result['error']) == [batch.OK, batch.INVALID_MEASUREMENT]
+
+
+def test_centiles():
+    z = np.array([-3, -1.96, 0, 1, 2.5, np.nan])
+    expected = [0.13499, 2.49979, 50, 84.13447, 99.37903]
+    # scipy if installed, and the erfc approximation either way
+    scipy_ndtr = batch._ndtr
+    try:
+        for ndtr in (scipy_ndtr, None):
+            batch._ndtr = ndtr
+            result = batch.centiles(z, decimals=None)
+            assert np.allclose(result[:5], expected, atol=1e-4)
+            assert np.isnan(result[5])
+    finally:
+        batch._ndtr = scipy_ndtr
+
+    calc = pygrowup.Calculator(adjust_weight_scores=True)
+    engine = batch.BatchCalculator(calc)
+    weights = ['8.1', '9.6', '11.2', '']
+    result = engine.zscores('wfa', weights, 14, 'M', centiles=True,
+                            output='decimal')
+    for weight, zscore, centile in zip(weights, result['zscore'],
+                                       result['centile']):
+        if not weight:
+            assert zscore is None and np.isnan(centile)
+            continue
+        assert zscore == calc.zscore_for_measurement('wfa', weight, 14, 'M')
+        # the scalar centile comes from the rounded z-score
+        scalar = calc.centile_for_measurement('wfa', weight, 14, 'M')
+        assert abs(D(str(centile)) - scalar) <= D('0.5')
+    assert calc.centile_for_measurement('wfa', '8.1', 14, 'M') == D('2.3')
+
+
+def test_velocity_tables():
+    engine = velocity.VelocityCalculator()
+    assert engine.available
+    assert engine.intervals('wv', 'M') == (1, 2)
+    assert engine.intervals('lv', 'F') == engine.intervals('hcv', 'F') == (2,)
+    # boys, weight, 0-2 mo: L 0.7188, M 2815.612 g, S 0.17422, Delta 600 g
+    assert engine.zscores('wv', 'M', [0, 2], [3.3, 5.515612])['zscore'][0] == 0
+    result = engine.zscores('wv', 'M', [0, 2], [3.3, 5.8], decimals=None)
+    expected = (((2.5 + 0.6) / 2.815612) ** 0.7188 - 1) / (0.17422 * 0.7188)
+    assert abs(result['zscore'][0] - expected) < 1e-9
+    # boys, length, 0-2 mo: M 8.482 cm
+    assert engine.zscores('lv', 'M', [0, 2], [50, 58.482])['zscore'][0] == 0
+
+    # the monthly gains of the weight-for-age medians are about median
+    # increments, which checks the Delta of the weight tables
+    for sex, name in (('M', 'boys'), ('F', 'girls')):
+        with open(os.path.join(pygrowup.module_dir, 'tables',
+                               'wfa_%s_0_5_zscores.json' % name)) as f:
+            medians = [float(row['M']) for row in json.load(f)[:25]]
+        for interval, last in ((1, 12), (2, 24)):
+            ages = list(range(2, last + 1, interval))
+            result = engine.zscores('wv', sex, ages, [medians[a] for a in ages])
+            assert np.all(np.abs(result['zscore']) <= 0.2), result['zscore']
+
+
+def test_velocity_zscores():
+    # made-up tables in the WHO layout, not the real standards
+    with temp_dir() as directory:
+        source = os.path.join(directory, 'source.txt')
+        # weight increments are published in grams
+        with open(source, 'w') as f:
+            f.write('Interval\tDelta\tL\tM\tS\n'
+                    '0 - 4 wks\t500\t0.8\t1500\t0.2\n'
+                    '4 wks - 2 mo\t500\t0.9\t1400\t0.2\n'
+                    '2-3 mo\t500\t1\t1200\t0.2\n')
+        velocity.convert('wv', 'F', 1, source, directory)
+        with open(os.path.join(directory, 'wv_girls_1mon_zscores.json')) as f:
+            row = json.load(f)[1]
+        assert (row['M'], row['Delta'], row['L']) == ('1.4', '0.5', '0.9')
+        with open(source, 'w') as f:
+            f.write('Interval,L,M,S\n0-2 mo,0,7,0.1\n1-3 mo,0,6,0.1\n')
+        velocity.convert('lv', 'F', 2, source, directory)
+        engine = velocity.VelocityCalculator(directory)
+        assert engine.intervals('wv', 'F') == (1,)
+        assert engine.intervals('wv', 'M') == ()
+        # a gain of M - Delta (900 g) in kg is the median
+        assert engine.zscores('wv', 'F', [1, 2], [4.0, 4.9])['zscore'][0] == 0
+
+        ages = [0, 1, 2.1, 4, 5, 6, 7]
+        weights = [3.2, 4.1, 4.9, 5.6, None, 6.5, 7]
+        result = engine.zscores('wv', 'F', ages, weights, decimals=None)
+        assert list(result['interval']) == [1, 1, 0, 1, 1, 1]
+        assert list(result['error']) == [
+            batch.OK, batch.OK, velocity.INVALID_INTERVAL,
+            batch.MISSING_INPUT, batch.MISSING_INPUT, batch.DATA_NOT_FOUND]
+        # the increment is scaled to the published interval
+        increment = 0.8 / 1.1
+        expected = (((increment + 0.5) / 1.4) ** 0.9 - 1) / (0.2 * 0.9)
+        assert abs(result['zscore'][1] - expected) < 1e-9
+
+        # L = 0: log transformation
+        result = engine.zscores('lv', 'F', [1, 3], [54, 60.5])
+        assert result['zscore'][0] == round(np.log(6.5 / 6) / 0.1, 2)
+
+        record = longitudinal.GrowthRecord(sex='F', dob='2024-01-01')
+        record.extend([{'date': '2024-01-01', 'weight': 3.2, 'height': 50},
+                       {'date': '2024-01-31', 'weight': 4.1, 'height': 54},
+                       {'date': '2024-03-01', 'weight': 4.9, 'height': 57.9}])
+        scores = record.velocity_zscores(engine)
+        assert sorted(scores) == ['lv', 'wv']
+        assert len(scores['wv']['zscore']) == 2
+        assert not np.isnan(scores['wv']['zscore']).any()
+
+
+def test_dataframe_accessor():
+    if accessor.pd is None:
+        raise unittest.SkipTest('pandas is not installed')
+    frame = accessor.pd.read_csv(parity.CORPUS, encoding='latin-1')
+    result = frame.anthro.zscores(['wfa', 'wfl', 'bmifa'], weight='WEIGHT',
+                                  height='HEIGHT', age='agemons',
+                                  sex='GENDER', include_cdc=True)
+    assert result is frame
+    engine = batch.BatchCalculator(include_cdc=True)
+    expected = engine.zscores('wfl', frame['WEIGHT'], frame['agemons'],
+                              frame['GENDER'], frame['HEIGHT'])
+    assert ((frame['z_wfl'].isna() & ~expected['valid']) |
+            (frame['z_wfl'] == expected['zscore'])).all()
+    assert (frame['flag_wfl'] == expected['flag']).all()
+    # bmi is derived from weight and height when there is no bmi column
+    bmi = frame['WEIGHT'] / (frame['HEIGHT'] / 100) ** 2
+    expected = engine.zscores('bmifa', bmi, frame['agemons'], frame['GENDER'])
+    assert ((frame['z_bmifa'].isna() & ~expected['valid']) |
+            (frame['z_bmifa'] == expected['zscore'])).all()
+
+    # missing values and sex codes in bulk
+    frame = accessor.pd.DataFrame({'weight': [9.3, None, 12.0, '9.3'],
+                                   'age': [14, 14, None, 14],
+                                   'sex': ['m', 'F', None, 1]})
+    frame.anthro.zscores('wfa', weight='weight', age='age', sex='sex')
+    assert list(frame['z_wfa'].fillna(99)) == [-0.75, 99, 99, -0.75]
+
+    # a dirty survey column: NaN and an error code, not an exception
+    frame = accessor.pd.DataFrame({'weight': ['9.3', 'n/a', ' ', '9.3'],
+                                   'age': [14, 14, 14, 'abc'],
+                                   'sex': ['M', 'M', 'M', 'M']})
+    frame.anthro.zscores('wfa', weight='weight', age='age', sex='sex',
+                         error_prefix='error_')
+    assert list(frame['z_wfa'].fillna(99)) == [-0.75, 99, 99, 99]
+    assert list(frame['error_wfa']) == [batch.OK] + [batch.MISSING_INPUT] * 3
+
+
+def test_columnar_output():
+    corpus = parity.load_corpus()
+    engine = batch.BatchCalculator(include_cdc=True)
+    expected = engine.zscores('wfl', corpus['WEIGHT'], corpus['agemons'],
+                              corpus['GENDER'], corpus['HEIGHT'],
+                              decimals=None)
+    with temp_dir() as directory:
+        # streamed in several chunks, reloaded as memory mapped columns
+        output = os.path.join(directory, 'columns')
+        rows = columnar.convert_csv(
+            parity.CORPUS, output, ['wfl', 'lhfa'],
+            {'age': 'agemons', 'sex': 'GENDER', 'weight': 'WEIGHT',
+             'height': 'HEIGHT'}, engine, chunk_rows=100)
+        assert rows == len(corpus['id'])
+        columns = columnar.read_columns(output)
+        assert sorted(columns) == [
+            'centile_lhfa', 'centile_wfl', 'error_lhfa', 'error_wfl',
+            'flag_lhfa', 'flag_wfl', 'z_lhfa', 'z_wfl']
+        assert isinstance(columns['z_wfl'], np.memmap)
+        assert np.array_equal(columns['z_wfl'], expected['zscore'],
+                              equal_nan=True)
+        assert np.array_equal(columns['flag_wfl'], expected['flag'])
+        assert columns['error_wfl'].dtype == expected['error'].dtype
+
+
+def test_columnar_malformed_cells():
+    # a malformed cell fails its row, not the conversion
+    with temp_dir() as directory:
+        dirty = os.path.join(directory, 'dirty.csv')
+        with open(dirty, 'w') as f:
+            f.write('age,sex,weight\n14,M,9.3\n14,M,n/a\n14,M, \nabc,M,9.3\n')
+        output = os.path.join(directory, 'dirty')
+        assert columnar.convert_csv(
+            dirty, output, ['wfa'],
+            {'age': 'age', 'sex': 'sex', 'weight': 'weight'}) == 4
+        columns = columnar.read_columns(output)
+        assert list(np.isnan(columns['z_wfa'])) == [False, True, True, True]
+        assert list(columns['error_wfa']) == \
+            [batch.OK] + [batch.MISSING_INPUT] * 3
+
+
+def test_columnar_archives():
+    corpus = parity.load_corpus()
+    engine = batch.BatchCalculator(include_cdc=True)
+    columns = columnar.result_columns(dict(
+        (indicator, engine.zscores(indicator, corpus[column],
+                                   corpus['agemons'], corpus['GENDER'],
+                                   corpus['HEIGHT'], decimals=None,
+                                   centiles=True))
+        for indicator, column in (('wfl', 'WEIGHT'), ('lhfa', 'HEIGHT'))))
+    with temp_dir() as directory:
+        path = os.path.join(directory, 'results.npz')
+        columnar.write_npz(path, columns)
+        archive = columnar.read_npz(path)
+        assert np.array_equal(archive['centile_wfl'], columns['centile_wfl'],
+                              equal_nan=True)
+        path = os.path.join(directory, 'results.arrow')
+        if columnar.pyarrow is not None:
+            columnar.write_arrow(path, columns)
+            assert np.array_equal(columnar.read_arrow(path)['z_lhfa'],
+                                  columns['z_lhfa'], equal_nan=True)
+        else:
+            calls = [(columnar.write_arrow, (path, columns)),
+                     (columnar.write_parquet, (path, columns)),
+                     (columnar.read_arrow, (path,)),
+                     (columnar.read_parquet, (path,))]
+            for function, args in calls:
+                try:
+                    function(*args)
+                    assert False
+                except ImportError:
+                    pass
+
+
 if __name__ == '__main__':
     nose.main()
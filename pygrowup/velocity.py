@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# vim: ai ts=4 sts=4 et sw=4
+"""
+WHO growth velocity standards: z-scores of weight, length and head
+circumference increments over 1, 2, 3, 4 and 6 month intervals.
+
+Bundled in tables/velocity, converted from tables/source/who/velocity:
+
+    wv  -- 1 and 2 month weight increments, 0-12 and 0-24 months
+    lv  -- 2 month length increments, 0-24 months
+    hcv -- 2 month head circumference increments, 0-12 months
+
+The source files hold the WHO LMS values as extracted by
+pygrowthstandards 0.1.3 (MIT licensed), which does not keep the Delta
+column of the weight increment tables; Delta is 400 g for the 1 month
+and 600 g for the 2 month tables, the constant difference between
+their M and the increments of the WHO weight-for-age medians.
+Other intervals can be added by converting the tab or comma separated
+files from http://www.who.int/childgrowth/standards/en/ (one file per
+kind, sex and interval, with Interval, L, M, S and, for weight, Delta
+columns) into the JSON table format used by the rest of pygrowup:
+
+    python -m pygrowup.velocity convert wv boys 3 weight_3mon_boys.txt
+
+Tables are written to tables/velocity as e.g. wv_boys_3mon_zscores.json,
+one row per interval keyed by its starting month. WHO publishes weight
+increments in grams; they are converted to kg, like every other weight
+in pygrowup. Kinds and intervals without a table are simply not scored.
+"""
+import os
+import re
+import sys
+import csv
+import json
+from decimal import Decimal as D
+
+import numpy as np
+
+from . import batch
+from .batch import OK, MISSING_INPUT, INVALID_MEASUREMENT, DATA_NOT_FOUND
+from .pygrowup import module_dir
+
+
+TABLE_DIR = os.path.join(module_dir, 'tables', 'velocity')
+
+# kind -> interval lengths (months) published by WHO
+INTERVALS = {
+    'wv': (1, 2, 3, 4, 6),      # weight, kg
+    'lv': (2, 3, 4, 6),         # length, cm
+    'hcv': (2, 3, 4, 6),        # head circumference, cm
+}
+
+# factor from the units of the WHO files to those of the tables: weight
+# increments are published in grams. Only M and Delta have units; L is a
+# power and S a coefficient of variation.
+SOURCE_SCALE = {'wv': D('0.001'), 'lv': D(1), 'hcv': D(1)}
+
+# the interval between two measurements is scored against the nearest
+# published interval if it is within this fraction of its length, and
+# its increment is scaled to that length
+TOLERANCE = 0.25
+
+# reason a velocity z-score could not be calculated, besides those
+# of batch (OK, MISSING_INPUT, INVALID_MEASUREMENT, DATA_NOT_FOUND)
+INVALID_INTERVAL = 5        # no published interval close to this one
+
+DAYS_PER_WEEK = 7.0
+DAYS_PER_MONTH = 30.4375
+
+
+def table_name(kind, sex, interval):
+    return '%s_%s_%smon' % (kind, 'boys' if sex == 'M' else 'girls', interval)
+
+
+class VelocityTable(batch.PackedTable):
+    """ A packed velocity table, indexed by starting month. Weight and
+    head circumference increments are shifted by Delta before the LMS
+    transformation, as some increments are negative. """
+
+    def __init__(self, table):
+        super(VelocityTable, self).__init__(table)
+        self.delta = np.zeros(len(self.L))
+        rows = [v for k, v in table.items() if k != 'field_name']
+        position = np.array([int(r['Month']) for r in rows]) - self.offset
+        self.delta[position] = [float(r.get('Delta') or 0) for r in rows]
+
+    def lookup(self, index):
+        L, M, S = super(VelocityTable, self).lookup(index)
+        position = np.asarray(index, dtype=np.int64) - self.offset
+        inside = (position >= 0) & (position < len(self.delta))
+        delta = np.where(inside, self.delta[np.where(inside, position, 0)], 0)
+        return L, M, S, delta
+
+
+class VelocityCalculator(object):
+    """ Scores every consecutive interval of one child's measurements
+    against the WHO velocity standards found in table_dir. """
+
+    def __init__(self, table_dir=TABLE_DIR, tolerance=TOLERANCE):
+        self.tolerance = tolerance
+        self.tables = {}
+        if os.path.isdir(table_dir):
+            for filename in sorted(os.listdir(table_dir)):
+                if not filename.endswith('_zscores.json'):
+                    continue
+                with open(os.path.join(table_dir, filename)) as f:
+                    rows = json.load(f)
+                table = {'field_name': 'Month'}
+                for row in rows:
+                    table[row['Month']] = row
+                self.tables[filename[:-len('_zscores.json')]] = \
+                    VelocityTable(table)
+
+    def intervals(self, kind, sex):
+        """ Interval lengths (months) with a table for kind and sex """
+        return tuple(n for n in INTERVALS[kind]
+                     if table_name(kind, sex, n) in self.tables)
+
+    @property
+    def available(self):
+        return bool(self.tables)
+
+    def zscores(self, kind, sex, ages, values, decimals=2):
+        """ z-scores of the increments between consecutive measurements.
+
+        ages are in months and values in kg (wv) or cm (lv, hcv), both
+        in date order; blanks may be NaN or None. Returns a dict of
+        arrays with one entry per interval:
+
+            start    -- age at the start of the interval
+            months   -- length of the interval
+            interval -- published interval it was scored against (0 if none)
+            increment -- increment, scaled to the published interval
+            zscore   -- z-score (rounded to decimals), NaN if not calculated
+            error    -- reason a z-score was not calculated
+        """
+        assert kind in INTERVALS
+        sex = sex.upper()
+        ages = batch._to_float(ages)
+        values = batch._to_float(values)
+        start = ages[:-1]
+        months = np.diff(ages)
+        change = np.diff(values)
+        error = np.full(len(months), OK, dtype=np.int8)
+        batch._mark(error, np.isnan(months) | np.isnan(change), MISSING_INPUT)
+
+        # nearest published interval, relative to its length
+        available = np.array(self.intervals(kind, sex) or (0,), dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            distance = np.abs(months[:, None] / available - 1)
+            nearest = np.argmin(np.where(np.isnan(distance), np.inf, distance),
+                                axis=1)
+            interval = available[nearest]
+            close = distance[np.arange(len(months)), nearest] <= self.tolerance
+        interval = np.where(close, interval, 0)
+        batch._mark(error, ~close, INVALID_INTERVAL)
+
+        index = np.rint(np.where(np.isnan(start), 0, start)).astype(np.int64)
+        L = np.full(len(months), np.nan)
+        M, S, delta = L.copy(), L.copy(), np.zeros(len(months))
+        for n in np.unique(interval[interval > 0]):
+            table = self.tables[table_name(kind, sex, int(n))]
+            rows = interval == n
+            L[rows], M[rows], S[rows], delta[rows] = table.lookup(index[rows])
+        batch._mark(error, np.isnan(M), DATA_NOT_FOUND)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            increment = change * interval / months
+            y = increment + delta
+            batch._mark(error, y <= 0, INVALID_MEASUREMENT)
+            z = np.where(L == 0, np.log(y / M) / S,
+                         (np.power(y / M, L) - 1) / (S * L))
+        z = np.where(error == OK, z, np.nan)
+        if decimals is not None:
+            z = np.round(z, decimals)
+        return {'start': start, 'months': months, 'interval': interval,
+                'increment': increment, 'zscore': z, 'error': error}
+
+
+def _start_month(interval):
+    """ Starting month of a WHO interval label, e.g. '4 wks - 2 mo'
+    or '1-3 mo'. Weeks are rounded to the nearest month. """
+    first, _dash, last = interval.partition('-')
+    number = float(re.match(r'\s*([\d.]+)', first).group(1))
+    unit = re.search(r'[a-z]+', first.lower()) or re.search(r'[a-z]+', last.lower())
+    if unit and unit.group(0).startswith('w'):
+        return int(round(number * DAYS_PER_WEEK / DAYS_PER_MONTH))
+    return int(round(number))
+
+
+def convert(kind, sex, interval, source, table_dir=TABLE_DIR, scale=None):
+    """ Convert a WHO velocity table (tab or comma separated text)
+    to pygrowup JSON, and return the path written. M and Delta are
+    multiplied by scale, by default SOURCE_SCALE (grams to kg for
+    weight). """
+    assert kind in INTERVALS and int(interval) in INTERVALS[kind]
+    scale = SOURCE_SCALE[kind] if scale is None else D(str(scale))
+    with open(source) as f:
+        text = f.read()
+    dialect = 'excel-tab' if '\t' in text.splitlines()[0] else 'excel'
+    reader = csv.DictReader(text.splitlines(), dialect=dialect)
+    columns = dict((name.strip().lower(), name) for name in reader.fieldnames)
+    rows = []
+    for row in reader:
+        label = row[columns['interval']]
+        if not label or not label.strip():
+            continue
+        converted = {'Interval': label.strip(),
+                     'Month': str(_start_month(label))}
+        for name in ('L', 'M', 'S', 'Delta'):
+            if name.lower() in columns:
+                value = row[columns[name.lower()]].strip()
+                if name in ('M', 'Delta') and value and scale != 1:
+                    value = str((D(value) * scale).normalize())
+                converted[name] = value
+        rows.append(converted)
+    if not os.path.isdir(table_dir):
+        os.makedirs(table_dir)
+    path = os.path.join(table_dir, table_name(kind, sex.upper(), interval) +
+                        '_zscores.json')
+    with open(path, 'w') as f:
+        json.dump(rows, f, indent=1)
+    return path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 6 or sys.argv[1] != 'convert':
+        sys.exit('usage: python -m pygrowup.velocity convert '
+                 '{wv,lv,hcv} {boys,girls} MONTHS FILE')
+    kind, sex, interval, source = sys.argv[2:]
+    print(convert(kind, 'M' if sex.lower().startswith('b') else 'F',
+                  int(interval), source))
@@ -0,0 +1,284 @@
+"""
+Kuota paket premium (Config.PREMIUM_PACKAGES) dengan token bucket di memori.
+
+Setiap pasangan (pengguna, batas) punya satu bucket berkapasitas sama
+dengan batas paket, yang terisi kembali merata sepanjang periodenya
+(mis. 5 kalkulasi per hari: satu token kembali tiap 4,8 jam). Cek kuota
+hanya lookup dict dan sedikit aritmetika di bawah lock, tanpa akses
+database.
+
+Batas yang tidak disebut sebuah paket berarti 0 (fitur ditolak); -1 atau
+None berarti tanpa batas.
+
+Backend bersama (opsional) dipakai agar beberapa worker berbagi kuota:
+pemakaian lokal dikirim secara berkala oleh thread latar (sync_interval)
+dan sisa token dari backend dipakai kembali. Di antara dua sinkronisasi
+tiap worker hanya melihat pemakaiannya sendiri, jadi batas bisa sedikit
+terlampaui; itu harga yang dibayar agar hot path tidak menunggu jaringan.
+SQLiteBackend sekaligus menyimpan kuota secara malas (hanya saat
+sinkronisasi), sehingga kuota bertahan saat restart. Bucket baru hanya
+membaca backend, dan jika backend gagal kuota tetap berjalan dari bucket
+di memori.
+"""
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+DAY = 24 * 3600
+
+# periode pengisian ulang tiap batas (detik)
+PERIODS = {
+    'daily_calculations': DAY,
+    'report_exports': 30 * DAY,
+    'consultations': 30 * DAY,
+}
+
+# allowed: boleh lanjut; limit/remaining: untuk header X-RateLimit-*;
+# retry_after: detik sampai satu token tersedia (None jika tidak akan pernah,
+# mis. batas 0); reset: waktu epoch bucket penuh lagi
+Decision = namedtuple('Decision', ['allowed', 'limit', 'remaining', 'retry_after', 'reset'])
+
+UNLIMITED = Decision(True, None, None, 0.0, None)
+DENIED = Decision(False, 0, 0, None, None)
+
+
+class MemoryBackend:
+    """Backend bersama di memori proses: pengganti lokal untuk tes atau satu
+    proses. Backend lain (Redis, database) cukup menyediakan sync() yang
+    atomik, peek() dan purge() dengan perilaku yang sama."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def sync(self, key, consumed, capacity, rate, now):
+        """Kurangi pemakaian dari bucket bersama; kembalikan sisa token"""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate) - consumed
+            self._buckets[key] = (tokens, now)
+            return tokens
+
+    def peek(self, key, capacity, rate, now):
+        """Sisa token bucket bersama tanpa mengubahnya"""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+        return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+    def purge(self, now):
+        """Tidak perlu: bucket di memori proses hilang bersama prosesnya"""
+        return 0
+
+
+class SQLiteBackend:
+    """Backend bersama dan persisten di file SQLite, dipakai bersama oleh
+    semua worker di satu host. Hanya ditulis saat sinkronisasi, dan hanya
+    untuk bucket yang belum penuh; bucket baru cukup dibaca sekali. Baris
+    yang sudah penuh kembali dihapus oleh purge(), jadi tabel tidak tumbuh
+    terus."""
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS quota_buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, '
+            'full_at REAL NOT NULL)')
+        self._connect().execute(
+            'CREATE INDEX IF NOT EXISTS quota_buckets_full_at ON quota_buckets (full_at)')
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=self.timeout,
+                                                  isolation_level=None)
+        return db
+
+    def sync(self, key, consumed, capacity, rate, now):
+        db = self._connect()
+        name = json.dumps(list(key))
+        db.execute('BEGIN IMMEDIATE')  # atomik juga antar proses
+        try:
+            row = db.execute('SELECT tokens, updated FROM quota_buckets WHERE key = ?',
+                             (name,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate) - consumed
+            if tokens >= capacity:
+                # bucket penuh sama dengan tidak ada baris
+                db.execute('DELETE FROM quota_buckets WHERE key = ?', (name,))
+            else:
+                # waktu bucket penuh lagi, untuk purge()
+                full_at = now + (capacity - tokens) / rate if rate > 0 else float('inf')
+                db.execute('INSERT OR REPLACE INTO quota_buckets '
+                           '(key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                           (name, tokens, now, full_at))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return tokens
+
+    def peek(self, key, capacity, rate, now):
+        row = self._connect().execute(
+            'SELECT tokens, updated FROM quota_buckets WHERE key = ?',
+            (json.dumps(list(key)),)).fetchone()
+        tokens, updated = row if row else (capacity, now)
+        return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+    def purge(self, now):
+        """Hapus bucket yang sudah penuh kembali (sama dengan tidak ada baris)"""
+        return self._connect().execute(
+            'DELETE FROM quota_buckets WHERE full_at <= ?', (now,)).rowcount
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated', 'pending')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+        self.pending = 0  # pemakaian yang belum dikirim ke backend (jika ada)
+
+
+class QuotaManager:
+    def __init__(self, packages, periods=PERIODS, backend=None, sync_interval=5.0,
+                 max_keys=100000, clock=time.time):
+        # limit per (paket, nama batas); tidak disebut berarti 0 (ditolak),
+        # -1 atau None berarti tanpa batas (tidak ada di dict)
+        self.packages = set(packages)
+        self.limits = {}
+        for name, package in packages.items():
+            limits = package.get('limits', {})
+            for limit in periods:
+                value = limits.get(limit, 0)
+                if value is not None and value >= 0:
+                    self.limits[(name, limit)] = value
+        self.periods = dict(periods)
+        self.backend = backend
+        self.max_keys = max_keys
+        # registri hanya di-scan lagi setelah tumbuh melewati batas ini
+        self._prune_at = max_keys
+        self.clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if backend is not None and sync_interval:
+            self._thread = threading.Thread(target=self._sync_loop, args=(sync_interval,),
+                                            name='quota-sync', daemon=True)
+            self._thread.start()
+
+    def limit(self, package, name):
+        return self.limits.get((package, name))
+
+    def check(self, user, package, name, cost=1):
+        """Pakai cost token dari kuota name milik user; Decision menyatakan
+        apakah request boleh lanjut"""
+        if package not in self.packages:
+            return DENIED  # paket tidak dikenal: tidak ada fitur berbatas
+        capacity = self.limits.get((package, name))
+        if capacity is None:
+            return UNLIMITED
+        if capacity == 0:
+            return DENIED
+        rate = capacity / self.periods[name]
+        key = (user, package, name)
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = _Bucket(capacity, now)
+                fresh = True
+            else:
+                fresh = False
+        if fresh and self.backend is not None:
+            # sekali per pengguna per proses: baca sisa kuota bersama. Jika
+            # backend gagal, bucket di memori tetap dipakai; pemakaiannya
+            # dikirim pada sinkronisasi berikutnya
+            try:
+                tokens = self.backend.peek(key, capacity, rate, now)
+            except Exception:
+                tokens = capacity
+            with self._lock:
+                bucket.tokens = min(bucket.tokens, tokens)
+        with self._lock:
+            tokens = min(capacity, bucket.tokens + (now - bucket.updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+                if self.backend is not None:
+                    bucket.pending += cost
+            bucket.tokens = tokens
+            bucket.updated = now
+            if len(self._buckets) > self._prune_at:
+                self._prune(now)
+                # bucket yang tersisa masih dipakai: scan berikutnya baru
+                # setelah registri tumbuh dua kali lipat (biaya teramortisasi)
+                self._prune_at = max(self.max_keys, 2 * len(self._buckets))
+        if allowed:
+            retry_after = 0.0
+        elif rate > 0 and cost <= capacity:
+            retry_after = (cost - tokens) / rate
+        else:
+            retry_after = None
+        reset = now + (capacity - tokens) / rate if rate > 0 else None
+        return Decision(allowed, capacity, max(0, int(math.floor(tokens))), retry_after, reset)
+
+    def _prune(self, now):
+        """Buang bucket yang sudah penuh kembali dan tidak punya pemakaian
+        tertunda; dipanggil dengan lock terpegang"""
+        for key in list(self._buckets):
+            bucket = self._buckets[key]
+            capacity = self.limits.get(key[1:])
+            if bucket.pending or capacity is None:
+                continue
+            rate = capacity / self.periods[key[2]]
+            if bucket.tokens + (now - bucket.updated) * rate >= capacity:
+                del self._buckets[key]
+
+    def flush(self):
+        """Kirim pemakaian tertunda ke backend dan ambil sisa token bersama
+        untuk semua bucket (juga yang tidak dipakai sejak sinkronisasi lalu,
+        agar pemakaian worker lain ikut terlihat)"""
+        if self.backend is None:
+            return 0
+        now = self.clock()
+        with self._lock:
+            buckets = [(key, bucket, bucket.pending) for key, bucket in self._buckets.items()]
+            for _key, bucket, _pending in buckets:
+                bucket.pending = 0
+        for key, bucket, pending in buckets:
+            capacity = self.limits[key[1:]]
+            rate = capacity / self.periods[key[2]]
+            try:
+                tokens = self.backend.sync(key, pending, capacity, rate, now)
+            except Exception:
+                with self._lock:
+                    bucket.pending += pending  # coba lagi di sinkronisasi berikutnya
+                continue
+            with self._lock:
+                # sisa bersama (sudah termasuk pemakaian worker lain), dikurangi
+                # pemakaian lokal yang terjadi selama sync dan belum terkirim
+                updated = max(bucket.updated, now)
+                shared = min(capacity, tokens + (updated - now) * rate)
+                bucket.tokens = shared - bucket.pending
+                bucket.updated = updated
+        try:
+            self.backend.purge(now)
+        except Exception:
+            pass  # dicoba lagi pada sinkronisasi berikutnya
+        return len(buckets)
+
+    def _sync_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
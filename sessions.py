@@ -0,0 +1,171 @@
+"""
+Sesi ringan untuk anthroGizi: hanya preferensi kecil (tema, mode, paket).
+
+Dua mode (Config.SESSION_TYPE):
+
+- 'cookie': data ditandatangani di cookie (seperti sesi bawaan Flask),
+  jadi dibagi oleh semua worker dan host selama SECRET_KEY sama;
+- 'memory': cookie hanya berisi id sesi yang ditandatangani, data di
+  MemoryStore (LRU terbatas) atau backend bersama lain yang menyediakan
+  get/set/delete yang sama.
+
+Cookie baru dibaca saat sesi pertama kali dipakai, dan hanya ditulis
+(Set-Cookie / store.set) jika isinya benar-benar berubah. Route yang
+tidak menyentuh sesi tidak melakukan I/O sesi sama sekali.
+"""
+import secrets
+import threading
+from collections import OrderedDict
+
+from flask.sessions import SecureCookieSessionInterface, SessionMixin
+from itsdangerous import BadSignature
+
+# satu-satunya kunci yang disimpan; kunci lain hanya hidup selama request
+SESSION_KEYS = ('theme', 'mode', 'package', 'user_id', 'client_id')
+
+
+class MemoryStore:
+    """Penyimpanan sesi di memori proses, dibatasi max_entries (LRU)"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            data = self._data.get(sid)
+            if data is not None:
+                self._data.move_to_end(sid)
+            return dict(data) if data is not None else None
+
+    def set(self, sid, data):
+        with self._lock:
+            self._data[sid] = dict(data)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PreferenceSession(SessionMixin):
+    """Sesi yang baru memuat isinya saat pertama kali diakses"""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._data = None
+        self._original = None
+        self.sid = None
+        self.modified = False
+        self.accessed = False
+
+    def _load(self):
+        self.accessed = True
+        if self._data is None:
+            self.sid, data = self._loader()
+            self._data = data
+            self._original = dict(data)
+        return self._data
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def saved_data(self):
+        return {k: self._data[k] for k in SESSION_KEYS if k in self._data}
+
+    @property
+    def changed(self):
+        if self._data is None:
+            return False
+        original = {k: self._original[k] for k in SESSION_KEYS if k in self._original}
+        return self.saved_data() != original
+
+
+class PreferenceSessionInterface(SecureCookieSessionInterface):
+    def __init__(self, store=None):
+        self.store = store
+
+    def open_session(self, app, request):
+        serializer = self.get_signing_serializer(app)
+        if serializer is None:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        max_age = int(app.permanent_session_lifetime.total_seconds())
+
+        def load():
+            if not cookie:
+                return None, {}
+            try:
+                data = serializer.loads(cookie, max_age=max_age)
+            except BadSignature:
+                return None, {}
+            if self.store is None:
+                return None, data
+            sid = data.get('sid')
+            stored = self.store.get(sid) if sid else None
+            return (sid, stored) if stored is not None else (None, {})
+
+        return PreferenceSession(load)
+
+    def save_session(self, app, session, response):
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.changed:
+            return
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        data = session.saved_data()
+        if not data:
+            if self.store is not None and session.sid:
+                self.store.delete(session.sid)
+            response.delete_cookie(name, domain=domain, path=path,
+                                   secure=self.get_cookie_secure(app),
+                                   samesite=self.get_cookie_samesite(app),
+                                   httponly=self.get_cookie_httponly(app))
+            return
+        if self.store is not None:
+            sid = session.sid or secrets.token_urlsafe(24)
+            self.store.set(sid, data)
+            if sid == session.sid:
+                return  # cookie id sesi tidak berubah
+            data = {'sid': sid}
+        value = self.get_signing_serializer(app).dumps(data)
+        response.set_cookie(name, value,
+                            expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path,
+                            secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+
+
+def create_interface(config, store=None):
+    """Interface sesi sesuai config.SESSION_TYPE ('cookie' atau 'memory');
+    store menggantikan MemoryStore, mis. dengan backend bersama"""
+    if config.SESSION_TYPE == 'memory':
+        if store is None:
+            store = MemoryStore(getattr(config, 'SESSION_MAX_ENTRIES', 10000))
+        return PreferenceSessionInterface(store)
+    if config.SESSION_TYPE != 'cookie':
+        raise ValueError(f"SESSION_TYPE tidak dikenal: {config.SESSION_TYPE}")
+    return PreferenceSessionInterface()
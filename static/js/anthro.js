@@ -0,0 +1,183 @@
+/*
+ * anthroGizi - perhitungan Z-score WHO di browser (offline)
+ *
+ * Port dari pygrowup Calculator.zscore_for_measurement, memakai bundle
+ * tabel yang diekspor oleh `python -m pygrowup.export static/data`.
+ * Paritas dengan versi Python diuji terhadap survey_z_rc.csv
+ * (pygrowup/tests.py: test_js_parity).
+ */
+(function (root, factory) {
+    if (typeof module === 'object' && module.exports) {
+        module.exports = factory();
+    } else {
+        root.AnthroZ = factory();
+    }
+}(typeof self !== 'undefined' ? self : this, function () {
+    'use strict';
+
+    var BUNDLE_FORMAT = 1;
+    var STORAGE_KEY = 'anthrogizi-tables';
+
+    // Batas WHO untuk nilai yang tidak masuk akal (flag)
+    var FLAG_LIMITS = {
+        lhfa: [-6, 6], wfa: [-6, 5], wfl: [-5, 5],
+        wfh: [-5, 5], bmifa: [-5, 5], hcfa: [-5, 5]
+    };
+
+    function isBlank(value) {
+        return value === null || value === undefined ||
+            (typeof value === 'string' && value.trim() === '') ||
+            (typeof value === 'number' && isNaN(value));
+    }
+
+    function normalizeSex(sex) {
+        var s = String(sex).trim().toLowerCase();
+        if (s.charAt(0) === 'm' || s === '1') return 'boys';
+        if (s.charAt(0) === 'f' || s === '2') return 'girls';
+        return null;
+    }
+
+    // Pembulatan ke 2 desimal, half-even seperti Decimal.quantize
+    function round2(z) {
+        var v = z * 100;
+        var r = Math.round(v);
+        if (Math.abs(v % 1) === 0.5) {
+            r = 2 * Math.round(v / 2);
+        }
+        return r / 100;
+    }
+
+    function lookup(table, index) {
+        var i = index - table.offset;
+        if (i < 0 || i >= table.M.length || table.M[i] === null) return null;
+        return [table.L[i], table.M[i], table.S[i]];
+    }
+
+    // Pilih tabel seperti Observation.resolve_table; null jika tidak valid
+    function resolveTable(indicator, age, weeks, height, american) {
+        if (indicator === 'wfl' || indicator === 'wfh') {
+            if (height < 45 || height > 120) return null;
+            var standing = indicator === 'wfl' ? height > 86 : !(height < 65);
+            return {
+                name: standing ? 'wfh' : 'wfl',
+                age: standing ? '2_5' : '0_2',
+                // tinggi dibulatkan ke setengah sentimeter terdekat
+                index: Math.floor(height * 2 + 0.5)
+            };
+        }
+        var tableAge;
+        if (indicator === 'bmifa') {
+            if (age > 240) return null;
+            if (age <= 3 && weeks <= 13) tableAge = '0_13';
+            else if (age < 24) tableAge = '0_2';
+            else if (age <= 60) tableAge = '2_5';
+            else tableAge = '2_20';
+        } else {
+            tableAge = (age <= 3 && weeks <= 13) ? '0_13' : '0_5';
+            if (american && age >= 24) {
+                if (indicator === 'hcfa') return null;
+                tableAge = '2_20';
+            }
+        }
+        return {
+            name: indicator,
+            age: tableAge,
+            index: Math.floor(weeks <= 13 ? weeks : age)
+        };
+    }
+
+    /*
+     * Hitung Z-score. options: {includeCdc, adjustHeightData,
+     * adjustWeightScores} seperti parameter Calculator.
+     * Mengembalikan null jika data tidak valid / di luar tabel.
+     */
+    function zscore(bundle, indicator, measurement, ageInMonths, sex, height, options) {
+        options = options || {};
+        indicator = String(indicator).toLowerCase();
+        if (isBlank(measurement) || isBlank(ageInMonths)) return null;
+        var tableSex = normalizeSex(sex);
+        if (!tableSex) return null;
+        var y = Number(measurement);
+        var age = Number(ageInMonths);
+        if (!(y > 0)) return null;
+        var isWeightForHeight = indicator === 'wfl' || indicator === 'wfh';
+        if (isWeightForHeight && isBlank(height)) return null;
+        var h = isBlank(height) ? null : Number(height);
+
+        if (indicator === 'wfl' && y > 65.7 && y < 120.7) y = y - 0.7;
+        if (indicator === 'wfh' && options.adjustHeightData) y = y + 0.7;
+
+        var weeks = (age * 30.4374) / 7;
+        var resolved = resolveTable(indicator, age, weeks, h, options.includeCdc);
+        if (!resolved) return null;
+        var table = bundle.tables[resolved.name + '_' + tableSex + '_' + resolved.age];
+        if (!table) return null;
+        var lms = lookup(table, resolved.index);
+        if (!lms) return null;
+        var L = lms[0], M = lms[1], S = lms[2];
+
+        var z = (Math.pow(y / M, L) - 1) / (S * L);
+        if (options.adjustWeightScores &&
+                (indicator === 'wfl' || indicator === 'wfh' || indicator === 'wfa')) {
+            var sd = function (k) { return M * Math.pow(1 + L * S * k, 1 / L); };
+            if (z > 3) {
+                z = 3 + (y - sd(3)) / (sd(3) - sd(2));
+            } else if (z < -3) {
+                z = -3 + (y - sd(-3)) / (sd(-2) - sd(-3));
+            }
+        }
+        return round2(z);
+    }
+
+    function flag(indicator, z) {
+        var limits = FLAG_LIMITS[indicator];
+        return z !== null && (z < limits[0] || z > limits[1]) ? 1 : 0;
+    }
+
+    function checkBundle(bundle) {
+        if (!bundle || bundle.format !== BUNDLE_FORMAT) {
+            throw new Error('Format bundle tabel tidak didukung');
+        }
+        return bundle;
+    }
+
+    /*
+     * Muat bundle dari server; simpan di localStorage agar tetap bisa
+     * dipakai saat tidak ada koneksi (mis. di posyandu). Nama file bundle
+     * memuat hash isinya, jadi bundle yang tersimpan dari URL yang sama
+     * dipakai langsung tanpa diunduh ulang.
+     */
+    function load(url) {
+        var stored = null;
+        try {
+            stored = JSON.parse(window.localStorage.getItem(STORAGE_KEY));
+        } catch (e) {
+            stored = null;
+        }
+        if (stored && stored.url === url && stored.bundle) {
+            return Promise.resolve(stored.bundle).then(checkBundle);
+        }
+        return fetch(url).then(function (response) {
+            if (!response.ok) throw new Error(response.statusText);
+            return response.json();
+        }).then(function (bundle) {
+            checkBundle(bundle);
+            try {
+                window.localStorage.setItem(STORAGE_KEY,
+                    JSON.stringify({url: url, bundle: bundle}));
+            } catch (e) { /* penyimpanan penuh: tetap lanjut */ }
+            return bundle;
+        }).catch(function (err) {
+            if (stored && stored.bundle) return checkBundle(stored.bundle);
+            throw err;
+        });
+    }
+
+    return {
+        BUNDLE_FORMAT: BUNDLE_FORMAT,
+        FLAG_LIMITS: FLAG_LIMITS,
+        zscore: zscore,
+        flag: flag,
+        load: load
+    };
+}));
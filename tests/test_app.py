@@ -0,0 +1,42 @@
+import app
+
+
+def test_missing_sex_is_rejected(monkeypatch):
+    monkeypatch.setattr(app, 'QUOTA_ENABLED', False)
+    client = app.app.test_client()
+    child = {'age_months': 12, 'weight': 9.5, 'height': 75}
+    for body in (child, dict(child, gender='X')):
+        response = client.post('/api/calculate-all', json=body)
+        assert response.status_code == 400
+    response = client.post('/api/calculate-all', json=dict(child, gender='f'),
+                           query_string={'fields': 'results'})
+    assert response.status_code == 200
+    assert set(response.get_json()['results']) == {'wfa', 'hfa'}
+
+    children = [{'age_months': 12, 'gender': 'M', 'results': {}},
+                {'age_months': 12, 'results': {}}]
+    response = client.post('/api/export-jobs', json={'children': children})
+    assert response.status_code == 400
+    assert 'ke-2' in response.get_json()['error']
+
+
+def test_metrics_access(monkeypatch):
+    client = app.app.test_client()
+    local = {'REMOTE_ADDR': '127.0.0.1'}
+    remote = {'REMOTE_ADDR': '203.0.113.5'}
+    monkeypatch.setattr(app.Config, 'METRICS_TOKEN', None)
+    assert client.get('/metrics', environ_base=local).status_code == 200
+    response = client.get('/metrics', environ_base=remote)
+    assert response.status_code == 401 and b'anthrogizi_' not in response.data
+
+    # with a token, only a matching bearer header is accepted, from anywhere
+    monkeypatch.setattr(app.Config, 'METRICS_TOKEN', 's3cret')
+    assert client.get('/metrics', environ_base=local).status_code == 401
+    for header in ('Bearer wrong', 's3cret', 'Basic s3cret'):
+        response = client.get('/metrics', environ_base=remote,
+                              headers={'Authorization': header})
+        assert response.status_code == 401
+    response = client.get('/metrics', environ_base=remote,
+                          headers={'Authorization': 'Bearer s3cret'})
+    assert response.status_code == 200
+    assert b'anthrogizi_requests_total' in response.data
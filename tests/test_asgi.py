@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import app
+import asgi
+
+
+def _request(method, path, chunks=(b'',), headers=()):
+    """Jalankan satu request lewat asgi.application; kembalikan
+    (status, headers, body, jumlah potongan body yang sudah dibaca saat
+    respons mulai dikirim)"""
+    scope = {'type': 'http', 'method': method, 'path': path,
+             'query_string': b'', 'headers': list(headers)}
+    messages = [{'type': 'http.request', 'body': chunk,
+                 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    received = []
+    sent = []
+    started = {}
+
+    async def receive():
+        if len(received) < len(messages):
+            received.append(messages[len(received)])
+            return received[-1]
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            started['received'] = len(received)
+        sent.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    start = sent[0]
+    body = b''.join(m.get('body', b'') for m in sent[1:])
+    return start['status'], dict(start['headers']), body, started['received']
+
+
+def test_inline_request():
+    status, headers, body, _ = _request(
+        'POST', '/api/easy-mode', [b'{"age_months": ', b'12}'],
+        [(b'content-type', b'application/json')])
+    assert status == 200
+    assert json.loads(body)['age_display'] == '12.0 Bulan'
+
+
+def test_streamed_csv_upload(monkeypatch):
+    # exports are not part of the free package
+    monkeypatch.setattr(app, 'QUOTA_ENABLED', False)
+    # 2000 rows in 100 messages; the export writes 500 rows per chunk
+    rows = [f'a{i},F,2024-01-01,2025-01-01,9.5,75\r\n' for i in range(2000)]
+    chunks = [''.join(rows[i:i + 20]).encode('ascii') for i in range(0, 2000, 20)]
+    chunks[0] = b'child_id,sex,dob,date,weight,height\r\n' + chunks[0]
+    status, headers, body, received = _request(
+        'POST', '/api/export/csv', chunks, [(b'content-type', b'text/csv')])
+    assert status == 200
+    lines = body.decode('utf-8-sig').splitlines()
+    assert len(lines) == 2001 and lines[1].startswith('a0,F,')
+    # the response starts before the whole body has been received
+    assert received < len(chunks)
+
+
+def test_environ_joins_cookie_headers():
+    environ = asgi.build_environ({
+        'type': 'http', 'method': 'GET', 'path': '/', 'headers': [
+            (b'cookie', b'a=1'), (b'cookie', b'b=2'),
+            (b'accept', b'text/html'), (b'accept', b'*/*'),
+            (b'content-length', b'5')]})
+    assert environ['HTTP_COOKIE'] == 'a=1; b=2'
+    assert environ['HTTP_ACCEPT'] == 'text/html,*/*'
+    assert environ['CONTENT_LENGTH'] == '5'
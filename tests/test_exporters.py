@@ -0,0 +1,24 @@
+import csv
+import io
+import zipfile
+
+import exporters
+
+
+def _csv(rows, chunk_rows=2):
+    data = b''.join(exporters.iter_csv(['a', 'b'], rows, chunk_rows))
+    return list(csv.reader(io.StringIO(data.decode('utf-8-sig'))))
+
+
+def test_csv_escapes_formulas():
+    rows = _csv([['=HYPERLINK("x")', '+1+1'], ['@SUM(A1)', '-2+3'],
+                 ['-1.5', None], ['\tcmd', 4.2]])
+    assert rows == [['a', 'b'], ["'=HYPERLINK(\"x\")", "'+1+1"],
+                    ["'@SUM(A1)", "'-2+3"], ['-1.5', ''], ["'\tcmd", '4.2']]
+
+
+def test_xlsx_stream():
+    data = b''.join(exporters.iter_xlsx(['a'], ([i] for i in range(5)), 'S',
+                                        chunk_rows=2))
+    sheet = zipfile.ZipFile(io.BytesIO(data)).read('xl/worksheets/sheet1.xml')
+    assert sheet.count(b'<row') == 6
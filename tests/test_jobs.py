@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+from jobs import JobQueue
+
+
+def _wait(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.status in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_job_lifecycle():
+    queue = JobQueue(workers=1)
+    try:
+        def work(job, path):
+            with open(path, 'w') as f:
+                f.write('ok')
+            job.advance(2)
+
+        job = queue.submit(work, total=2, suffix='.txt')
+        _wait(job)
+        assert job.status == 'done'
+        assert job.as_dict()['progress'] == {'done': 2, 'total': 2}
+        assert open(job.path).read() == 'ok'
+        assert queue.get(job.id) is job
+
+        def fail(job, path):
+            open(path, 'w').close()
+            raise ValueError('gagal')
+
+        job = queue.submit(fail, total=1)
+        _wait(job)
+        assert job.status == 'failed' and job.error == 'gagal'
+        assert not os.path.exists(job.path)
+    finally:
+        queue.shutdown()
+
+
+def test_job_queue_limit_and_prune():
+    release = threading.Event()
+    queue = JobQueue(workers=1, max_pending=2, ttl=0)
+    try:
+        first = queue.submit(lambda job, path: release.wait(5), total=1)
+        second = queue.submit(lambda job, path: None, total=1)
+        assert queue.pending() == 2
+        assert queue.submit(lambda job, path: None, total=1) is None
+        release.set()
+        _wait(first)
+        _wait(second)
+        assert queue.pending() == 0
+        time.sleep(0.01)
+        queue.prune()
+        assert queue.get(first.id) is None
+    finally:
+        release.set()
+        queue.shutdown()
+
+
+def test_job_pending_while_submitting():
+    # pending() is read by the metrics gauge from other threads
+    queue = JobQueue(workers=4, max_pending=10000)
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            try:
+                queue.pending()
+            except RuntimeError as e:
+                errors.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for _ in range(2000):
+            queue.submit(lambda job, path: None, total=1)
+    finally:
+        stop.set()
+        reader.join()
+        queue.shutdown()
+    assert not errors
+
+
+def test_job_progress_from_threads():
+    queue = JobQueue(workers=1)
+    try:
+        def work(job, path):
+            threads = [threading.Thread(target=lambda: [job.advance()
+                                                        for _ in range(1000)])
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        job = queue.submit(work, total=8000)
+        _wait(job)
+        # status is set last: a finished job has its final progress
+        status = job.as_dict()
+        assert status['status'] == 'done'
+        assert status['progress'] == {'done': 8000, 'total': 8000}
+        assert job.finished is not None
+    finally:
+        queue.shutdown()
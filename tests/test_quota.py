@@ -0,0 +1,165 @@
+import os
+import shutil
+import tempfile
+
+import quota
+
+DAY = quota.DAY
+
+PACKAGES = {
+    'free': {'limits': {'daily_calculations': 2, 'consultations': 0}},
+    'silver': {'limits': {'daily_calculations': -1, 'report_exports': 10}},
+}
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_quota_deny_and_refill():
+    clock = Clock()
+    quotas = quota.QuotaManager(PACKAGES, clock=clock)
+    first = quotas.check('a', 'free', 'daily_calculations')
+    assert first.allowed and first.limit == 2 and first.remaining == 1
+    assert quotas.check('a', 'free', 'daily_calculations').allowed
+    denied = quotas.check('a', 'free', 'daily_calculations')
+    assert not denied.allowed and denied.remaining == 0
+    # one token comes back every half day
+    assert abs(denied.retry_after - DAY / 2) < 1e-6
+    # other users have their own bucket
+    assert quotas.check('b', 'free', 'daily_calculations').allowed
+
+    clock.now += DAY / 2
+    assert quotas.check('a', 'free', 'daily_calculations').allowed
+    assert not quotas.check('a', 'free', 'daily_calculations').allowed
+    clock.now += 10 * DAY
+    assert quotas.check('a', 'free', 'daily_calculations').remaining == 1
+
+
+def test_quota_missing_limits():
+    quotas = quota.QuotaManager(PACKAGES)
+    assert quotas.check('a', 'silver', 'daily_calculations') is quota.UNLIMITED
+    # a limit the package does not mention is denied, like an explicit 0
+    for package, name in (('free', 'report_exports'),
+                          ('free', 'consultations'),
+                          ('silver', 'consultations'),
+                          ('platinum', 'daily_calculations')):
+        decision = quotas.check('a', package, name)
+        assert not decision.allowed and decision.retry_after is None
+
+
+def test_quota_prune_without_backend():
+    clock = Clock()
+    quotas = quota.QuotaManager(PACKAGES, max_keys=10, clock=clock)
+    for i in range(10):
+        quotas.check(i, 'free', 'daily_calculations')
+    # refilled buckets are pruned once the registry passes max_keys
+    clock.now += DAY
+    quotas.check('new', 'free', 'daily_calculations')
+    assert len(quotas._buckets) == 1
+    assert quotas.flush() == 0
+
+    # buckets still in use are kept, and not scanned on every check
+    for i in range(30):
+        quotas.check(i, 'free', 'daily_calculations')
+    assert len(quotas._buckets) == 31
+    assert quotas._prune_at >= 2 * 11
+
+
+def test_quota_flush_shares_usage():
+    clock = Clock()
+    backend = quota.MemoryBackend()
+    workers = [quota.QuotaManager(PACKAGES, backend=backend, sync_interval=0,
+                                  clock=clock) for _ in range(2)]
+    assert workers[0].check('a', 'free', 'daily_calculations').allowed
+    assert workers[1].check('a', 'free', 'daily_calculations').allowed
+    assert workers[0].flush() == 1 and workers[1].flush() == 1
+    # after the next sync, each worker sees the usage of the other
+    workers[0].flush()
+    assert not workers[0].check('a', 'free', 'daily_calculations').allowed
+    assert all(b.pending == 0 for b in workers[1]._buckets.values())
+
+
+def test_quota_sqlite_backend_persists():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'quota.db')
+        clock = Clock()
+        quotas = quota.QuotaManager(PACKAGES, backend=quota.SQLiteBackend(path),
+                                    sync_interval=0, clock=clock)
+        quotas.check('a', 'free', 'daily_calculations')
+        quotas.check('a', 'free', 'daily_calculations')
+        quotas.close()
+
+        # a restarted process starts from the stored usage
+        restarted = quota.QuotaManager(PACKAGES, backend=quota.SQLiteBackend(path),
+                                       sync_interval=0, clock=clock)
+        assert not restarted.check('a', 'free', 'daily_calculations').allowed
+        clock.now += DAY
+        assert restarted.check('a', 'free', 'daily_calculations').allowed
+        restarted.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+class BrokenBackend:
+    def sync(self, key, consumed, capacity, rate, now):
+        raise OSError('database is locked')
+
+    peek = sync
+
+    def purge(self, now):
+        raise OSError('database is locked')
+
+
+def test_quota_backend_errors_fall_back_to_memory():
+    quotas = quota.QuotaManager(PACKAGES, backend=BrokenBackend(), sync_interval=0)
+    assert quotas.check('a', 'free', 'daily_calculations').allowed
+    assert quotas.check('a', 'free', 'daily_calculations').allowed
+    assert not quotas.check('a', 'free', 'daily_calculations').allowed
+    # usage that could not be sent is kept for the next sync
+    assert quotas.flush() == 1
+    assert quotas._buckets[('a', 'free', 'daily_calculations')].pending == 2
+
+
+def test_quota_sqlite_backend_purges_full_buckets():
+    directory = tempfile.mkdtemp()
+    try:
+        backend = quota.SQLiteBackend(os.path.join(directory, 'quota.db'))
+        clock = Clock()
+        quotas = quota.QuotaManager(PACKAGES, backend=backend, sync_interval=0,
+                                    clock=clock)
+        rows = 'SELECT COUNT(*) FROM quota_buckets'
+        # reading a new bucket writes nothing
+        quotas.check('a', 'free', 'consultations')
+        for user in range(20):
+            quotas.check(user, 'free', 'daily_calculations')
+        assert backend._connect().execute(rows).fetchone()[0] == 0
+        quotas.flush()
+        assert backend._connect().execute(rows).fetchone()[0] == 20
+        # refilled buckets are deleted, also those no process holds any more
+        clock.now += DAY
+        quota.QuotaManager(PACKAGES, backend=backend, sync_interval=0,
+                           clock=clock).flush()
+        assert backend._connect().execute(rows).fetchone()[0] == 0
+        quotas.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_quota_cookieless_clients_share_a_bucket():
+    import app
+    client = app.app.test_client(use_cookies=False)
+    limit = app.Config.PREMIUM_PACKAGES['free']['limits']['daily_calculations']
+    statuses = [client.post('/api/calculate-all', json={},
+                            environ_base={'REMOTE_ADDR': '10.1.2.3'}).status_code
+                for _ in range(limit + 1)]
+    assert 429 not in statuses[:limit] and statuses[limit] == 429
+    # another address has its own bucket
+    response = client.post('/api/calculate-all', json={},
+                           environ_base={'REMOTE_ADDR': '10.1.2.4'})
+    assert response.status_code != 429
@@ -0,0 +1,109 @@
+from flask import Flask, jsonify, session
+
+import sessions
+
+
+class _Config:
+    SESSION_TYPE = 'cookie'
+    SESSION_MAX_ENTRIES = 2
+
+
+def _app(session_type='cookie', secret='rahasia', store=None):
+    config = _Config()
+    config.SESSION_TYPE = session_type
+    app = Flask(__name__)
+    app.secret_key = secret
+    app.session_interface = sessions.create_interface(config, store)
+
+    @app.route('/plain')
+    def plain():
+        return 'ok'
+
+    @app.route('/get')
+    def get():
+        return jsonify(dict(session))
+
+    @app.route('/set/<key>/<value>')
+    def set_value(key, value):
+        session[key] = value
+        return 'ok'
+
+    @app.route('/clear')
+    def clear():
+        session.clear()
+        return 'ok'
+
+    return app
+
+
+def _set_cookies(response):
+    return response.headers.getlist('Set-Cookie')
+
+
+def test_cookie_session_roundtrip():
+    client = _app().test_client()
+    response = client.get('/plain')
+    assert not _set_cookies(response)
+    assert 'Cookie' not in response.vary
+
+    response = client.get('/set/theme/blue_pastel')
+    assert len(_set_cookies(response)) == 1
+    assert client.get('/get').json == {'theme': 'blue_pastel'}
+    assert 'Cookie' in client.get('/get').vary
+
+    # same value: nothing to write
+    assert not _set_cookies(client.get('/set/theme/blue_pastel'))
+    # keys outside SESSION_KEYS live only for the request
+    assert not _set_cookies(client.get('/set/scratch/x'))
+    assert client.get('/get').json == {'theme': 'blue_pastel'}
+
+    response = client.get('/clear')
+    assert 'session=;' in _set_cookies(response)[0]
+    assert client.get('/get').json == {}
+
+
+def test_cookie_session_rejects_forged_cookie():
+    forger = _app(secret='kunci-lain').test_client()
+    forger.get('/set/package/gold')
+    cookie = forger.get_cookie('session')
+
+    client = _app().test_client()
+    client.set_cookie('session', cookie.value)
+    assert client.get('/get').json == {}
+
+
+def test_memory_session_store():
+    store = sessions.MemoryStore(max_entries=2)
+    app = _app('memory', store=store)
+    client = app.test_client()
+    client.get('/set/mode/kader')
+    assert len(store) == 1
+    # the cookie holds only the signed session id
+    assert 'kader' not in client.get_cookie('session').value
+    assert client.get('/get').json == {'mode': 'kader'}
+    # changing an existing session keeps its cookie
+    assert not _set_cookies(client.get('/set/mode/parent'))
+    assert client.get('/get').json == {'mode': 'parent'}
+
+    # least recently used sessions are dropped past max_entries
+    for _ in range(2):
+        app.test_client().get('/set/mode/kader')
+    assert len(store) == 2
+    assert client.get('/get').json == {}
+
+    # clearing a session deletes it from the store
+    other = app.test_client()
+    other.get('/set/theme/blue_pastel')
+    other.get('/clear')
+    assert len(store) == 1
+
+
+def test_create_interface_rejects_unknown_type():
+    config = _Config()
+    config.SESSION_TYPE = 'filesystem'
+    try:
+        sessions.create_interface(config)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('SESSION_TYPE filesystem accepted')